@@ -0,0 +1,161 @@
+"""
+Semantic answer cache for the Shadow OS query pipeline.
+
+Answers are keyed on the question embedding the pipeline already computes.
+A lookup is a single matrix-vector product against a fixed-capacity slot
+matrix, so a hit costs well under a millisecond and skips both retrieval
+and the LLM call.
+
+Entries are evicted LRU-first when the entry or memory cap is reached and
+expire after a TTL; expired entries are swept on every lookup and store.
+Any change to the collection must call ``invalidate()``, which bumps the
+cache version and drops every entry.
+"""
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """LRU/TTL cache of answers keyed by cosine similarity of question vectors."""
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600.0,
+        max_bytes: int = 32 * 1024 * 1024,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None   # (max_entries, dim), unit rows
+        self._occupied = np.zeros(max_entries, dtype=bool)
+        self._stored_at = np.zeros(max_entries, dtype=np.float64)
+        self._free = list(range(max_entries - 1, -1, -1))
+        # slot -> (stored_at, size_bytes, payload); order is LRU -> MRU.
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._bytes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, vector) -> Optional[dict]:
+        """Return the cached payload for the closest question above threshold."""
+        if not self.enabled:
+            return None
+
+        query = _unit(vector)
+        with self._lock:
+            self._evict_expired()
+            if self._matrix is None or not self._entries or len(query) != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+
+            scores = self._matrix @ query
+            scores[~self._occupied] = -1.0
+            slot = int(np.argmax(scores))
+            _, _, payload = self._entries[slot]
+
+            if scores[slot] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            return payload
+
+    def store(self, vector, payload: dict, version: int) -> None:
+        """
+        Cache ``payload`` for ``vector``. ``version`` must be the cache version
+        read before the answer was computed; stale answers are discarded.
+        """
+        if not self.enabled:
+            return
+
+        query = _unit(vector)
+        size = query.nbytes + _payload_size(payload)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if version != self.version:
+                return
+            if self._matrix is None or len(query) != self._matrix.shape[1]:
+                self._reset(len(query))
+            self._evict_expired()
+
+            while self._entries and (not self._free or self._bytes + size > self.max_bytes):
+                self._evict(next(iter(self._entries)))
+
+            slot = self._free.pop()
+            stored_at = time.monotonic()
+            self._matrix[slot] = query
+            self._occupied[slot] = True
+            self._stored_at[slot] = stored_at
+            self._entries[slot] = (stored_at, size, payload)
+            self._bytes += size
+
+    def invalidate(self) -> None:
+        """Drop every entry and bump the version (call after the collection changes)."""
+        with self._lock:
+            self.version += 1
+            self._reset(self._matrix.shape[1] if self._matrix is not None else 0)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "version": self.version,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _evict(self, slot: int) -> None:
+        _, size, _ = self._entries.pop(slot)
+        self._occupied[slot] = False
+        self._free.append(slot)
+        self._bytes -= size
+        self.evictions += 1
+
+    def _evict_expired(self) -> None:
+        """Free every slot older than the TTL, not just the one a lookup lands on."""
+        expired = self._occupied & (self._stored_at < time.monotonic() - self.ttl_seconds)
+        for slot in np.flatnonzero(expired):
+            self._evict(int(slot))
+
+    def _reset(self, dim: int) -> None:
+        self._matrix = np.zeros((self.max_entries, dim), dtype=np.float32) if dim else None
+        self._occupied[:] = False
+        self._free = list(range(self.max_entries - 1, -1, -1))
+        self._entries.clear()
+        self._bytes = 0
+
+
+def _unit(vector) -> np.ndarray:
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    return arr / norm if norm else arr
+
+
+def _payload_size(payload: dict) -> int:
+    # Serialized size counts nested lists (g2_pages, sources) and their strings,
+    # which sys.getsizeof on the containers would miss.
+    return len(json.dumps(payload, default=str).encode("utf-8"))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Embedding backend parity check and throughput report for Shadow OS.
+
+Encodes the same sample corpus with the torch reference model and with a
+candidate backend (onnx / onnx-int8), then reports:
+1. Cosine similarity between reference and candidate vectors (min / mean)
+2. Top-k retrieval agreement on a set of sample queries
+3. Throughput in chunks/second for both backends
+
+Exits non-zero when mean cosine falls below --min-cosine, so it can gate a
+switch of EMBEDDING_BACKEND.
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from embedding_backends import EmbeddingSettings, build_embeddings
+
+ICD10_DATA_PATH = Path(__file__).parent.parent / "data" / "icd10_database.txt"
+
+FALLBACK_SAMPLES = [
+    "Type 2 diabetes mellitus without complications",
+    "Pneumonia, unspecified organism",
+    "The G2 glasses receive text over Bluetooth Low Energy using command 0x4E.",
+    "Acute myocardial infarction of the anterior wall",
+    "Essential (primary) hypertension",
+    "Fracture of the left radius, initial encounter",
+    "Major depressive disorder, single episode, moderate",
+    "Chronic obstructive pulmonary disease with acute exacerbation",
+]
+SAMPLE_QUERIES = [
+    "ICD code for pneumonia",
+    "diabetes without complications",
+    "heart attack",
+    "G2 protocol",
+    "high blood pressure",
+]
+
+
+def load_samples(limit: int) -> list:
+    """Sample chunks from the ICD-10 database if present, else built-in sentences."""
+    if ICD10_DATA_PATH.exists():
+        from ingest_icd10_optimized import parse_icd10_codes, create_optimized_chunks
+
+        chunks = create_optimized_chunks(parse_icd10_codes(ICD10_DATA_PATH.read_text(encoding="utf-8")))
+        if chunks:
+            step = max(1, len(chunks) // limit)
+            return chunks[::step][:limit]
+    return (FALLBACK_SAMPLES * (limit // len(FALLBACK_SAMPLES) + 1))[:limit]
+
+
+def timed_encode(embedder, texts: list) -> tuple:
+    embedder.embed_documents(texts[:8])  # warm-up: session init, first-call allocations
+    start = time.perf_counter()
+    vectors = np.asarray(embedder.embed_documents(texts), dtype=np.float32)
+    return vectors, len(texts) / (time.perf_counter() - start)
+
+
+def unit_rows(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an embedding backend against the torch reference.")
+    parser.add_argument("--backend", default=None, help="Candidate backend (default: EMBEDDING_BACKEND or onnx-int8).")
+    parser.add_argument("--samples", type=int, default=512, help="Chunks to encode.")
+    parser.add_argument("--top-k", type=int, default=3, help="Retrieval depth for agreement check.")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Fail below this mean cosine.")
+    args = parser.parse_args()
+
+    config = EmbeddingSettings()
+    candidate = args.backend or (config.embedding_backend if config.embedding_backend != "torch" else "onnx-int8")
+
+    print("\n" + "=" * 60)
+    print("SHADOW OS - EMBEDDING BACKEND PARITY CHECK")
+    print("=" * 60)
+    print(f"  Model: {config.embedding_model_name}")
+    print(f"  Reference: torch | Candidate: {candidate}")
+
+    texts = load_samples(args.samples)
+    print(f"  Samples: {len(texts)} chunks\n")
+
+    reference = build_embeddings(config, backend="torch")
+    ref_vectors, ref_rate = timed_encode(reference, texts)
+    print(f"[+] torch:     {ref_rate:,.0f} chunks/second")
+
+    candidate_model = build_embeddings(config, backend=candidate)
+    cand_vectors, cand_rate = timed_encode(candidate_model, texts)
+    print(f"[+] {candidate + ':':10} {cand_rate:,.0f} chunks/second ({cand_rate / ref_rate:.1f}x)")
+
+    cosines = np.sum(unit_rows(ref_vectors) * unit_rows(cand_vectors), axis=1)
+    print(f"\n[+] Cosine vs reference: min {cosines.min():.4f} | mean {cosines.mean():.4f}")
+
+    # Do both backends retrieve the same top-k chunks for typical queries?
+    agreement = []
+    for query in SAMPLE_QUERIES:
+        ref_q = np.asarray(reference.embed_query(query), dtype=np.float32)
+        cand_q = np.asarray(candidate_model.embed_query(query), dtype=np.float32)
+        ref_top = set(np.argsort(-(unit_rows(ref_vectors) @ ref_q))[:args.top_k])
+        cand_top = set(np.argsort(-(unit_rows(cand_vectors) @ cand_q))[:args.top_k])
+        agreement.append(len(ref_top & cand_top) / args.top_k)
+    print(f"[+] Top-{args.top_k} retrieval agreement: {np.mean(agreement) * 100:.0f}%")
+
+    print("\n" + "=" * 60)
+    if cosines.mean() < args.min_cosine:
+        print(f"[!] FAIL: mean cosine {cosines.mean():.4f} < {args.min_cosine}")
+        print("=" * 60)
+        return False
+    print(f"[+] PASS: {candidate} is within parity; set EMBEDDING_BACKEND={candidate} in backend/.env")
+    print("=" * 60)
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
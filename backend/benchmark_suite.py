@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Offline component benchmarks for Shadow OS retrieval and ingestion.
+
+Generates synthetic corpora and measures each stage on its own, with a stub
+LLM so no API quota is spent:
+1. Parse / chunk throughput: parse_icd10_codes + create_optimized_chunks for
+   the ICD-10 corpus, the /ingest/ text splitter for the prose corpus
+2. Embedding throughput on a sample of the chunks
+3. Chroma insert rate and BM25 index build time
+4. Query latency p50/p95/p99 through the real /query/ pipeline
+   (embedding, answer cache, hybrid retrieval, prompt build, stub LLM)
+
+Results are written as JSON, named after the current commit, so runs can be
+diffed between commits:
+
+    python backend/benchmark_suite.py --sizes 1000,10000
+    python backend/benchmark_suite.py --compare data/benchmarks/<old>.json
+
+``--embedder hash`` swaps the model for a deterministic hashing embedder so
+the suite also runs where no model weights are available (e.g. CI). Only
+``--embed-sample`` chunks are embedded by the model; the rest of the corpus
+gets seeded random vectors so 500k-chunk runs finish in minutes.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import platform
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+RESULTS_DIR = Path(__file__).parent.parent / "data" / "benchmarks"
+CORPORA = ("icd10", "prose")
+INSERT_BATCH_SIZE = 500
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2
+
+# Vocabulary for synthetic text; medical terms so BM25 and the code regex see realistic tokens.
+SITES = ["left", "right", "bilateral", "upper", "lower", "anterior", "posterior", "lateral", "medial", "distal"]
+ORGANS = [
+    "femur", "radius", "ulna", "tibia", "kidney", "liver", "lung", "heart", "retina", "cornea", "colon",
+    "stomach", "pancreas", "thyroid", "bladder", "skin", "artery", "vein", "spine", "shoulder",
+]
+CONDITIONS = [
+    "fracture", "infection", "neoplasm", "stenosis", "ulcer", "hemorrhage", "abscess", "dislocation",
+    "inflammation", "obstruction", "insufficiency", "hypertrophy", "laceration", "contusion", "embolism",
+]
+QUALIFIERS = [
+    "initial encounter", "subsequent encounter", "sequela", "with complications", "without complications",
+    "unspecified", "acute", "chronic", "recurrent", "due to trauma",
+]
+PROSE_WORDS = [
+    "glasses", "display", "bluetooth", "protocol", "packet", "latency", "firmware", "battery", "sensor",
+    "waveguide", "frame", "buffer", "channel", "device", "signal", "render", "stream", "query", "context",
+    "patient", "clinic", "dosage", "symptom", "record", "procedure", "the", "a", "is", "with", "and", "of",
+    "to", "when", "each", "every", "after", "before", "uses", "sends", "receives", "stores", "shows",
+]
+
+
+# --- Synthetic corpora ---
+
+def synthetic_icd10(n_chunks: int, rng: random.Random) -> str:
+    """
+    ICD-10 text in the layout parse_icd10_codes reads. About 15 codes fill
+    one 1000-char chunk, so this yields roughly n_chunks chunks.
+    """
+    lines = []
+    codes_needed = n_chunks * 15
+    per_category = 60
+    for c in range(0, codes_needed, per_category):
+        letter = chr(ord("A") + (c // per_category) % 26)
+        category = f"{letter}{(c // per_category // 26) % 100:02d}"
+        lines.append(f"--- Category {category} ---")
+        for j in range(per_category):
+            description = (
+                f"{rng.choice(CONDITIONS).capitalize()} of {rng.choice(SITES)} "
+                f"{rng.choice(ORGANS)}, {rng.choice(QUALIFIERS)}"
+            )
+            lines.append(f"Code: {category}.{j:02d}{rng.randrange(10)}")
+            lines.append(f"Description: {description}")
+    return "\n".join(lines)
+
+
+def synthetic_prose(n_chunks: int, rng: random.Random) -> str:
+    """Paragraphs of filler prose; the 500-char splitter turns this into ~n_chunks chunks."""
+    paragraphs = []
+    for _ in range(n_chunks):
+        sentences = []
+        for _ in range(6):
+            words = [rng.choice(PROSE_WORDS) for _ in range(rng.randint(8, 14))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+
+def synthetic_questions(corpus: str, count: int, rng: random.Random) -> list:
+    if corpus == "icd10":
+        return [f"Which code covers {rng.choice(CONDITIONS)} of the {rng.choice(ORGANS)}, {rng.choice(QUALIFIERS)}?"
+                for _ in range(count)]
+    return [f"How does the {rng.choice(PROSE_WORDS)} {rng.choice(PROSE_WORDS)} affect {rng.choice(PROSE_WORDS)}?"
+            for _ in range(count)]
+
+
+# --- Stubs ---
+
+class HashEmbeddings(Embeddings):
+    """Deterministic feature-hashing embedder: no model weights, no network."""
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def _vector(self, text: str) -> list:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest, "little") % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    def embed_queries(self, texts):
+        return self.embed_documents(texts)
+
+
+# --- Measurements ---
+
+def percentiles(samples_ms: list) -> dict:
+    values = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def bench_chunking(corpus: str, text: str) -> tuple:
+    if corpus == "icd10":
+        from ingest_icd10_optimized import parse_icd10_codes, create_optimized_chunks
+
+        start = time.perf_counter()
+        categories = parse_icd10_codes(text)
+        parse_s = time.perf_counter() - start
+        codes = sum(len(entries) for entries in categories.values())
+
+        start = time.perf_counter()
+        chunks = create_optimized_chunks(categories)
+        chunk_s = time.perf_counter() - start
+        return chunks, {
+            "input_mb": round(len(text) / 1e6, 2),
+            "codes": codes,
+            "parse_s": round(parse_s, 4),
+            "parse_mb_per_s": round(len(text) / 1e6 / parse_s, 2),
+            "parse_codes_per_s": round(codes / parse_s),
+            "chunk_s": round(chunk_s, 4),
+            "chunks_per_s": round(len(chunks) / chunk_s),
+        }
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    # Same settings as the /ingest/ endpoint.
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, length_function=len)
+    start = time.perf_counter()
+    chunks = splitter.split_text(text)
+    chunk_s = time.perf_counter() - start
+    return chunks, {
+        "input_mb": round(len(text) / 1e6, 2),
+        "chunk_s": round(chunk_s, 4),
+        "chunk_mb_per_s": round(len(text) / 1e6 / chunk_s, 2),
+        "chunks_per_s": round(len(chunks) / chunk_s),
+    }
+
+
+def bench_embedding(embedder, chunks: list, sample: int, rng: np.random.Generator, embed_all: bool) -> tuple:
+    """Embed a sample (or everything) and pad the rest with seeded random unit vectors."""
+    count = len(chunks) if embed_all else min(sample, len(chunks))
+    embedder.embed_documents(chunks[:8])  # warm-up
+    start = time.perf_counter()
+    vectors = np.asarray(embedder.embed_documents(chunks[:count]), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+
+    padding = len(chunks) - count
+    if padding:
+        filler = rng.standard_normal((padding, vectors.shape[1])).astype(np.float32)
+        filler /= np.linalg.norm(filler, axis=1, keepdims=True)
+        vectors = np.vstack([vectors, filler])
+    return vectors, {
+        "embedded": count,
+        "synthetic_vectors": padding,
+        "chunks_per_s": round(count / elapsed, 1),
+    }
+
+
+def bench_insert(collection, lexical_index, chunks: list, vectors: np.ndarray) -> dict:
+    ids = [f"bench:{i}" for i in range(len(chunks))]
+    start = time.perf_counter()
+    for i in range(0, len(chunks), INSERT_BATCH_SIZE):
+        collection.add(
+            ids=ids[i:i + INSERT_BATCH_SIZE],
+            embeddings=vectors[i:i + INSERT_BATCH_SIZE],
+            documents=chunks[i:i + INSERT_BATCH_SIZE],
+        )
+    insert_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lexical_index.add(ids, chunks)
+    lexical_s = time.perf_counter() - start
+    return {
+        "vectors": collection.count(),
+        "insert_s": round(insert_s, 3),
+        "vectors_per_s": round(len(chunks) / insert_s),
+        "bm25_build_s": round(lexical_s, 3),
+    }
+
+
+def bench_queries(questions: list) -> dict:
+    """Run questions one at a time through the /query/ pipeline; answer cache disabled."""
+    import main as backend_app
+    from metrics import StageTimer
+
+    totals = []
+    stages = {}
+
+    async def run_all():
+        for question in questions:
+            timer = StageTimer("benchmark")
+            start = time.perf_counter()
+            await backend_app._answer_query(question, timer)
+            totals.append((time.perf_counter() - start) * 1000)
+            for stage, ms in timer.timings_ms.items():
+                stages.setdefault(stage, []).append(ms)
+
+    asyncio.run(run_all())
+    return {
+        "queries": len(questions),
+        **percentiles(totals),
+        "stages_p50_ms": {stage: round(float(np.percentile(ms, 50)), 3) for stage, ms in stages.items()},
+    }
+
+
+def run_case(corpus: str, size: int, args, embedder) -> dict:
+    import main as backend_app
+    from answer_cache import SemanticAnswerCache
+    from icd10_index import ICD10CodeIndex
+    from named_collections import LocalCollections
+    from llm_providers import FakeLLMProvider, LimitedLLM
+
+    rng = random.Random(f"{corpus}:{size}:{args.seed}")
+    np_rng = np.random.default_rng(args.seed)
+    text = synthetic_icd10(size, rng) if corpus == "icd10" else synthetic_prose(size, rng)
+
+    result = {"corpus": corpus, "target_chunks": size}
+    chunks, result["chunking"] = bench_chunking(corpus, text)
+    result["chunks"] = len(chunks)
+    vectors, result["embedding"] = bench_embedding(embedder, chunks, args.embed_sample, np_rng, args.embed_all)
+
+    with tempfile.TemporaryDirectory(prefix="shadow-bench-") as workdir:
+        collections = LocalCollections(workdir, workdir)
+        collection = collections.collection("benchmark", create=True)
+        result["insert"] = bench_insert(collection, collections.lexical("benchmark"), chunks, vectors)
+
+        # Point the real pipeline at the benchmark store.
+        backend_app.llm = LimitedLLM(FakeLLMProvider(latency_ms=args.llm_latency_ms, token_delay_ms=0))
+        backend_app.embedding_function = embedder
+        backend_app.collections = collections
+        backend_app.code_index = ICD10CodeIndex()
+        backend_app.answer_cache = SemanticAnswerCache(max_entries=0)
+        result["query"] = bench_queries(synthetic_questions(corpus, args.queries, rng))
+    return result
+
+
+# --- Reporting ---
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_case(result: dict) -> None:
+    chunking, embedding, insert, query = (result[key] for key in ("chunking", "embedding", "insert", "query"))
+    print(f"\n[{result['corpus']} | {result['chunks']:,} chunks]")
+    if "parse_codes_per_s" in chunking:
+        print(f"  Parse:     {chunking['parse_codes_per_s']:,} codes/s ({chunking['parse_mb_per_s']} MB/s)")
+    print(f"  Chunk:     {chunking['chunks_per_s']:,} chunks/s")
+    print(f"  Embed:     {embedding['chunks_per_s']:,} chunks/s ({embedding['embedded']:,} embedded)")
+    print(f"  Insert:    {insert['vectors_per_s']:,} vectors/s | BM25 build {insert['bm25_build_s']}s")
+    print(f"  Query:     p50 {query['p50_ms']} ms | p95 {query['p95_ms']} ms | p99 {query['p99_ms']} ms")
+
+
+def compare(current: dict, baseline_path: Path) -> None:
+    """Print per-metric change against an earlier run; latencies improve downward."""
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    old_cases = {(case["corpus"], case["target_chunks"]): case for case in baseline["results"]}
+    print(f"\nCOMPARED WITH {baseline.get('commit', '?')} ({baseline_path.name}):")
+    for case in current["results"]:
+        old = old_cases.get((case["corpus"], case["target_chunks"]))
+        if old is None:
+            continue
+        print(f"  [{case['corpus']} | {case['target_chunks']:,}]")
+        for section, key in (
+            ("chunking", "chunks_per_s"), ("embedding", "chunks_per_s"), ("insert", "vectors_per_s"),
+            ("query", "p50_ms"), ("query", "p95_ms"), ("query", "p99_ms"),
+        ):
+            new_value, old_value = case[section].get(key), old[section].get(key)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            better = change < 0 if key.endswith("_ms") else change > 0
+            marker = (" " if abs(change) < 5 else "+" if better else "-")
+            print(f"    {marker} {section}.{key}: {old_value} -> {new_value} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval and ingestion benchmarks.")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated chunk counts (1000..500000).")
+    parser.add_argument("--corpora", default=",".join(CORPORA), help="Comma-separated: icd10, prose.")
+    parser.add_argument("--embedder", choices=("model", "hash"), default="model",
+                        help="'model' uses EMBEDDING_BACKEND; 'hash' needs no model weights.")
+    parser.add_argument("--embed-sample", type=int, default=2000, help="Chunks embedded by the model per case.")
+    parser.add_argument("--embed-all", action="store_true", help="Embed every chunk instead of a sample.")
+    parser.add_argument("--queries", type=int, default=200, help="Queries timed per case.")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Stub LLM response delay.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Results file (default: data/benchmarks/<commit>.json).")
+    parser.add_argument("--compare", default=None, help="Earlier results file to diff against.")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    corpora = [corpus.strip() for corpus in args.corpora.split(",")]
+    unknown = set(corpora) - set(CORPORA)
+    if unknown:
+        parser.error(f"Unknown corpus: {', '.join(sorted(unknown))}")
+
+    if args.embedder == "hash":
+        embedder, backend = HashEmbeddings(), "hash"
+    else:
+        from embedding_backends import EmbeddingSettings, build_embeddings
+
+        config = EmbeddingSettings()
+        embedder, backend = build_embeddings(config), config.embedding_backend
+
+    print("\n" + "=" * 60)
+    print("SHADOW OS - OFFLINE BENCHMARK SUITE")
+    print("=" * 60)
+    print(f"  Corpora: {', '.join(corpora)} | Sizes: {', '.join(f'{s:,}' for s in sizes)}")
+    print(f"  Embedder: {backend} | Stub LLM latency: {args.llm_latency_ms} ms")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedder": backend,
+        },
+        "config": vars(args),
+        "results": [],
+    }
+    for corpus in corpora:
+        for size in sizes:
+            result = run_case(corpus, size, args, embedder)
+            print_case(result)
+            report["results"].append(result)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\n[+] Results written to {output}")
+
+    if args.compare:
+        compare(report, Path(args.compare))
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Token-budgeted context assembly for the Shadow OS query pipeline.
+
+Retrieved chunks carry redundant text: uploaded documents overlap their
+neighbours by up to 50 chars (the splitter's chunk_overlap), and every
+ICD-10 chunk after the first in a category repeats an
+"ICD-10 Category X - ... (continued):" header. The answer on the G2 is
+capped at 200 chars, so prompt size is what drives latency and cost.
+
+``pack_context`` takes chunks in relevance order and:
+1. Drops chunks whose text is already in the context
+2. Merges chunks of the same source that overlap (adjacent splitter chunks)
+   into one block, removing the overlapping span
+3. Folds ICD-10 chunks of one category under a single header
+4. Fills blocks into the token budget by relevance, cutting the last one at
+   a line or sentence boundary
+
+Token counts are estimated at ~4 chars per token; no tokenizer is needed.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+CHARS_PER_TOKEN = 4
+MIN_OVERLAP = 10    # Shorter suffix/prefix matches are coincidence, not splitter overlap
+MAX_OVERLAP = 200   # Well above the 50-char chunk_overlap used for uploads
+MIN_PARTIAL_TOKENS = 32  # Don't bother adding a truncated block smaller than this
+SEPARATOR = "\n\n"
+
+ICD_HEADER = re.compile(r"^ICD-10 Category (\S+) - (.+?)(?: \(continued\))?:$")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def overlap_length(head: str, tail: str, max_overlap: int = MAX_OVERLAP) -> int:
+    """Length of the longest suffix of ``head`` that is also a prefix of ``tail``."""
+    limit = min(len(head), len(tail), max_overlap)
+    for size in range(limit, MIN_OVERLAP - 1, -1):
+        if head.endswith(tail[:size]):
+            return size
+    return 0
+
+
+@dataclass
+class _Block:
+    source: str
+    text: str
+    category: Optional[str] = None
+    lines: set = field(default_factory=set)
+
+
+@dataclass
+class PackedContext:
+    """The assembled context and what packing saved versus joining chunks verbatim."""
+    text: str
+    chunks_in: int
+    blocks_used: int
+    raw_tokens: int
+    tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.tokens)
+
+    def stats(self) -> dict:
+        return {
+            "chunks": self.chunks_in,
+            "blocks": self.blocks_used,
+            "raw_tokens": self.raw_tokens,
+            "tokens": self.tokens,
+            "saved_tokens": self.saved_tokens,
+        }
+
+
+def pack_context(docs, token_budget: int = 0) -> PackedContext:
+    """
+    Assemble ``docs`` (LangChain Documents, most relevant first) into one
+    context string of at most ``token_budget`` estimated tokens (0 = no cap).
+    """
+    texts = [doc.page_content for doc in docs]
+    raw_tokens = estimate_tokens(SEPARATOR.join(texts))
+
+    blocks: List[_Block] = []
+    for doc, text in zip(docs, texts):
+        _add_chunk(blocks, (doc.metadata or {}).get("source", ""), text.strip())
+
+    parts = []
+    remaining = token_budget
+    for block in blocks:
+        cost = estimate_tokens(block.text) + (estimate_tokens(SEPARATOR) if parts else 0)
+        if not token_budget or cost <= remaining:
+            parts.append(block.text)
+            remaining -= cost
+            continue
+        if remaining >= MIN_PARTIAL_TOKENS:
+            partial = _truncate(block.text, remaining * CHARS_PER_TOKEN - len(SEPARATOR))
+            if partial:
+                parts.append(partial)
+        break
+
+    context = SEPARATOR.join(parts)
+    return PackedContext(context, len(docs), len(parts), raw_tokens, estimate_tokens(context))
+
+
+def _add_chunk(blocks: List[_Block], source: str, text: str) -> None:
+    if not text:
+        return
+
+    lines = text.split("\n")
+    header = ICD_HEADER.match(lines[0])
+    if header:
+        category = header.group(1)
+        for block in blocks:
+            if block.category == category:
+                # Continuation of a category already in context: keep only new entries.
+                new_lines = [line for line in lines[1:] if line not in block.lines]
+                if new_lines:
+                    block.text += "\n" + "\n".join(new_lines)
+                    block.lines.update(new_lines)
+                return
+        body = lines[1:]
+        text = "\n".join([f"ICD-10 Category {category} - {header.group(2)}:", *body])
+        blocks.append(_Block(source, text, category, set(body)))
+        return
+
+    for block in blocks:
+        if text in block.text:
+            return
+        if block.source != source or block.category is not None:
+            continue
+        # Neighbouring splitter chunks share an overlap span; stitch them into one block.
+        size = overlap_length(block.text, text)
+        if size:
+            block.text += text[size:]
+            return
+        size = overlap_length(text, block.text)
+        if size:
+            block.text = text + block.text[size:]
+            return
+    blocks.append(_Block(source, text))
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Cut to ``max_chars`` at the last line break or sentence end, else the last space."""
+    if max_chars <= 0:
+        return ""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    boundary = max(cut.rfind("\n"), cut.rfind(". ") + 1)
+    if boundary <= max_chars // 2:
+        boundary = cut.rfind(" ")  # At least don't split a word or code.
+    return (cut[:boundary] if boundary > 0 else cut).rstrip()
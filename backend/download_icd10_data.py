@@ -7,6 +7,18 @@ Source: CDC/NCHS Official ICD-10-CM Files
 import requests
 from pathlib import Path
 
+from icd10_index import format_code
+from icd10_table import DEFAULT_TABLE_PATH, CodeEntry, write_table
+
+# Fixed-width columns of the CDC order file (icd10cm-order-*.txt), 0-based:
+#   0-4 order number, 6-12 code (no dot, space-padded), 14 flag (0 = header,
+#   1 = billable), 16-75 short description, 77 onwards long description.
+ORDER_NUMBER = slice(0, 5)
+CODE = slice(6, 13)
+BILLABLE_FLAG = 14
+SHORT_DESCRIPTION = slice(16, 76)
+LONG_DESCRIPTION = slice(77, None)
+
 
 def download_icd10_from_cdc():
     """
@@ -44,58 +56,61 @@ def download_icd10_from_cdc():
         return None
 
 
+def parse_order_line(line: str):
+    """Parse one fixed-width order file line into a CodeEntry, or None if it isn't one."""
+    line = line.rstrip("\r\n")
+    if len(line) <= SHORT_DESCRIPTION.start:
+        return None
+    order = line[ORDER_NUMBER].strip()
+    code = line[CODE].strip()
+    flag = line[BILLABLE_FLAG]
+    if not order.isdigit() or not code or flag not in "01":
+        return None
+    short_description = line[SHORT_DESCRIPTION].strip()
+    long_description = line[LONG_DESCRIPTION].strip() or short_description
+    return CodeEntry(code, long_description, short_description, flag == "1", int(order))
+
+
 def parse_icd10_order_file(content):
     """
-    Parse the ICD-10-CM order file format.
-    Expected format: CODE + whitespace + description
+    Parse the ICD-10-CM order file format (fixed-width columns, see above).
+    Returns CodeEntry rows in file (tabular) order, category headers included.
     """
-    codes = {}
-
+    entries = []
     for line in content.split('\n'):
-        line = line.strip()
-        if not line or len(line) < 10:
-            continue
+        entry = parse_order_line(line)
+        if entry is not None:
+            entries.append(entry)
+    return entries
 
-        # Split on first whitespace
-        parts = line.split(None, 1)
 
-        if len(parts) >= 2:
-            code = parts[0].strip()
-            description = parts[1].strip()
-
-            # Validate ICD-10 code format
-            # Must start with letter and contain digits
-            if (code and len(code) >= 3 and
-                code[0].isalpha() and
-                any(c.isdigit() for c in code)):
-                codes[code] = description
-
-    return codes
-
-
-def create_comprehensive_database(codes):
+def create_comprehensive_database(entries):
     """
-    Create a comprehensive formatted database file organized by sections.
+    Create the formatted database file read by ingest_icd10_optimized.py:
+    a "--- Category X ---" header per 3-character category, then
+    "Code:" / "Description:" line pairs.
     """
     output_dir = Path(__file__).parent.parent / "data"
-    output_file = output_dir / "icd10_complete_database.txt"
+    output_dir.mkdir(exist_ok=True)
+    output_file = output_dir / "icd10_database.txt"
 
     # Sort codes alphabetically
-    sorted_codes = sorted(codes.items(), key=lambda x: x[0])
+    sorted_entries = sorted(entries, key=lambda entry: entry.code)
+    billable = sum(1 for entry in sorted_entries if entry.billable)
 
     with output_file.open('w', encoding='utf-8') as f:
         f.write("ICD-10-CM Complete Official Database\n")
         f.write("=" * 80 + "\n")
         f.write("Source: CDC/NCHS Official ICD-10-CM Files (2025 Release)\n")
-        f.write(f"Total codes: {len(sorted_codes)}\n")
+        f.write(f"Total codes: {len(sorted_entries)} ({billable} billable)\n")
         f.write("=" * 80 + "\n\n")
 
         current_letter = None
         current_category = None
         stats = {}
 
-        for code, description in sorted_codes:
-            letter = code[0]
+        for entry in sorted_entries:
+            letter = entry.code[0]
 
             # Track statistics
             if letter not in stats:
@@ -110,13 +125,14 @@ def create_comprehensive_database(codes):
                 current_letter = letter
 
             # Add category headers (first 3 characters)
-            category = code[:3]
+            category = entry.code[:3]
             if category != current_category:
-                f.write(f"\n--- {category} Series ---\n\n")
+                f.write(f"\n--- Category {category} ---\n\n")
                 current_category = category
 
             # Write the code entry
-            f.write(f"{code}: {description}\n")
+            f.write(f"Code: {format_code(entry.code)}\n")
+            f.write(f"Description: {entry.long_description}\n")
 
         # Write statistics at end
         f.write("\n\n" + "=" * 80 + "\n")
@@ -125,11 +141,18 @@ def create_comprehensive_database(codes):
         for letter in sorted(stats.keys()):
             f.write(f"Section {letter}: {stats[letter]} codes\n")
 
-    print(f"[+] Created comprehensive database with {len(sorted_codes)} codes")
+    print(f"[+] Created comprehensive database with {len(sorted_entries)} codes")
     print(f"[+] Saved to: {output_file}")
     return output_file
 
 
+def create_code_table(entries, path=DEFAULT_TABLE_PATH):
+    """Write the binary code table the backend and ingester memory-map."""
+    table_file = write_table(entries, path)
+    print(f"[+] Wrote code table ({table_file.stat().st_size:,} bytes) to: {table_file}")
+    return table_file
+
+
 def main():
     """Orchestrate the download and processing workflow."""
     print("\n--- ICD-10-CM Database Downloader ---\n")
@@ -145,16 +168,17 @@ def main():
 
     # Step 2: Parse the content
     print("\n[+] Parsing ICD-10-CM codes...")
-    codes = parse_icd10_order_file(content)
-    print(f"[+] Parsed {len(codes)} valid codes")
+    entries = parse_icd10_order_file(content)
+    print(f"[+] Parsed {len(entries)} valid codes ({sum(1 for e in entries if e.billable)} billable)")
 
-    # Step 3: Create formatted database
+    # Step 3: Create formatted database and binary code table
     print("\n[+] Creating formatted database...")
-    create_comprehensive_database(codes)
+    create_comprehensive_database(entries)
+    create_code_table(entries)
 
     print("\n--- Download Complete ---")
     print("[+] ICD-10-CM database is ready for ingestion!")
-    print("[+] Next: Run 'python backend/ingest_docs.py' to load into ChromaDB")
+    print("[+] Next: Run 'python backend/ingest_icd10_optimized.py' to load into ChromaDB")
     return True
 
 
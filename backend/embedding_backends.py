@@ -0,0 +1,79 @@
+"""
+Embedding backend selection for Shadow OS.
+
+Every component that embeds text (the API, both ingest scripts and the
+ICD-10 setup check) builds its model through ``build_embeddings`` so the
+backend is chosen in one place, from ``backend/.env``:
+
+    EMBEDDING_BACKEND=torch      # full-precision PyTorch (reference)
+    EMBEDDING_BACKEND=onnx       # ONNX Runtime, fp32
+    EMBEDDING_BACKEND=onnx-int8  # ONNX Runtime, int8-quantized weights
+
+The ONNX backends need ``pip install "sentence-transformers[onnx]"``. Run
+``python backend/benchmark_embeddings.py`` to check parity against the
+torch reference and compare throughput before switching.
+"""
+import os
+import importlib.util
+
+from pydantic_settings import BaseSettings
+from langchain_community.embeddings import SentenceTransformerEmbeddings
+
+from embedding_cache import CachedEmbeddings
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# Quantized export shipped in the sentence-transformers model repos; AVX2
+# runs on any modern x86 CPU. Override with EMBEDDING_ONNX_FILE.
+DEFAULT_INT8_FILE = "onnx/model_quint8_avx2.onnx"
+
+
+class EmbeddingSettings(BaseSettings):
+    embedding_model_name: str = "all-MiniLM-L6-v2"
+    embedding_backend: str = "torch"
+    embedding_onnx_file: str = ""
+    # Unix socket of a running embedding_service.py. The API workers and the
+    # ingest scripts then embed and write through it instead of loading
+    # their own model and opening the vector store themselves.
+    embedding_service_socket: str = ""
+
+    class Config:
+        env_file = os.path.join(os.path.dirname(__file__), ".env")
+        extra = "ignore"
+
+
+def cache_model_key(config: EmbeddingSettings) -> str:
+    """
+    Key for the persistent embedding cache. Quantized vectors differ
+    slightly from the reference, so each backend gets its own entries.
+    """
+    if config.embedding_backend == "torch":
+        return config.embedding_model_name
+    return f"{config.embedding_model_name}@{config.embedding_backend}"
+
+
+def build_embeddings(config: EmbeddingSettings = None, backend: str = None) -> SentenceTransformerEmbeddings:
+    """Build the sentence-transformer embedder for the configured backend."""
+    config = config or EmbeddingSettings()
+    backend = backend or config.embedding_backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+
+    model_kwargs = {}
+    if backend != "torch":
+        if any(importlib.util.find_spec(pkg) is None for pkg in ("onnxruntime", "optimum")):
+            raise RuntimeError(
+                f"EMBEDDING_BACKEND={backend} needs ONNX Runtime. "
+                'Install it with: pip install "sentence-transformers[onnx]"'
+            )
+        model_kwargs["backend"] = "onnx"
+        onnx_file = config.embedding_onnx_file or (DEFAULT_INT8_FILE if backend == "onnx-int8" else "")
+        if onnx_file:
+            model_kwargs["model_kwargs"] = {"file_name": onnx_file}
+
+    return SentenceTransformerEmbeddings(model_name=config.embedding_model_name, model_kwargs=model_kwargs)
+
+
+def build_cached_embeddings(config: EmbeddingSettings = None) -> CachedEmbeddings:
+    """The configured embedder wrapped in the persistent embedding cache."""
+    config = config or EmbeddingSettings()
+    return CachedEmbeddings(build_embeddings(config), model_name=cache_model_key(config))
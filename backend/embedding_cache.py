@@ -0,0 +1,104 @@
+"""
+Content-addressed, persistent embedding cache for Shadow OS ingestion.
+
+Wraps any LangChain ``Embeddings`` so ``embed_documents`` only encodes text it
+has never seen before. Vectors are stored in SQLite as raw float32 blobs keyed
+by (model name, sha256 of the chunk text), so rebuilding the vector DB or
+re-uploading a document reuses yesterday's work instead of re-running the model.
+"""
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / "data" / "embedding_cache.sqlite3"
+
+# SQLite caps bound parameters per statement; stay well below the limit.
+_LOOKUP_CHUNK = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that persists document vectors across runs."""
+
+    def __init__(self, underlying: Embeddings, model_name: str, path=DEFAULT_CACHE_PATH):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        # WAL lets the backend read while an ingest script is writing.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [hashlib.sha256(text.encode("utf-8")).digest() for text in texts]
+        found = self._load(set(hashes))
+
+        missing = {}
+        for text, digest in zip(texts, hashes):
+            if digest not in found:
+                missing.setdefault(digest, text)
+
+        self.hits += len(texts) - sum(1 for digest in hashes if digest not in found)
+        if missing:
+            # Duplicate chunks inside one call are encoded once.
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = {digest: np.asarray(vector, dtype=np.float32) for digest, vector in zip(missing, vectors)}
+            self._save(fresh)
+            found.update(fresh)
+            self.misses += len(missing)
+
+        return [found[digest].tolist() for digest in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Queries are one-off and latency-sensitive; the answer cache handles repeats.
+        return self.underlying.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Encode many queries in one model call, bypassing the cache."""
+        return self.underlying.embed_documents(texts)
+
+    def stats(self) -> dict:
+        return {"model": self.model_name, "path": str(self.path), "hits": self.hits, "encoded": self.misses}
+
+    def _load(self, hashes: set) -> dict:
+        keys = list(hashes)
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[i:i + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model_name, *chunk],
+                )
+                for digest, blob in rows:
+                    found[bytes(digest)] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _save(self, vectors: dict) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(self.model_name, digest, vector.tobytes()) for digest, vector in vectors.items()],
+            )
+            self._conn.commit()
@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+Shared embedding + index service for multi-worker Shadow OS deployments.
+
+``uvicorn backend.main:app --workers N`` would otherwise load N copies of
+the embedding model and open N Chroma clients on one persist directory.
+Run this once instead and point every worker at it:
+
+    python backend/embedding_service.py
+    EMBEDDING_SERVICE_SOCKET=data/embedding_service.sock \\
+        uvicorn backend.main:app --workers 4
+
+The service owns the only model, Chroma client, BM25 indexes and router
+centroids. Workers talk to it over a Unix socket with length-prefixed JSON
+frames; collection ops name the collection they act on. Concurrent
+single-query embeds from all workers are micro-batched into one model call,
+and every write (upsert, delete, lexical updates, collection drops) goes
+through one writer thread so ingestion is serialized. Each reply carries a write generation
+so workers can drop cached answers when any of them changes the corpus.
+
+Unix sockets only: run single-worker on Windows.
+"""
+import os
+import json
+import socket
+import struct
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_SOCKET_PATH = Path(__file__).parent.parent / "data" / "embedding_service.sock"
+DATA_DIR = Path(__file__).parent.parent / "data"
+CHROMA_DB_PATH = DATA_DIR / "chroma_db"
+
+_HEADER = struct.Struct("!I")
+MAX_FRAME = 64 * 1024 * 1024
+INGEST_TIMEOUT = 300.0  # Seconds an ingest script waits on one call (large embed batches)
+
+# Ops that change the corpus: run on the single writer thread, bump the generation.
+WRITE_OPS = {
+    "upsert", "delete", "lexical_add", "lexical_remove", "lexical_clear", "lexical_save",
+    "observe", "save", "drop_collection",
+}
+# Ingest job bookkeeping: cheap, answered on the event loop, never bumps the generation.
+JOB_OPS = {"job_save", "job_get", "job_list"}
+RESULT_KEYS = ("ids", "documents", "metadatas", "distances")
+
+
+# --- Framing ---
+
+def _encode(payload: dict) -> bytes:
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(len(body)) + body
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = bytearray()
+    while len(chunks) < size:
+        chunk = sock.recv(size - len(chunks))
+        if not chunk:
+            raise ConnectionError("Embedding service closed the connection.")
+        chunks.extend(chunk)
+    return bytes(chunks)
+
+
+def _plain(result: dict) -> dict:
+    """Chroma results -> JSON-safe dict with only the fields callers read."""
+    return {key: result.get(key) for key in RESULT_KEYS if result.get(key) is not None}
+
+
+# --- Server ---
+
+class EmbeddingService:
+    """Owns the model, the Chroma collections and their BM25 indexes for all workers."""
+
+    def __init__(self, batch_window_ms: float = 5.0, max_batch: int = 64):
+        from embedding_backends import build_cached_embeddings
+        from ingest_jobs import SharedJobTable
+        from named_collections import LocalCollections
+
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.generation = 0
+
+        print("[*] Loading embedding model...")
+        self.embedder = build_cached_embeddings()
+        print("[*] Opening vector store and lexical indexes...")
+        self.collections = LocalCollections(CHROMA_DB_PATH, DATA_DIR)
+        self.collections.backfill_centroids()
+        for name in self.collections.names():
+            self.collections.lexical(name)
+
+        # Upload jobs of every worker, so any of them can answer /ingest/jobs/{id}.
+        self.jobs = SharedJobTable()
+
+        self._reader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="embed-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-write")
+        self._queue: asyncio.Queue = None
+
+    # Op implementations (run on the reader or writer pool).
+    def op_embed_queries(self, texts):
+        return self.embedder.embed_queries(texts)
+
+    def op_embed_documents(self, texts):
+        return self.embedder.embed_documents(texts)
+
+    def op_collections(self):
+        return self.collections.names()
+
+    def op_counts(self):
+        return self.collections.counts()
+
+    def op_query(self, collection, query_embeddings, n_results, include):
+        return _plain(self.collections.collection(collection).query(
+            query_embeddings=query_embeddings, n_results=n_results, include=include
+        ))
+
+    def op_get(self, collection, include, ids=None, limit=None, offset=None):
+        return _plain(self.collections.collection(collection).get(ids=ids, limit=limit, offset=offset, include=include))
+
+    def op_count(self, collection):
+        return self.collections.collection(collection).count()
+
+    def op_upsert(self, collection, ids, embeddings, documents, metadatas):
+        self.collections.collection(collection, create=True).upsert(
+            ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas
+        )
+
+    def op_delete(self, collection, ids=None, where=None):
+        self.collections.collection(collection).delete(ids=ids, where=where)
+
+    def op_lexical_search(self, collection, query, k):
+        return self._read_lexical(collection).search(query, k)
+
+    def op_lexical_len(self, collection):
+        return len(self._read_lexical(collection))
+
+    def op_lexical_add(self, collection, ids, texts):
+        self.collections.lexical(collection).add(ids, texts)
+
+    def op_lexical_remove(self, collection, ids):
+        self.collections.lexical(collection).remove(ids)
+
+    def op_lexical_clear(self, collection):
+        self.collections.lexical(collection).clear()
+
+    def op_lexical_save(self, collection):
+        self.collections.lexical(collection).save()
+
+    def op_observe(self, collection, embeddings):
+        self.collections.observe(collection, embeddings)
+
+    def op_centroid_scores(self, vector):
+        return self.collections.centroid_scores(vector)
+
+    def op_save(self, collection):
+        self.collections.save(collection)
+
+    def op_drop_collection(self, collection):
+        self.collections.drop(collection)
+
+    def op_job_save(self, job):
+        self.jobs.save(job)
+
+    def op_job_get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def op_job_list(self):
+        return self.jobs.list()
+
+    def _read_lexical(self, collection):
+        # A first build saves the index, so it runs on the writer thread like every other write.
+        index = self.collections.lexical(collection, build=False)
+        if index is None:
+            index = self._writer.submit(self.collections.lexical, collection).result()
+        return index
+
+    async def dispatch(self, op: str, args: dict):
+        loop = asyncio.get_running_loop()
+        if op == "embed_query":
+            future = loop.create_future()
+            await self._queue.put((args["text"], future))
+            return await future
+        if op == "ping":
+            return "pong"
+
+        handler = getattr(self, f"op_{op}", None)
+        if handler is None:
+            raise ValueError(f"Unknown op '{op}'")
+        if op in JOB_OPS:
+            return handler(**args)
+        if op in WRITE_OPS:
+            result = await loop.run_in_executor(self._writer, lambda: handler(**args))
+            self.generation += 1
+            return result
+        return await loop.run_in_executor(self._reader, lambda: handler(**args))
+
+    async def _batcher(self):
+        """Collect single-query embeds for up to batch_window, then encode them together."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                vectors = await loop.run_in_executor(
+                    self._reader, self.embedder.embed_queries, [text for text, _ in batch]
+                )
+                for (_, future), vector in zip(batch, vectors):
+                    if not future.done():
+                        future.set_result(vector)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    return
+                if size > MAX_FRAME:
+                    return
+                body = await reader.readexactly(size)
+                try:
+                    request = json.loads(body)
+                    result = await self.dispatch(request["op"], request.get("args", {}))
+                    reply = {"result": result, "generation": self.generation}
+                except Exception as e:
+                    reply = {"error": f"{type(e).__name__}: {e}", "generation": self.generation}
+                writer.write(_encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return  # Client gave up (e.g. timed out) before the reply; the op still ran once.
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path: Path):
+        self._queue = asyncio.Queue()
+        batcher = asyncio.create_task(self._batcher())
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if socket_path.exists():
+            socket_path.unlink()
+        server = await asyncio.start_unix_server(self._handle, path=str(socket_path))
+        os.chmod(socket_path, 0o600)  # Local workers only.
+        print(f"[+] Embedding service listening on {socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+# --- Client ---
+
+class ServiceClient:
+    """
+    Blocking client, one connection per thread (the backend calls it from
+    its query and ingest pools). ``on_generation`` fires when another
+    worker's write is observed.
+    """
+
+    def __init__(self, socket_path, timeout: float = 30.0, on_generation=None):
+        self.socket_path = str(socket_path)
+        self.timeout = timeout
+        self.on_generation = on_generation
+        self.generation = None
+        self._local = threading.local()
+
+    def call(self, op: str, **args):
+        frame = _encode({"op": op, "args": args})
+        for attempt in (1, 2):
+            sock = self._connection()
+            try:
+                sock.sendall(frame)
+            except OSError:
+                # Stale socket (service restarted) and nothing delivered: reconnect and send once more.
+                self._disconnect(sock)
+                if attempt == 2:
+                    raise
+                continue
+            try:
+                (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+                reply = json.loads(_recv_exact(sock, size))
+                break
+            except socket.timeout:
+                # The service may still be running the op; re-sending could apply a write twice.
+                self._disconnect(sock)
+                raise
+            except OSError:
+                # The request went out, so only reads are safe to repeat.
+                self._disconnect(sock)
+                if attempt == 2 or op in WRITE_OPS:
+                    raise
+
+        generation = reply.get("generation")
+        if generation != self.generation:
+            previous, self.generation = self.generation, generation
+            if previous is not None and self.on_generation is not None:
+                self.on_generation()
+        if "error" in reply:
+            raise RuntimeError(f"Embedding service: {reply['error']}")
+        return reply["result"]
+
+    def _disconnect(self, sock: socket.socket) -> None:
+        self._local.sock = None
+        sock.close()
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+
+class RemoteEmbeddings(Embeddings):
+    """Drop-in for CachedEmbeddings backed by the shared service."""
+
+    def __init__(self, client: ServiceClient):
+        self.client = client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.call("embed_documents", texts=texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.call("embed_query", text=text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.client.call("embed_queries", texts=texts)
+
+
+class RemoteCollection:
+    """The subset of the Chroma collection API the backend uses, for one named collection."""
+
+    def __init__(self, client: ServiceClient, name: str):
+        self.client = client
+        self.name = name
+
+    def query(self, query_embeddings, n_results, include=("documents", "metadatas")):
+        return self.client.call(
+            "query", collection=self.name, query_embeddings=[list(v) for v in query_embeddings],
+            n_results=n_results, include=list(include),
+        )
+
+    def get(self, ids=None, limit=None, offset=None, include=("documents", "metadatas")):
+        return self.client.call("get", collection=self.name, ids=ids, limit=limit, offset=offset, include=list(include))
+
+    def count(self) -> int:
+        return self.client.call("count", collection=self.name)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.client.call(
+            "upsert", collection=self.name, ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas
+        )
+
+    def delete(self, ids=None, where=None):
+        self.client.call("delete", collection=self.name, ids=ids, where=where)
+
+
+class RemoteLexicalIndex:
+    """The BM25Index API for one collection, served by the shared service."""
+
+    def __init__(self, client: ServiceClient, name: str):
+        self.client = client
+        self.name = name
+
+    def __len__(self) -> int:
+        return self.client.call("lexical_len", collection=self.name)
+
+    def search(self, query: str, k: int = 10):
+        return [tuple(hit) for hit in self.client.call("lexical_search", collection=self.name, query=query, k=k)]
+
+    def add(self, ids, texts) -> None:
+        self.client.call("lexical_add", collection=self.name, ids=list(ids), texts=list(texts))
+
+    def remove(self, ids) -> None:
+        self.client.call("lexical_remove", collection=self.name, ids=list(ids))
+
+    def clear(self) -> None:
+        self.client.call("lexical_clear", collection=self.name)
+
+    def save(self) -> None:
+        self.client.call("lexical_save", collection=self.name)
+
+
+class RemoteJobs:
+    """Shared ingest job table for IngestJobQueue, held by the service."""
+
+    def __init__(self, client: ServiceClient):
+        self.client = client
+
+    def save(self, job: dict) -> None:
+        self.client.call("job_save", job=job)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.client.call("job_get", job_id=job_id)
+
+    def list(self) -> list:
+        return self.client.call("job_list")
+
+
+class RemoteCollections:
+    """The LocalCollections API, served by the shared service."""
+
+    def __init__(self, client: ServiceClient):
+        self.client = client
+
+    def names(self) -> List[str]:
+        return self.client.call("collections")
+
+    def exists(self, name: str) -> bool:
+        return name in self.names()
+
+    def collection(self, name: str, create: bool = False) -> RemoteCollection:
+        # The service creates the collection on its first upsert; reads of a
+        # missing one fail there, which saves a round trip per search.
+        return RemoteCollection(self.client, name)
+
+    def lexical(self, name: str) -> RemoteLexicalIndex:
+        return RemoteLexicalIndex(self.client, name)
+
+    def counts(self) -> Dict[str, int]:
+        return self.client.call("counts")
+
+    def observe(self, name: str, embeddings) -> None:
+        self.client.call("observe", collection=name, embeddings=[list(v) for v in embeddings])
+
+    def centroid_scores(self, vector) -> Dict[str, float]:
+        return self.client.call("centroid_scores", vector=list(vector))
+
+    def save(self, name: str) -> None:
+        self.client.call("save", collection=name)
+
+    def drop(self, name: str) -> None:
+        self.client.call("drop_collection", collection=name)
+
+
+def service_running(socket_path=DEFAULT_SOCKET_PATH) -> bool:
+    """True when a service answers on ``socket_path`` (a leftover socket file does not count)."""
+    try:
+        ServiceClient(socket_path, timeout=2.0).call("ping")
+        return True
+    except OSError:
+        return False
+
+
+def open_ingest_store(config, chroma_path, data_dir):
+    """
+    (embeddings, collections) for an ingest script. With
+    EMBEDDING_SERVICE_SOCKET set, both go through the running service, so
+    the script's writes are serialized with the workers' and the service's
+    BM25 indexes and centroids stay current. Otherwise the script loads its
+    own model and opens the store directly, which is refused while a service
+    holds the same store open.
+    """
+    if config.embedding_service_socket:
+        client = ServiceClient(config.embedding_service_socket, timeout=INGEST_TIMEOUT)
+        client.call("ping")
+        return RemoteEmbeddings(client), RemoteCollections(client)
+    if service_running(DEFAULT_SOCKET_PATH):
+        raise RuntimeError(
+            f"An embedding service is running on {DEFAULT_SOCKET_PATH}. Set EMBEDDING_SERVICE_SOCKET "
+            "so this script writes through it, or stop the service first."
+        )
+    from embedding_backends import build_cached_embeddings
+    from named_collections import LocalCollections
+
+    return build_cached_embeddings(config), LocalCollections(chroma_path, data_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared embedding + index service for Shadow OS workers.")
+    parser.add_argument("--socket", default=str(DEFAULT_SOCKET_PATH), help="Unix socket path.")
+    parser.add_argument("--batch-window-ms", type=float, default=5.0, help="Micro-batch collection window.")
+    parser.add_argument("--max-batch", type=int, default=64, help="Max queries per embedding call.")
+    args = parser.parse_args()
+
+    service = EmbeddingService(batch_window_ms=args.batch_window_ms, max_batch=args.max_batch)
+    try:
+        asyncio.run(service.serve(Path(args.socket)))
+    except KeyboardInterrupt:
+        print("\n[*] Embedding service stopped.")
+
+
+if __name__ == "__main__":
+    main()
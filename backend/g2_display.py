@@ -0,0 +1,36 @@
+"""
+G2 waveguide display formatting for Shadow OS.
+
+The G2 shows about 5 lines of 60 characters (see GEMINI.md). Answers are
+uppercased, word-wrapped to that geometry and split into pages once per
+answer; the pages travel with the answer (and through the answer cache) so
+the bridge can page through a long answer without asking the backend again.
+"""
+import textwrap
+from typing import List
+
+G2_LINE_WIDTH = 60
+G2_LINES_PER_PAGE = 5
+
+
+def wrap_lines(text: str, width: int = G2_LINE_WIDTH) -> List[str]:
+    """Uppercase and word-wrap, keeping paragraph breaks; over-long words are split."""
+    lines = []
+    for paragraph in text.upper().splitlines():
+        if paragraph.strip():
+            lines.extend(textwrap.wrap(paragraph, width=width, break_on_hyphens=False))
+    return lines
+
+
+def paginate(text: str, width: int = G2_LINE_WIDTH, lines_per_page: int = G2_LINES_PER_PAGE) -> List[str]:
+    """Display pages for an answer, each up to ``lines_per_page`` newline-joined lines."""
+    lines = wrap_lines(text, width)
+    if not lines:
+        return [""]
+    return ["\n".join(lines[i:i + lines_per_page]) for i in range(0, len(lines), lines_per_page)]
+
+
+def current_page(text: str) -> tuple:
+    """(index, text) of the page being filled while an answer streams in."""
+    pages = paginate(text)
+    return len(pages) - 1, pages[-1]
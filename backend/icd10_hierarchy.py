@@ -0,0 +1,103 @@
+"""
+ICD-10-CM code hierarchy over the memory-mapped code table.
+
+ICD-10 codes nest by prefix: I21 (category) > I21.0 > I21.01. Because the
+table's code array is sorted, every descendant of a code sits in one
+contiguous run right after it, so:
+
+- lookup is one binary search
+- a code's subtree (e.g. everything under I21) is two binary searches
+- direct children are found by jumping over each child's own subtree, one
+  search per child instead of a scan over all descendants
+- the parent is the longest proper prefix present in the table (some
+  levels, like I21.A, have no code of their own)
+
+Nothing is materialized per code: rows are decoded only when returned, and
+the table pages are shared between uvicorn workers through the OS page
+cache.
+"""
+from typing import List, Optional
+
+from icd10_index import format_code, normalize_code
+from icd10_table import ICD10Table
+
+MAX_LIST_RESULTS = 500
+
+
+class ICD10Hierarchy:
+    """Parent/child navigation and prefix/range enumeration over an ICD10Table."""
+
+    def __init__(self, table: ICD10Table):
+        self.table = table
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def node(self, row: int) -> dict:
+        """JSON-ready description of one table row."""
+        return {
+            "code": format_code(self.table.code(row)),
+            "description": self.table.long_description(row),
+            "short_description": self.table.short_description(row),
+            "billable": self.table.billable(row),
+        }
+
+    def get(self, code: str) -> Optional[dict]:
+        row = self.table.find(code)
+        return self.node(row) if row >= 0 else None
+
+    def parent_row(self, code: str) -> int:
+        """Row of the nearest ancestor in the table, or -1 for a category."""
+        code = normalize_code(code)
+        for length in range(len(code) - 1, 2, -1):
+            row = self.table.find(code[:length])
+            if row >= 0:
+                return row
+        return -1
+
+    def parent(self, code: str) -> Optional[dict]:
+        row = self.parent_row(code)
+        return self.node(row) if row >= 0 else None
+
+    def ancestors(self, code: str) -> List[dict]:
+        """Ancestors from the category down to the direct parent."""
+        chain = []
+        row = self.parent_row(code)
+        while row >= 0:
+            chain.append(self.node(row))
+            row = self.parent_row(self.table.code(row))
+        return chain[::-1]
+
+    def child_rows(self, code: str, limit: int = MAX_LIST_RESULTS) -> List[int]:
+        """Rows of the direct children of ``code`` in code order, at most ``limit``."""
+        code = normalize_code(code)
+        lo, hi = self.table.prefix_range(code)
+        row = lo + 1 if lo < hi and self.table.code(lo) == code else lo
+        rows = []
+        while row < hi and len(rows) < limit:
+            rows.append(row)
+            # Skip the child's own descendants: they follow it contiguously.
+            row = self.table.prefix_range(self.table.code(row))[1]
+        return rows
+
+    def children(self, code: str, limit: int = MAX_LIST_RESULTS) -> List[dict]:
+        return [self.node(row) for row in self.child_rows(code, limit)]
+
+    def prefix(self, prefix: str, limit: int = MAX_LIST_RESULTS, offset: int = 0) -> dict:
+        """Every code starting with ``prefix`` (the code itself included), paged."""
+        lo, hi = self.table.prefix_range(prefix)
+        return self._page(lo, hi, limit, offset)
+
+    def range(self, start: str, end: str, limit: int = MAX_LIST_RESULTS, offset: int = 0) -> dict:
+        """
+        Codes from ``start`` through ``end`` inclusive, with everything under
+        ``end``: I20-I25 covers I20 to I25.9.
+        """
+        lo = self.table.prefix_range(start)[0]
+        hi = self.table.prefix_range(end)[1]
+        return self._page(lo, max(lo, hi), limit, offset)
+
+    def _page(self, lo: int, hi: int, limit: int, offset: int) -> dict:
+        start = min(hi, lo + max(0, offset))
+        end = min(hi, start + max(0, limit))
+        return {"total": hi - lo, "offset": start - lo, "codes": [self.node(row) for row in range(start, end)]}
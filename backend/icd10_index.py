@@ -0,0 +1,105 @@
+"""
+Exact ICD-10 code index for the Shadow OS backend.
+
+Questions such as "what is E11.9" or "codes under J18.*" do not need dense
+retrieval: the answer is a table lookup. Codes live without the dot in the
+sorted array of an ``ICD10Table``, so an exact lookup is one binary search
+and a prefix query two. When the binary table built by
+download_icd10_data.py exists it is memory-mapped; otherwise the formatted
+text file is parsed into an in-memory table.
+"""
+import re
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from icd10_table import CodeEntry, ICD10Table
+
+# Letter, digit, alphanumeric, then up to four more characters after an
+# optional dot. A trailing "*" (or ".*") asks for every code under the prefix.
+CODE_PATTERN = re.compile(r"\b([A-Z][0-9][0-9A-Z](?:\.?[0-9A-Z]{1,4})?)(\.?\*)?", re.IGNORECASE)
+
+# Words that may surround a code in a pure lookup question. Anything else
+# means the question needs the LLM; the exact entries are injected instead.
+LOOKUP_WORDS = {
+    "what", "whats", "is", "are", "the", "a", "an", "code", "codes", "for", "of", "icd", "icd10",
+    "icd-10", "icd-10-cm", "does", "mean", "means", "describe", "lookup", "look", "up", "under",
+    "in", "all", "list", "show", "me", "and", "define", "definition",
+}
+
+MAX_PREFIX_RESULTS = 25
+
+
+def normalize_code(code: str) -> str:
+    """Canonical form used as the index key: uppercase, no dot."""
+    return code.replace(".", "").strip().upper()
+
+
+def format_code(code: str) -> str:
+    """Display form with the dot after the category, e.g. E119 -> E11.9."""
+    code = normalize_code(code)
+    return f"{code[:3]}.{code[3:]}" if len(code) > 3 else code
+
+
+def find_codes(text: str) -> List[Tuple[str, bool]]:
+    """Return (normalized code, is_prefix_query) pairs mentioned in ``text``."""
+    return [(normalize_code(m.group(1)), bool(m.group(2))) for m in CODE_PATTERN.finditer(text)]
+
+
+def is_pure_lookup(text: str) -> bool:
+    """True when the question is nothing but codes plus lookup filler words."""
+    remainder = CODE_PATTERN.sub(" ", text.lower())
+    words = re.findall(r"[a-z0-9-]+", remainder)
+    return all(word in LOOKUP_WORDS for word in words)
+
+
+class ICD10CodeIndex:
+    """Sorted code table with exact and prefix lookups."""
+
+    def __init__(self, entries: Iterable[Tuple[str, str]] = (), table: Optional[ICD10Table] = None):
+        self.table = table if table is not None else ICD10Table.from_entries(
+            CodeEntry(code, desc) for code, desc in entries if code
+        )
+
+    @classmethod
+    def from_file(cls, path, table_path=None) -> "ICD10CodeIndex":
+        """
+        Map the binary code table at ``table_path`` if it exists, else build
+        the index from the formatted ICD-10 database text file.
+        """
+        if table_path is not None and Path(table_path).exists():
+            return cls(table=ICD10Table.open(table_path))
+
+        from ingest_icd10_optimized import parse_icd10_codes
+
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        categories = parse_icd10_codes(path.read_text(encoding="utf-8"))
+        return cls(entry for codes in categories.values() for entry in codes)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def lookup(self, code: str) -> Optional[str]:
+        return self.table.lookup(code)
+
+    def prefix(self, prefix: str, limit: int = MAX_PREFIX_RESULTS) -> List[Tuple[str, str]]:
+        """Codes starting with ``prefix`` in sorted order, at most ``limit``."""
+        start, end = self.table.prefix_range(prefix)
+        return list(self.table.items(start, min(end, start + limit)))
+
+    def resolve(self, text: str) -> List[Tuple[str, str]]:
+        """Every indexed entry the text refers to, exact codes and prefix queries alike."""
+        results = []
+        seen = set()
+        for code, is_prefix in find_codes(text):
+            matches = self.prefix(code) if is_prefix else []
+            if not is_prefix:
+                desc = self.lookup(code)
+                if desc is not None:
+                    matches = [(code, desc)]
+            for match in matches:
+                if match[0] not in seen:
+                    seen.add(match[0])
+                    results.append((format_code(match[0]), match[1]))
+        return results
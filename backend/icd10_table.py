@@ -0,0 +1,212 @@
+"""
+Compact binary ICD-10 code table for Shadow OS.
+
+The CDC order file is parsed once (download_icd10_data.py) into a single
+array-backed file that the ingester and the backend memory-map instead of
+re-parsing text at startup:
+
+    header    magic, entry count, blob size
+    codes     count x 7 bytes, normalized (no dot), NUL-padded, sorted
+    flags     count x uint8 (bit 0: billable; 0 = category header)
+    orders    count x uint32, CDC order number (tabular order)
+    offsets   (2 * count + 1) x uint32 into the blob: short, long, short, ...
+    blob      UTF-8 descriptions
+
+Opening the table maps the file and wraps each section in a numpy view, so
+it takes milliseconds and the pages live in the OS page cache: every
+process that maps the same file shares them. Lookups are binary searches
+over the code array; descriptions are decoded only when read.
+"""
+import mmap
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_TABLE_PATH = Path(__file__).parent.parent / "data" / "icd10_codes.bin"
+
+MAGIC = b"ICD10TB1"
+HEADER = struct.Struct("<8sIIQ")  # magic, count, code width, blob size
+CODE_WIDTH = 7
+BILLABLE = 1
+
+
+@dataclass
+class CodeEntry:
+    """One row of the CDC order file."""
+    code: str
+    long_description: str
+    short_description: str = ""
+    billable: bool = True
+    order: int = 0
+
+
+def _normalize(code: str) -> str:
+    return code.replace(".", "").strip().upper()
+
+
+def _align(offset: int, size: int = 8) -> int:
+    return (offset + size - 1) // size * size
+
+
+def _layout(count: int) -> dict:
+    """Byte offset of each section for a table of ``count`` entries."""
+    codes = _align(HEADER.size)
+    flags = codes + count * CODE_WIDTH
+    orders = _align(flags + count, 4)
+    offsets = orders + count * 4
+    blob = offsets + (2 * count + 1) * 4
+    return {"codes": codes, "flags": flags, "orders": orders, "offsets": offsets, "blob": blob}
+
+
+def build_table(entries: Iterable[CodeEntry]) -> bytes:
+    """Serialize entries (any order; duplicate codes keep the last) into table bytes."""
+    by_code = {}
+    for entry in entries:
+        code = _normalize(entry.code)
+        if code:
+            if len(code) > CODE_WIDTH:
+                raise ValueError(f"ICD-10 code too long for the table: {entry.code!r}")
+            by_code[code] = entry
+    codes = sorted(by_code)
+    count = len(codes)
+
+    flags = np.zeros(count, dtype=np.uint8)
+    orders = np.zeros(count, dtype=np.uint32)
+    offsets = np.zeros(2 * count + 1, dtype=np.uint32)
+    blob = bytearray()
+    for i, code in enumerate(codes):
+        entry = by_code[code]
+        flags[i] = BILLABLE if entry.billable else 0
+        orders[i] = entry.order
+        # An empty short description means "same as the long one" and costs nothing.
+        short = entry.short_description if entry.short_description != entry.long_description else ""
+        offsets[2 * i] = len(blob)
+        blob += short.encode("utf-8")
+        offsets[2 * i + 1] = len(blob)
+        blob += entry.long_description.encode("utf-8")
+    offsets[2 * count] = len(blob)
+
+    layout = _layout(count)
+    out = bytearray(layout["blob"] + len(blob))
+    HEADER.pack_into(out, 0, MAGIC, count, CODE_WIDTH, len(blob))
+    out[layout["codes"]:layout["flags"]] = np.array(codes, dtype=f"S{CODE_WIDTH}").tobytes()
+    out[layout["flags"]:layout["flags"] + count] = flags.tobytes()
+    out[layout["orders"]:layout["offsets"]] = orders.tobytes()
+    out[layout["offsets"]:layout["blob"]] = offsets.tobytes()
+    out[layout["blob"]:] = blob
+    return bytes(out)
+
+
+def write_table(entries: Iterable[CodeEntry], path=DEFAULT_TABLE_PATH) -> Path:
+    """Write the table atomically, so processes mapping the old file keep a consistent view."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(build_table(entries))
+    tmp_path.replace(path)
+    return path
+
+
+class ICD10Table:
+    """Read-only view over table bytes (a memory-mapped file or an in-memory buffer)."""
+
+    def __init__(self, buffer, mapping: Optional[mmap.mmap] = None):
+        magic, count, width, blob_size = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or width != CODE_WIDTH:
+            raise ValueError("Not an ICD-10 code table (or an incompatible version).")
+        layout = _layout(count)
+        self._buffer = buffer
+        self._mapping = mapping
+        self._blob = layout["blob"]
+        self.codes = np.frombuffer(buffer, dtype=f"S{CODE_WIDTH}", count=count, offset=layout["codes"])
+        self.flags = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=layout["flags"])
+        self.orders = np.frombuffer(buffer, dtype=np.uint32, count=count, offset=layout["orders"])
+        self.offsets = np.frombuffer(buffer, dtype=np.uint32, count=2 * count + 1, offset=layout["offsets"])
+
+    @classmethod
+    def open(cls, path=DEFAULT_TABLE_PATH) -> "ICD10Table":
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapping, mapping)
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[CodeEntry]) -> "ICD10Table":
+        return cls(build_table(entries))
+
+    def close(self) -> None:
+        # numpy views keep the buffer exported; drop them before unmapping.
+        self.codes = self.flags = self.orders = self.offsets = None
+        if self._mapping is not None:
+            try:
+                self._mapping.close()
+            except BufferError:
+                pass  # A view is still alive somewhere; the mapping goes when it does.
+            self._mapping = None
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def mapped(self) -> bool:
+        """True when backed by a memory-mapped file (shared page cache) rather than private memory."""
+        return self._mapping is not None
+
+    def find(self, code: str) -> int:
+        """Row of ``code`` (with or without the dot), or -1: one binary search."""
+        key = _normalize(code).encode("ascii", "ignore")
+        if not key or len(key) > CODE_WIDTH:
+            return -1
+        row = int(np.searchsorted(self.codes, key))
+        return row if row < len(self.codes) and self.codes[row] == key else -1
+
+    def code_range(self, start: str, end: str) -> Tuple[int, int]:
+        """Rows [lo, hi) of codes with start <= code < end (normalized)."""
+        lo = int(np.searchsorted(self.codes, _normalize(start).encode("ascii", "ignore"), side="left"))
+        hi = int(np.searchsorted(self.codes, _normalize(end).encode("ascii", "ignore"), side="left"))
+        return lo, max(lo, hi)
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        """Rows [lo, hi) of every code starting with ``prefix``."""
+        key = _normalize(prefix).encode("ascii", "ignore")
+        lo = int(np.searchsorted(self.codes, key, side="left"))
+        hi = int(np.searchsorted(self.codes, key + b"\xff", side="left"))
+        return lo, hi
+
+    def code(self, row: int) -> str:
+        return self.codes[row].decode("ascii")
+
+    def billable(self, row: int) -> bool:
+        return bool(self.flags[row] & BILLABLE)
+
+    def order(self, row: int) -> int:
+        return int(self.orders[row])
+
+    def long_description(self, row: int) -> str:
+        return self._text(2 * row + 1)
+
+    def short_description(self, row: int) -> str:
+        return self._text(2 * row) or self.long_description(row)
+
+    def entry(self, row: int) -> CodeEntry:
+        return CodeEntry(self.code(row), self.long_description(row), self.short_description(row),
+                         self.billable(row), self.order(row))
+
+    def lookup(self, code: str) -> Optional[str]:
+        row = self.find(code)
+        return self.long_description(row) if row >= 0 else None
+
+    def items(self, lo: int = 0, hi: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+        """(code, long description) for rows [lo, hi), in sorted order."""
+        for row in range(lo, len(self) if hi is None else hi):
+            yield self.code(row), self.long_description(row)
+
+    def entries(self) -> List[CodeEntry]:
+        return [self.entry(row) for row in range(len(self))]
+
+    def _text(self, slot: int) -> str:
+        start = self._blob + int(self.offsets[slot])
+        end = self._blob + int(self.offsets[slot + 1])
+        return bytes(self._buffer[start:end]).decode("utf-8")
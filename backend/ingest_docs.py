@@ -1,14 +1,25 @@
 import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from langchain_community.document_loaders import TextLoader, PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_community.embeddings import SentenceTransformerEmbeddings
+from embedding_backends import EmbeddingSettings
+from embedding_service import open_ingest_store
+from named_collections import DOCUMENTS_COLLECTION, LEGACY_COLLECTION, validate_name
 
 # --- Constants ---
 # Re-using the same configuration as the main backend app for consistency.
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_SETTINGS = EmbeddingSettings()
+EMBEDDING_MODEL_NAME = EMBEDDING_SETTINGS.embedding_model_name
 CHROMA_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "chroma_db")
 SOURCE_DOCS_PATH = os.path.join(os.path.dirname(__file__), "..", "data")
+BATCH_SIZE = 500  # Chunks per embedding/write batch
+# Manifest of ingests into the single "langchain" collection, before collections were named.
+LEGACY_MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "ingest_manifest.json")
+# ICD-10 source files live in data/ too but have their own collection (ingest_icd10_optimized.py).
+ICD10_FILES = {"icd10_database.txt", "icd10cm_official_raw.txt"}
 
 # --- Supported File Loaders ---
 # Maps file extensions to their corresponding LangChain loader class.
@@ -17,63 +28,265 @@ LOADER_MAPPING = {
     ".pdf": PyPDFLoader,
 }
 
-def main():
+
+def manifest_path(collection: str) -> str:
     """
-    Scans the SOURCE_DOCS_PATH for .txt and .pdf files,
-    processes them, and ingests them into the ChromaDB vector store.
+    Each collection records what has already been ingested into it:
+    path -> size, mtime, hash, chunk IDs.
+    """
+    return os.path.join(os.path.dirname(__file__), "..", "data", f"ingest_manifest.{collection}.json")
+
+
+def load_manifest(path: str) -> dict:
+    """Load the ingest manifest, or start a fresh one."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest: dict, path: str) -> None:
+    """Write the manifest atomically so an interrupted run never corrupts it."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def migrate_legacy_manifest(collections) -> int:
+    """
+    Retire the manifest written before collections were named. The chunks it
+    lists are deleted from the legacy "langchain" collection (dropped once
+    empty) and the manifest is removed, so the files are re-ingested into
+    their own collection (mostly from the embedding cache) instead of
+    leaving a second copy of every chunk behind. Returns the chunks deleted.
+    """
+    if not os.path.exists(LEGACY_MANIFEST_PATH):
+        return 0
+    chunk_ids = [chunk_id for entry in load_manifest(LEGACY_MANIFEST_PATH).values() for chunk_id in entry["chunk_ids"]]
+    if chunk_ids and collections.exists(LEGACY_COLLECTION):
+        legacy = collections.collection(LEGACY_COLLECTION)
+        legacy.delete(ids=chunk_ids)
+        if legacy.count():
+            collections.lexical(LEGACY_COLLECTION).remove(chunk_ids)
+            collections.save(LEGACY_COLLECTION)
+        else:
+            collections.drop(LEGACY_COLLECTION)
+    os.remove(LEGACY_MANIFEST_PATH)
+    return len(chunk_ids)
+
+
+def file_sha256(file_path: str) -> str:
+    """Hash a file in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_and_split(file_path: str) -> list:
+    """
+    Load one file and split it into chunks. Runs inside pool workers, so it
+    builds its own splitter and returns plain (picklable) Documents.
     """
-    print("--- Shadow OS Ingestion Script ---")
-    
-    # --- Initialize Core Components ---
-    print(f"Initializing embedding model '{EMBEDDING_MODEL_NAME}'...")
-    embedding_function = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-    
-    print(f"Connecting to vector store at '{CHROMA_DB_PATH}'...")
-    vectorstore = Chroma(
-        persist_directory=CHROMA_DB_PATH,
-        embedding_function=embedding_function
-    )
-    
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=500,
         chunk_overlap=50,
         length_function=len
     )
-    
-    # --- Scan and Process Files ---
-    documents_to_ingest = []
-    for filename in os.listdir(SOURCE_DOCS_PATH):
-        file_path = os.path.join(SOURCE_DOCS_PATH, filename)
-        file_ext = os.path.splitext(filename)[1].lower()
+    # Select the appropriate loader based on the file extension.
+    loader_class = LOADER_MAPPING[os.path.splitext(file_path)[1].lower()]
+    return loader_class(file_path).load_and_split(text_splitter)
+
 
-        if file_ext in LOADER_MAPPING:
-            print(f"Found supported file: '{filename}'")
+def iter_loaded(jobs: list, workers: int):
+    """
+    Yield (job, docs, error) as files finish loading. With more than one
+    worker the files are fanned out over a process pool, keeping at most
+    two files in flight per worker so memory stays bounded.
+    """
+    if workers <= 1:
+        for job in jobs:
             try:
-                # Select the appropriate loader based on the file extension.
-                loader_class = LOADER_MAPPING[file_ext]
-                loader = loader_class(file_path)
-                
-                # Load and split the document into chunks.
-                docs = loader.load_and_split(text_splitter)
-                documents_to_ingest.extend(docs)
-                print(f"  - Loaded and split into {len(docs)} chunks.")
-                
+                yield job, load_and_split(job["path"]), None
             except Exception as e:
-                print(f"  - ERROR: Failed to process '{filename}': {e}")
-        
-    # --- Ingest into ChromaDB ---
-    if not documents_to_ingest:
-        print("\nNo new documents to ingest.")
+                yield job, None, e
         return
 
-    print(f"\nIngesting a total of {len(documents_to_ingest)} chunks into ChromaDB...")
+    pending_jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        for job in pending_jobs:
+            in_flight[pool.submit(load_and_split, job["path"])] = job
+            if len(in_flight) >= workers * 2:
+                break
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = in_flight.pop(future)
+                try:
+                    yield job, future.result(), None
+                except Exception as e:
+                    yield job, None, e
+                next_job = next(pending_jobs, None)
+                if next_job is not None:
+                    in_flight[pool.submit(load_and_split, next_job["path"])] = next_job
+
+
+def main(workers: int = 1, collection_name: str = DOCUMENTS_COLLECTION):
+    """
+    Scans the SOURCE_DOCS_PATH for .txt and .pdf files and brings the named
+    ChromaDB collection in line with it: new files are added, changed files
+    have their old chunks replaced, deleted files have their chunks
+    removed, and unchanged files are skipped. Other collections are not
+    touched.
+    """
+    print("--- Shadow OS Ingestion Script ---")
+
+    # --- Initialize Core Components ---
+    # With EMBEDDING_SERVICE_SOCKET set, embedding and every write go through the shared service.
+    if EMBEDDING_SETTINGS.embedding_service_socket:
+        print(f"Connecting to the embedding service at '{EMBEDDING_SETTINGS.embedding_service_socket}'...")
+    else:
+        print(f"Initializing embedding model '{EMBEDDING_MODEL_NAME}' ({EMBEDDING_SETTINGS.embedding_backend})...")
     try:
-        # The add_documents method handles embedding and storage.
-        vectorstore.add_documents(documents_to_ingest, persist_directory=CHROMA_DB_PATH)
-        print("--- Ingestion Complete ---")
-    except Exception as e:
-        print(f"--- ERROR: Failed to ingest documents: {e} ---")
+        embedding_function, collections = open_ingest_store(EMBEDDING_SETTINGS, CHROMA_DB_PATH, SOURCE_DOCS_PATH)
+    except (RuntimeError, OSError) as e:
+        print(f"ERROR: {e}")
+        return
 
-if __name__ == "__main__":
-    main()
+    print(f"Connecting to collection '{collection_name}'...")
+    collection = collections.collection(collection_name, create=True)
+
+    migrated = migrate_legacy_manifest(collections)
+    if migrated:
+        print(f"Removed {migrated} chunks of the pre-collections manifest from '{LEGACY_COLLECTION}'.")
+
+    # The BM25 side of hybrid retrieval is kept in step with every Chroma write.
+    lexical_index = collections.lexical(collection_name)
+
+    manifest_file = manifest_path(collection_name)
+    manifest = load_manifest(manifest_file)
+    summary = {"added": 0, "updated": 0, "removed": 0, "unchanged_files": 0}
+    seen = set()
+    jobs = []
+
+    # --- Scan for New and Changed Files ---
+    for filename in sorted(os.listdir(SOURCE_DOCS_PATH)):
+        file_path = os.path.join(SOURCE_DOCS_PATH, filename)
+        file_ext = os.path.splitext(filename)[1].lower()
 
+        if file_ext not in LOADER_MAPPING or filename in ICD10_FILES or not os.path.isfile(file_path):
+            continue
+        seen.add(filename)
+
+        stat = os.stat(file_path)
+        entry = manifest.get(filename)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            summary["unchanged_files"] += 1
+            continue
+
+        content_hash = file_sha256(file_path)
+        if entry and entry["hash"] == content_hash:
+            # Touched but not modified: refresh the stat fields only.
+            entry.update(size=stat.st_size, mtime=stat.st_mtime)
+            summary["unchanged_files"] += 1
+            continue
+
+        print(f"{'Changed' if entry else 'New'} file: '{filename}'")
+        jobs.append({
+            "filename": filename,
+            "path": file_path,
+            "entry": {"size": stat.st_size, "mtime": stat.st_mtime, "hash": content_hash},
+        })
+    save_manifest(manifest, manifest_file)
+
+    # --- Load/Split in Parallel, Embed/Write in Large Batches ---
+    batch = []  # (job, docs, chunk_ids) waiting for the writer
+
+    def flush():
+        docs = [doc for _, file_docs, _ in batch for doc in file_docs]
+        ids = [chunk_id for _, _, file_ids in batch for chunk_id in file_ids]
+        stale_ids = [
+            chunk_id for job, _, _ in batch
+            for chunk_id in manifest.get(job["filename"], {}).get("chunk_ids", [])
+        ]
+        try:
+            if stale_ids:
+                collection.delete(ids=stale_ids)
+                lexical_index.remove(stale_ids)
+            if docs:
+                texts = [doc.page_content for doc in docs]
+                embeddings = embedding_function.embed_documents(texts)
+                collection.upsert(
+                    ids=ids, embeddings=embeddings, documents=texts, metadatas=[doc.metadata or None for doc in docs]
+                )
+                lexical_index.add(ids, texts)
+                collections.observe(collection_name, embeddings)
+        except Exception as e:
+            print(f"  - ERROR: Failed to write batch of {len(docs)} chunks: {e}")
+            batch.clear()
+            return
+        summary["removed"] += len(stale_ids)
+        for job, file_docs, file_ids in batch:
+            summary["updated" if job["filename"] in manifest else "added"] += len(file_docs)
+            manifest[job["filename"]] = {**job["entry"], "chunk_ids": file_ids}
+        collections.save(collection_name)
+        save_manifest(manifest, manifest_file)
+        batch.clear()
+
+    if jobs:
+        print(f"\nLoading {len(jobs)} file(s) with {max(workers, 1)} worker(s)...")
+    for job, docs, error in iter_loaded(jobs, workers):
+        if error is not None:
+            print(f"  - ERROR: Failed to process '{job['filename']}': {error}")
+            continue
+        print(f"  - '{job['filename']}': {len(docs)} chunks.")
+        # Deterministic IDs make a re-run after a crash an upsert, not a duplicate.
+        chunk_ids = [f"{job['filename']}:{job['entry']['hash'][:16]}:{i}" for i in range(len(docs))]
+        batch.append((job, docs, chunk_ids))
+        if sum(len(file_docs) for _, file_docs, _ in batch) >= BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+
+    # --- Drop Vectors of Deleted Files ---
+    for filename in sorted(set(manifest) - seen):
+        print(f"Removed file: '{filename}'")
+        chunk_ids = manifest[filename]["chunk_ids"]
+        try:
+            if chunk_ids:
+                collection.delete(ids=chunk_ids)
+                lexical_index.remove(chunk_ids)
+            summary["removed"] += len(chunk_ids)
+            del manifest[filename]
+            collections.save(collection_name)
+            save_manifest(manifest, manifest_file)
+        except Exception as e:
+            print(f"  - ERROR: Failed to remove chunks of '{filename}': {e}")
+
+    print("\n--- Ingestion Summary ---")
+    print(f"  Chunks added:   {summary['added']}")
+    print(f"  Chunks updated: {summary['updated']}")
+    print(f"  Chunks removed: {summary['removed']}")
+    print(f"  Unchanged files skipped: {summary['unchanged_files']}")
+    if hasattr(embedding_function, "stats"):  # The shared service reports its own cache.
+        stats = embedding_function.stats()
+        print(f"  Embedding cache: {stats['hits']} reused, {stats['encoded']} newly encoded.")
+    print("--- Ingestion Complete ---")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest data/ documents into the Shadow OS vector store.")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Processes used to load and split files (default: 1, no pool).",
+    )
+    parser.add_argument(
+        "--collection", type=validate_name, default=DOCUMENTS_COLLECTION,
+        help=f"Collection to sync with data/ (default: {DOCUMENTS_COLLECTION}).",
+    )
+    args = parser.parse_args()
+    main(workers=args.workers, collection_name=args.collection)
@@ -8,24 +8,113 @@ EFFICIENCY OPTIMIZATIONS:
 3. Batch processing for faster ingestion
 4. Minimal chunk overlap to reduce redundancy
 5. Pre-filters unnecessary formatting/headers
+6. Persistent embedding cache - rebuilds only encode chunks not seen before
+7. Streaming pipeline - parse, embed and write overlap in constant memory
+8. Own "icd10" collection - rebuilt without touching uploads or other corpora
 """
-import os
+import argparse
 import re
 import time
+import uuid
+import queue
+import threading
+from contextlib import contextmanager
+from itertools import groupby, islice
 from pathlib import Path
-from langchain_chroma import Chroma
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain_core.documents import Document
+from typing import Iterable, Iterator, Optional, Tuple
+from embedding_backends import EmbeddingSettings
+from embedding_service import open_ingest_store
+from icd10_index import format_code
+from icd10_table import ICD10Table
+from named_collections import ICD10_COLLECTION, LocalCollections, validate_name
 
 # --- Configuration ---
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_SETTINGS = EmbeddingSettings()  # EMBEDDING_BACKEND=onnx-int8 speeds up bulk ingest
 CHROMA_DB_PATH = Path(__file__).parent.parent / "data" / "chroma_db"
 ICD10_DATA_PATH = Path(__file__).parent.parent / "data" / "icd10_database.txt"
+ICD10_TABLE_PATH = Path(__file__).parent.parent / "data" / "icd10_codes.bin"
+DATA_DIR = Path(__file__).parent.parent / "data"
 
 # EFFICIENCY SETTINGS
 CHUNK_SIZE = 1000       # Larger chunks = fewer vectors = faster retrieval
 BATCH_SIZE = 500        # Process in large batches for speed
 MIN_CHUNK_LENGTH = 50   # Skip tiny chunks
+PIPELINE_DEPTH = 2      # Batches buffered between pipeline stages
+STAGE_PUT_TIMEOUT = 0.5  # Seconds a stage waits on a full hand-off before checking for a stop
+
+# Medical category names for better context
+CATEGORY_NAMES = {
+    'A': 'Infectious diseases', 'B': 'Infectious diseases',
+    'C': 'Neoplasms (Cancer)', 'D': 'Blood diseases and Neoplasms',
+    'E': 'Endocrine, nutritional and metabolic diseases',
+    'F': 'Mental and behavioral disorders',
+    'G': 'Nervous system diseases',
+    'H': 'Eye and ear diseases',
+    'I': 'Circulatory system diseases',
+    'J': 'Respiratory system diseases',
+    'K': 'Digestive system diseases',
+    'L': 'Skin diseases',
+    'M': 'Musculoskeletal diseases',
+    'N': 'Genitourinary system diseases',
+    'O': 'Pregnancy and childbirth',
+    'P': 'Perinatal conditions',
+    'Q': 'Congenital malformations',
+    'R': 'Symptoms and signs',
+    'S': 'Injury', 'T': 'Injury and poisoning',
+    'V': 'External causes', 'W': 'External causes',
+    'X': 'External causes', 'Y': 'External causes',
+    'Z': 'Health services encounters'
+}
+
+CATEGORY_HEADER = re.compile(r'Category ([A-Z0-9]+)')
+
+
+def iter_icd10_codes(lines: Iterable[str]) -> Iterator[Tuple[str, str, str]]:
+    """
+    Stream (category, code, description) entries from ICD-10 text lines,
+    holding only the current line and the code awaiting its description.
+    """
+    current_category = None
+    pending_code = None
+
+    for raw in lines:
+        line = raw.strip()
+
+        # Track category headers
+        if line.startswith('--- Category'):
+            match = CATEGORY_HEADER.search(line)
+            if match:
+                current_category = match.group(1)
+
+        # A description belongs to the code on the line right before it
+        if pending_code is not None and line.startswith('Description:'):
+            desc = line.replace('Description:', '').strip()
+            yield current_category or pending_code[:3], pending_code, desc
+
+        pending_code = line.replace('Code:', '').strip() if line.startswith('Code:') else None
+
+
+def iter_table_codes(table: ICD10Table) -> Iterator[Tuple[str, str, str]]:
+    """(category, code, description) entries from the binary code table, in code order."""
+    for code, desc in table.items():
+        yield code[:3], format_code(code), desc
+
+
+@contextmanager
+def open_code_source():
+    """
+    Stream ICD-10 entries from the memory-mapped code table when it has been
+    built, else parse them from the formatted text file.
+    """
+    if ICD10_TABLE_PATH.exists():
+        table = ICD10Table.open(ICD10_TABLE_PATH)
+        try:
+            yield iter_table_codes(table)
+        finally:
+            table.close()
+    else:
+        with open(ICD10_DATA_PATH, encoding='utf-8') as lines:
+            yield iter_icd10_codes(lines)
 
 
 def parse_icd10_codes(content: str) -> dict:
@@ -34,40 +123,35 @@ def parse_icd10_codes(content: str) -> dict:
     Returns dict: {category: [(code, description), ...]}
     """
     categories = {}
-    current_category = None
+    for category, code, desc in iter_icd10_codes(content.split('\n')):
+        categories.setdefault(category, []).append((code, desc))
+    return categories
+
 
-    # Pattern to match code entries
-    code_pattern = re.compile(r'^Code:\s*([A-Z0-9.]+)\s*$', re.MULTILINE)
-    desc_pattern = re.compile(r'^Description:\s*(.+)\s*$', re.MULTILINE)
+def category_chunks(category: str, codes: Iterable[Tuple[str, str]]) -> Iterator[str]:
+    """
+    Yield the chunks for one category: its codes grouped under a category
+    header, each chunk up to CHUNK_SIZE chars.
+    """
+    # Get category context
+    letter = category[0] if category else 'X'
+    cat_name = CATEGORY_NAMES.get(letter, 'Medical codes')
 
-    lines = content.split('\n')
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
+    current_chunk = f"ICD-10 Category {category} - {cat_name}:\n"
+    for code, desc in codes:
+        entry = f"{code}: {desc}\n"
 
-        # Track category headers
-        if line.startswith('--- Category'):
-            match = re.search(r'Category ([A-Z0-9]+)', line)
-            if match:
-                current_category = match.group(1)
-                if current_category not in categories:
-                    categories[current_category] = []
-
-        # Extract code entries
-        if line.startswith('Code:'):
-            code = line.replace('Code:', '').strip()
-            # Look for description on next line
-            if i + 1 < len(lines):
-                next_line = lines[i + 1].strip()
-                if next_line.startswith('Description:'):
-                    desc = next_line.replace('Description:', '').strip()
-                    cat = current_category or code[:3]
-                    if cat not in categories:
-                        categories[cat] = []
-                    categories[cat].append((code, desc))
-        i += 1
+        # If adding this entry exceeds chunk size, emit current and start new
+        if len(current_chunk) + len(entry) > CHUNK_SIZE:
+            if len(current_chunk) > MIN_CHUNK_LENGTH:
+                yield current_chunk.strip()
+            current_chunk = f"ICD-10 Category {category} - {cat_name} (continued):\n"
 
-    return categories
+        current_chunk += entry
+
+    # Don't forget the last chunk
+    if len(current_chunk) > MIN_CHUNK_LENGTH:
+        yield current_chunk.strip()
 
 
 def create_optimized_chunks(categories: dict) -> list:
@@ -76,75 +160,119 @@ def create_optimized_chunks(categories: dict) -> list:
     This improves semantic matching for medical queries.
     """
     chunks = []
+    for category, codes in sorted(categories.items()):
+        chunks.extend(category_chunks(category, codes))
+    return chunks
 
-    # Medical category names for better context
-    category_names = {
-        'A': 'Infectious diseases', 'B': 'Infectious diseases',
-        'C': 'Neoplasms (Cancer)', 'D': 'Blood diseases and Neoplasms',
-        'E': 'Endocrine, nutritional and metabolic diseases',
-        'F': 'Mental and behavioral disorders',
-        'G': 'Nervous system diseases',
-        'H': 'Eye and ear diseases',
-        'I': 'Circulatory system diseases',
-        'J': 'Respiratory system diseases',
-        'K': 'Digestive system diseases',
-        'L': 'Skin diseases',
-        'M': 'Musculoskeletal diseases',
-        'N': 'Genitourinary system diseases',
-        'O': 'Pregnancy and childbirth',
-        'P': 'Perinatal conditions',
-        'Q': 'Congenital malformations',
-        'R': 'Symptoms and signs',
-        'S': 'Injury', 'T': 'Injury and poisoning',
-        'V': 'External causes', 'W': 'External causes',
-        'X': 'External causes', 'Y': 'External causes',
-        'Z': 'Health services encounters'
-    }
 
-    for category, codes in sorted(categories.items()):
-        if not codes:
-            continue
+def iter_chunks(entries: Iterable[Tuple[str, str, str]]) -> Iterator[str]:
+    """
+    Chunk a stream of (category, code, description) entries one category
+    run at a time. The ICD-10 file lists each category contiguously, so
+    this matches create_optimized_chunks without holding the whole file.
+    """
+    for category, group in groupby(entries, key=lambda entry: entry[0]):
+        yield from category_chunks(category, ((code, desc) for _, code, desc in group))
 
-        # Get category context
-        letter = category[0] if category else 'X'
-        cat_name = category_names.get(letter, 'Medical codes')
 
-        # Build chunk content
-        chunk_content = []
-        current_chunk = f"ICD-10 Category {category} - {cat_name}:\n"
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
-        for code, desc in codes:
-            entry = f"{code}: {desc}\n"
 
-            # If adding this entry exceeds chunk size, save current and start new
-            if len(current_chunk) + len(entry) > CHUNK_SIZE:
-                if len(current_chunk) > MIN_CHUNK_LENGTH:
-                    chunks.append(current_chunk.strip())
-                current_chunk = f"ICD-10 Category {category} - {cat_name} (continued):\n"
+class _StageFailed:
+    def __init__(self, error: BaseException):
+        self.error = error
 
-            current_chunk += entry
 
-        # Don't forget the last chunk
-        if len(current_chunk) > MIN_CHUNK_LENGTH:
-            chunks.append(current_chunk.strip())
+_STAGE_DONE = object()
 
-    return chunks
 
+def run_stage(items: Iterable, name: str, stop: Optional[threading.Event] = None,
+              depth: int = PIPELINE_DEPTH) -> Iterator:
+    """
+    Drive ``items`` on its own thread, handing results over a queue of
+    ``depth`` slots, so the stage runs ahead of its consumer without ever
+    buffering more than ``depth`` items. Errors are re-raised in the consumer.
+
+    ``stop`` is shared by every stage of a pipeline: it is set when a consumer
+    fails or is closed early, and a producer blocked on a full hand-off then
+    gives up instead of waiting forever for a consumer that is gone.
+    """
+    stop = stop if stop is not None else threading.Event()
+    handoff = queue.Queue(maxsize=depth)
+
+    def hand_off(item) -> bool:
+        while not stop.is_set():
+            try:
+                handoff.put(item, timeout=STAGE_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-def clear_existing_db():
-    """Clear existing ChromaDB to ensure clean ingestion."""
-    if CHROMA_DB_PATH.exists():
-        import shutil
-        print("[*] Clearing existing ChromaDB...")
+    def produce():
         try:
-            shutil.rmtree(CHROMA_DB_PATH)
-            print("[+] Database cleared.")
-        except PermissionError:
-            print("[!] Database locked - will add to existing data instead.")
+            for item in items:
+                if not hand_off(item):
+                    return
+        except BaseException as e:
+            hand_off(_StageFailed(e))
+            return
+        hand_off(_STAGE_DONE)
+
+    threading.Thread(target=produce, name=f"ingest-{name}", daemon=True).start()
+    try:
+        while True:
+            item = handoff.get()
+            if item is _STAGE_DONE:
+                return
+            if isinstance(item, _StageFailed):
+                raise item.error
+            yield item
+    except BaseException:
+        # Also covers GeneratorExit when the consumer stops iterating early.
+        stop.set()
+        raise
+
+
+def timed(items: Iterable, stage_times: dict, stage: str) -> Iterator:
+    """Add the time spent producing each item (not waiting to hand it on) to stage_times[stage]."""
+    iterator = iter(items)
+    stage_times.setdefault(stage, 0.0)
+    while True:
+        stage_start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stage_times[stage] += time.perf_counter() - stage_start
+            return
+        stage_times[stage] += time.perf_counter() - stage_start
+        yield item
+
+
+def clear_existing_collection(collections: LocalCollections, name: str):
+    """Drop the target collection (and its BM25 index) for a clean rebuild; other collections stay."""
+    if collections.exists(name):
+        print(f"[*] Clearing existing '{name}' collection...")
+        collections.drop(name)
+        print("[+] Collection cleared.")
 
 
-def main():
-    """Main optimized ingestion workflow."""
+def main(collection_name: str = ICD10_COLLECTION):
+    """
+    Main optimized ingestion workflow.
+
+    Runs as a streaming pipeline: lines are read, parsed and chunked into
+    fixed-size batches on one thread, embedded on a second, and written to
+    Chroma and the BM25 index on the main thread. Each hand-off buffers at
+    most PIPELINE_DEPTH batches, so peak memory does not grow with the size
+    of the ICD-10 file and the three stages overlap.
+    """
     start_time = time.time()
 
     print("\n" + "=" * 60)
@@ -153,68 +281,111 @@ def main():
     print("\nEfficiency optimizations enabled:")
     print(f"  - Chunk size: {CHUNK_SIZE} chars (larger = faster search)")
     print(f"  - Batch size: {BATCH_SIZE} docs")
-    print(f"  - Category grouping for semantic matching")
+    print(f"  - Embedding backend: {EMBEDDING_SETTINGS.embedding_backend}")
+    print("  - Category grouping for semantic matching")
+    print(f"  - Streaming parse / embed / write, {PIPELINE_DEPTH} batches buffered per stage")
     print()
 
-    # Step 1: Load data
-    print("[1/5] Loading ICD-10 data...")
-    if not ICD10_DATA_PATH.exists():
+    # Step 1: Check data
+    print("[1/3] Checking ICD-10 data...")
+    source_path = ICD10_TABLE_PATH if ICD10_TABLE_PATH.exists() else ICD10_DATA_PATH
+    if not source_path.exists():
         print(f"[!] ERROR: {ICD10_DATA_PATH} not found!")
         print("[!] Run the download script first.")
         return False
-
-    content = ICD10_DATA_PATH.read_text(encoding='utf-8')
-    print(f"      Loaded {len(content):,} characters")
-
-    # Step 2: Parse codes
-    print("[2/5] Parsing ICD-10 codes by category...")
-    categories = parse_icd10_codes(content)
-    total_codes = sum(len(codes) for codes in categories.values())
-    print(f"      Found {total_codes:,} codes in {len(categories)} categories")
-
-    # Step 3: Create optimized chunks
-    print("[3/5] Creating optimized chunks...")
-    chunks = create_optimized_chunks(categories)
-    print(f"      Created {len(chunks):,} optimized chunks")
-    print(f"      Average chunk size: {sum(len(c) for c in chunks) // len(chunks)} chars")
-
-    # Step 4: Clear and initialize ChromaDB
-    print("[4/5] Initializing ChromaDB...")
-    clear_existing_db()
-
-    embedding_function = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-    vectorstore = Chroma(
-        persist_directory=str(CHROMA_DB_PATH),
-        embedding_function=embedding_function
-    )
-
-    # Step 5: Batch ingest
-    print(f"[5/5] Ingesting {len(chunks):,} chunks in batches of {BATCH_SIZE}...")
-
-    documents = [Document(page_content=chunk, metadata={"source": "ICD-10-CM"}) for chunk in chunks]
-
-    total_batches = (len(documents) + BATCH_SIZE - 1) // BATCH_SIZE
-    for i in range(0, len(documents), BATCH_SIZE):
-        batch = documents[i:i + BATCH_SIZE]
-        batch_num = (i // BATCH_SIZE) + 1
-        vectorstore.add_documents(batch)
-        print(f"      Batch {batch_num}/{total_batches} complete ({len(batch)} docs)")
+    print(f"      Streaming {source_path.stat().st_size:,} bytes from {source_path.name}")
+
+    # Step 2: Clear and initialize the collection
+    print(f"[2/3] Initializing ChromaDB collection '{collection_name}'...")
+    # Through the embedding service when EMBEDDING_SERVICE_SOCKET is set, so writes stay serialized.
+    # The embedding cache lives outside CHROMA_DB_PATH, so re-encoding after a clear is skipped.
+    try:
+        embedding_function, collections = open_ingest_store(EMBEDDING_SETTINGS, CHROMA_DB_PATH, DATA_DIR)
+    except (RuntimeError, OSError) as e:
+        print(f"[!] ERROR: {e}")
+        return False
+    clear_existing_collection(collections, collection_name)
+    collection = collections.collection(collection_name, create=True)
+    # The collection was just dropped, so its BM25 index starts empty too.
+    lexical_index = collections.lexical(collection_name)
+
+    # Step 3: Stream parse -> chunk -> embed -> write
+    print(f"[3/3] Streaming chunks in batches of {BATCH_SIZE}...")
+
+    # Busy seconds per stage; stages overlap, so they can add up to more than the total.
+    stage_times = {}
+    counts = {"codes": 0, "chunks": 0, "chars": 0}
+
+    def count_codes(entries):
+        for entry in entries:
+            counts["codes"] += 1
+            yield entry
+
+    def embed_batches(batches):
+        for batch in batches:
+            stage_start = time.perf_counter()
+            embeddings = embedding_function.embed_documents(batch)
+            stage_times["embed"] += time.perf_counter() - stage_start
+            yield batch, embeddings
+
+    stage_times.update(parse=0.0, embed=0.0, write=0.0)
+    # Set on the way out so neither stage thread is left blocked if a write fails.
+    stop = threading.Event()
+    with open_code_source() as entries:
+        chunks = iter_chunks(count_codes(entries))
+        batches = run_stage(timed(batched(chunks, BATCH_SIZE), stage_times, "parse"), "parse", stop)
+        try:
+            for batch_num, (batch, embeddings) in enumerate(run_stage(embed_batches(batches), "embed", stop), 1):
+                stage_start = time.perf_counter()
+                ids = [str(uuid.uuid4()) for _ in batch]
+                collection.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=batch,
+                    metadatas=[{"source": "ICD-10-CM"}] * len(batch),
+                )
+                lexical_index.add(ids, batch)
+                collections.observe(collection_name, embeddings)
+                stage_times["write"] += time.perf_counter() - stage_start
+                counts["chunks"] += len(batch)
+                counts["chars"] += sum(len(chunk) for chunk in batch)
+                print(f"      Batch {batch_num} complete ({len(batch)} docs, {counts['chunks']:,} total)")
+        finally:
+            stop.set()
+    stage_start = time.perf_counter()
+    collections.save(collection_name)
+    stage_times["lexical_save"] = time.perf_counter() - stage_start
+
+    total_codes = counts["codes"]
+    if not counts["chunks"]:
+        print("[!] ERROR: no ICD-10 codes found in the data file.")
+        return False
 
     # Report results
     elapsed = time.time() - start_time
-    final_count = vectorstore._collection.count()
+    final_count = collection.count()
 
     print("\n" + "=" * 60)
     print("INGESTION COMPLETE")
     print("=" * 60)
+    print(f"  Collection: {collection_name}")
     print(f"  Total vectors: {final_count:,}")
     print(f"  Total time: {elapsed:.1f} seconds")
     print(f"  Speed: {final_count / elapsed:.0f} vectors/second")
+    print(f"  Codes parsed: {total_codes:,}")
+    print(f"  Average chunk size: {counts['chars'] // counts['chunks']} chars")
+    print()
+    print("STAGE TIMINGS (busy time; stages overlap):")
+    for stage, seconds in stage_times.items():
+        print(f"  - {stage:13} {seconds:8.2f}s ({seconds / elapsed * 100:4.1f}%)")
     print()
     print("EFFICIENCY STATS:")
     print(f"  - Original codes: {total_codes:,}")
     print(f"  - Optimized vectors: {final_count:,}")
     print(f"  - Compression ratio: {total_codes / final_count:.1f}x fewer vectors to search")
+    if hasattr(embedding_function, "stats"):  # The shared service reports its own cache.
+        cache_stats = embedding_function.stats()
+        print(f"  - Embedding cache: {cache_stats['hits']:,} reused, {cache_stats['encoded']:,} newly encoded")
     print()
     print("[+] Ready for fast medical queries!")
     print("=" * 60)
@@ -223,4 +394,9 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Ingest the ICD-10-CM codes into their own Chroma collection.")
+    parser.add_argument(
+        "--collection", type=validate_name, default=ICD10_COLLECTION,
+        help=f"Collection to rebuild (default: {ICD10_COLLECTION}). Other collections are left alone.",
+    )
+    main(parser.parse_args().collection)
@@ -0,0 +1,157 @@
+"""
+Background ingestion jobs for the Shadow OS backend.
+
+``POST /ingest/`` only saves the upload and enqueues a job; the heavy
+parse/split/embed/write work runs on a small dedicated worker pool so a
+large PDF never ties up a request or starves the query path. Progress is
+tracked on the job object and exposed through ``GET /ingest/jobs/{id}``.
+With several uvicorn workers, each job's state is also published to the
+shared embedding service, so whichever worker a poll lands on can answer it.
+"""
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Optional
+
+# Finished jobs kept around for status polling before the oldest are dropped.
+MAX_FINISHED_JOBS = 200
+FINISHED_STATUSES = ("done", "failed")
+
+
+class IngestQueueFull(Exception):
+    """Raised when too many ingests are already queued or running."""
+
+
+@dataclass
+class IngestJob:
+    filename: str
+    collection: str = ""
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued -> running -> done | failed
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    vectors_written: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class IngestJobQueue:
+    """
+    Bounded in-process ingest queue. At most ``max_concurrent`` jobs run at
+    once and at most ``max_pending`` may be waiting or running; beyond that
+    ``submit`` raises ``IngestQueueFull``.
+
+    ``shared`` (``save``/``get``/``list`` of job dicts, e.g. the embedding
+    service's ``RemoteJobs``) receives a snapshot of each job as it is
+    queued, progresses and finishes; lookups fall back to it for jobs that
+    other workers accepted.
+    """
+
+    def __init__(self, worker: Callable[..., None], max_concurrent: int = 1, max_pending: int = 16, shared=None):
+        self._worker = worker
+        self.shared = shared
+        self._max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job: IngestJob, *args) -> IngestJob:
+        """Enqueue ``job``; the worker is called as ``worker(job, *args)``."""
+        with self._lock:
+            active = self._active_count()
+            if active >= self._max_pending:
+                raise IngestQueueFull(f"{active} ingest jobs already pending.")
+            self._jobs[job.id] = job
+            self._prune()
+        self.progress(job)
+        self._executor.submit(self._run, job, args)
+        return job
+
+    def progress(self, job: IngestJob) -> None:
+        """Publish the job's current state to the shared table, if there is one."""
+        if self.shared is None:
+            return
+        try:
+            self.shared.save(job.to_dict())
+        except Exception:
+            pass  # Status reporting must never fail the ingest itself.
+
+    # Readers take the lock too: submit() inserts and _prune() deletes on request threads.
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.shared is not None:
+            snapshot = self.shared.get(job_id)
+            job = IngestJob(**snapshot) if snapshot is not None else None
+        return job
+
+    def list(self) -> list:
+        """Recent jobs of this worker (and of every worker when shared), oldest first."""
+        with self._lock:
+            jobs = {job.id: job for job in self._jobs.values()}
+        if self.shared is not None:
+            for snapshot in self.shared.list():
+                jobs.setdefault(snapshot["id"], IngestJob(**snapshot))
+        return sorted(jobs.values(), key=lambda job: job.created_at)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return self._active_count()
+
+    def _active_count(self) -> int:
+        # Caller holds self._lock.
+        return sum(1 for j in self._jobs.values() if not j.finished)
+
+    def _run(self, job: IngestJob, args: tuple) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        self.progress(job)
+        try:
+            self._worker(job, *args)
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self.progress(job)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, j in self._jobs.items() if j.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+
+class SharedJobTable:
+    """
+    Job snapshots from every worker, held by the shared embedding service.
+    Only used from the service's event loop, so it needs no lock.
+    """
+
+    def __init__(self):
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+
+    def save(self, job: dict) -> None:
+        self._jobs[job["id"]] = job
+        finished = [job_id for job_id, j in self._jobs.items() if j["status"] in FINISHED_STATUSES]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        return list(self._jobs.values())
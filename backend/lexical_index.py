@@ -0,0 +1,167 @@
+"""
+BM25 inverted index for Shadow OS hybrid retrieval.
+
+Dense MiniLM search is weak on rare medical terms and alphanumeric codes;
+an exact-term BM25 index over the same chunk IDs catches those. Results from
+both retrievers are combined with reciprocal-rank fusion.
+
+The index is updated incrementally alongside every Chroma write and persisted
+as JSON next to ``data/chroma_db``. Each process reloads it when another one
+(e.g. an ingest script) has rewritten the file.
+"""
+import os
+import re
+import json
+import math
+import heapq
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+DEFAULT_INDEX_PATH = Path(__file__).parent.parent / "data" / "lexical_index.json"
+
+# Dotted tokens ("e11.9") are kept whole so codes match exactly.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; dotted codes also yield their undotted form."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if "." in token:
+            tokens.append(token.replace(".", ""))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: score(id) = sum of 1 / (k + rank) over every list."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """Incremental BM25 (Okapi) index keyed by Chroma chunk IDs."""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, k1: float = 1.5, b: float = 0.75):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._loaded_mtime = None
+        self._reset()
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, ids: Iterable[str], texts: Iterable[str]) -> None:
+        """Index (or re-index) chunks."""
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                self._remove(doc_id)
+                counts = Counter(tokenize(text))
+                self._doc_terms[doc_id] = dict(counts)
+                self._doc_len[doc_id] = sum(counts.values())
+                self._total_len += self._doc_len[doc_id]
+                for term, tf in counts.items():
+                    self._postings[term][doc_id] = tf
+
+    def remove(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-k (chunk ID, BM25 score) pairs for the query."""
+        self.refresh_if_stale()
+        with self._lock:
+            n_docs = len(self._doc_terms)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[str, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def build_from_collection(self, collection, page_size: int = 1000) -> None:
+        """Rebuild the whole index from an existing Chroma collection."""
+        self.clear()
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=["documents"])
+            if not page["ids"]:
+                break
+            self.add(page["ids"], page["documents"])
+            offset += len(page["ids"])
+
+    def save(self) -> None:
+        """Persist atomically; postings are rebuilt from per-doc term counts on load."""
+        with self._lock:
+            payload = {"version": 1, "docs": self._doc_terms}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            self._loaded_mtime = self.path.stat().st_mtime
+
+    def load(self) -> None:
+        with self._lock:
+            self._reset()
+            try:
+                mtime = self.path.stat().st_mtime
+                with open(self.path, "r", encoding="utf-8") as f:
+                    docs = json.load(f).get("docs", {})
+            except (FileNotFoundError, json.JSONDecodeError):
+                return
+            for doc_id, counts in docs.items():
+                self._doc_terms[doc_id] = counts
+                self._doc_len[doc_id] = sum(counts.values())
+                self._total_len += self._doc_len[doc_id]
+                for term, tf in counts.items():
+                    self._postings[term][doc_id] = tf
+            self._loaded_mtime = mtime
+
+    def refresh_if_stale(self) -> None:
+        """Reload when another process has rewritten the index file."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self._loaded_mtime:
+            self.load()
+
+    def _remove(self, doc_id: str) -> None:
+        counts = self._doc_terms.pop(doc_id, None)
+        if counts is None:
+            return
+        self._total_len -= self._doc_len.pop(doc_id)
+        for term in counts:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def _reset(self) -> None:
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._total_len = 0
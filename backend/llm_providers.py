@@ -0,0 +1,300 @@
+"""
+LLM providers for the Shadow OS query pipeline.
+
+The backend talks to the model only through ``LimitedLLM``, which wraps one
+provider and adds the guard rails every call needs:
+1. A concurrency cap (semaphore) so a traffic spike never fans out into
+   unbounded parallel upstream calls
+2. A bounded wait queue; beyond it calls fail fast with ``LLMQueueFull``
+   (the API answers 429)
+3. A per-call timeout (``LLMTimeout``, answered 504)
+4. Retries with exponential backoff and full jitter for transient errors;
+   once they run out the call fails with ``LLMUnavailable`` (answered 503)
+
+Providers, chosen with LLM_PROVIDER in backend/.env:
+
+    LLM_PROVIDER=gemini   # Google Gemini (default)
+    LLM_PROVIDER=fake     # deterministic local model for load tests, no quota
+
+The fake's latency and streaming speed are configurable so load tests can
+model a real upstream.
+"""
+import abc
+import random
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Optional
+
+PROVIDERS = ("gemini", "fake")
+DEFAULT_GEMINI_MODEL = "models/gemini-pro-latest"
+
+# google.api_core exception names worth retrying (rate limits, overload, transient 5xx).
+GEMINI_TRANSIENT_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded",
+}
+
+
+class LLMQueueFull(Exception):
+    """Raised when every LLM slot is busy and the wait queue is full."""
+
+
+class LLMTimeout(Exception):
+    """Raised when an LLM call (or the wait for a slot) exceeds its timeout."""
+
+
+class LLMUnavailable(Exception):
+    """Raised when the upstream keeps failing transiently after every retry."""
+
+
+class TransientLLMError(Exception):
+    """A failure the caller may retry (used by the fake provider)."""
+
+
+@dataclass
+class LLMResponse:
+    """Generated text plus token usage; stream chunks carry cumulative usage."""
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class LLMProvider(abc.ABC):
+    """Interface every model backend implements."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def generate(self, prompt: str) -> LLMResponse:
+        """The whole answer for ``prompt``."""
+
+    @abc.abstractmethod
+    def stream(self, prompt: str) -> AsyncIterator[LLMResponse]:
+        """Async iterator of text deltas."""
+
+    def is_transient(self, error: Exception) -> bool:
+        return isinstance(error, TransientLLMError)
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str = DEFAULT_GEMINI_MODEL):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        response = await self.model.generate_content_async(prompt)
+        return LLMResponse(response.text, *_gemini_usage(response))
+
+    async def stream(self, prompt: str) -> AsyncIterator[LLMResponse]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            yield LLMResponse(_gemini_text(chunk), *_gemini_usage(chunk))
+
+    def is_transient(self, error: Exception) -> bool:
+        return type(error).__name__ in GEMINI_TRANSIENT_ERRORS
+
+
+def _gemini_text(chunk) -> str:
+    # .text raises ValueError on chunks without parts (finish-only or safety chunks).
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def _gemini_usage(response) -> tuple:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    return (getattr(usage, "prompt_token_count", 0) or 0), (getattr(usage, "candidates_token_count", 0) or 0)
+
+
+class FakeLLMProvider(LLMProvider):
+    """
+    Deterministic local model: the same prompt always yields the same
+    uppercase HUD-style answer. ``latency_ms`` is the time to first token,
+    ``token_delay_ms`` the gap between streamed words, and ``failure_rate``
+    the share of calls that raise a retryable error.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_ms: float = 200.0, token_delay_ms: float = 20.0, failure_rate: float = 0.0,
+                 seed: int = 0):
+        self.latency = latency_ms / 1000
+        self.token_delay = token_delay_ms / 1000
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def answer_for(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8].upper()
+        return f"SIMULATED RESPONSE {digest}. CONTEXT RECEIVED: {len(prompt)} CHARS. NO UPSTREAM CALL MADE."
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        await self._first_token()
+        words = self.answer_for(prompt).split(" ")
+        # Generation time scales with answer length, as it does upstream.
+        await asyncio.sleep(self.token_delay * (len(words) - 1))
+        return LLMResponse(" ".join(words), len(prompt.split()), len(words))
+
+    async def stream(self, prompt: str) -> AsyncIterator[LLMResponse]:
+        await self._first_token()
+        words = self.answer_for(prompt).split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield LLMResponse(word if i == 0 else f" {word}", len(prompt.split()), i + 1)
+
+    async def _first_token(self) -> None:
+        await asyncio.sleep(self.latency)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise TransientLLMError("Simulated upstream overload.")
+
+
+class LimitedLLM:
+    """Concurrency cap, bounded queue, per-call timeout and jittered retries around a provider."""
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        max_concurrency: int = 8,
+        max_queue: int = 32,
+        timeout: float = 30.0,
+        retries: int = 2,
+        backoff: float = 0.5,
+        on_usage: Optional[Callable[[int, int], None]] = None,
+    ):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.on_usage = on_usage
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._pending = 0  # running + waiting
+
+    @property
+    def name(self) -> str:
+        return self.provider.name
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.provider.name,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": min(self._pending, self.max_concurrency),
+            "queued": max(0, self._pending - self.max_concurrency),
+        }
+
+    async def generate(self, prompt: str) -> str:
+        async with self._slot():
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await asyncio.wait_for(self.provider.generate(prompt), timeout=self.timeout)
+                    self._record(response)
+                    return response.text
+                except asyncio.TimeoutError:
+                    raise LLMTimeout("LLM timed out.")
+                except Exception as e:
+                    if not self.provider.is_transient(e):
+                        raise
+                    if attempt == self.retries:
+                        raise LLMUnavailable(f"LLM unavailable after {attempt + 1} attempts: {e}") from e
+                await self._sleep_before_retry(attempt)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Yield text deltas. The whole generation shares one timeout, and a
+        call is only retried if it fails before its first delta.
+        """
+        async with self._slot():
+            loop = asyncio.get_running_loop()
+            for attempt in range(self.retries + 1):
+                deadline = loop.time() + self.timeout
+                chunks = self.provider.stream(prompt).__aiter__()
+                last = None
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=deadline - loop.time())
+                        except StopAsyncIteration:
+                            self._record(last)
+                            return
+                        last = chunk
+                        if chunk.text:
+                            yield chunk.text
+                except asyncio.TimeoutError:
+                    raise LLMTimeout("LLM timed out.")
+                except Exception as e:
+                    if not self.provider.is_transient(e):
+                        raise
+                    if last is not None or attempt == self.retries:
+                        raise LLMUnavailable(f"LLM unavailable after {attempt + 1} attempts: {e}") from e
+                finally:
+                    # Close the upstream stream (and its connection) before a retry or releasing the slot.
+                    await chunks.aclose()
+                await self._sleep_before_retry(attempt)
+
+    def _slot(self):
+        if self._pending >= self.max_concurrency + self.max_queue:
+            raise LLMQueueFull(f"{self._pending} LLM calls already running or queued.")
+        return _Slot(self)
+
+    async def _sleep_before_retry(self, attempt: int) -> None:
+        # Full jitter: spreads retries from concurrent callers instead of syncing them up.
+        await asyncio.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def _record(self, response: Optional[LLMResponse]) -> None:
+        if response is not None and self.on_usage is not None:
+            self.on_usage(response.prompt_tokens, response.completion_tokens)
+
+
+class _Slot:
+    """Counts the call as pending, then holds a semaphore slot (waiting at most one timeout)."""
+
+    def __init__(self, llm: LimitedLLM):
+        self.llm = llm
+
+    async def __aenter__(self):
+        self.llm._pending += 1
+        try:
+            await asyncio.wait_for(self.llm._slots.acquire(), timeout=self.llm.timeout)
+        except asyncio.TimeoutError:
+            self.llm._pending -= 1
+            raise LLMTimeout("Timed out waiting for an LLM slot.")
+        except BaseException:
+            self.llm._pending -= 1
+            raise
+
+    async def __aexit__(self, *exc):
+        self.llm._slots.release()
+        self.llm._pending -= 1
+
+
+def build_llm(config, on_usage=None) -> LimitedLLM:
+    """Build the configured provider wrapped in the concurrency limiter."""
+    if config.llm_provider not in PROVIDERS:
+        raise ValueError(f"Unknown LLM_PROVIDER '{config.llm_provider}'. Choose one of: {', '.join(PROVIDERS)}")
+    if config.llm_provider == "fake":
+        provider = FakeLLMProvider(
+            latency_ms=config.fake_llm_latency_ms,
+            token_delay_ms=config.fake_llm_token_delay_ms,
+            failure_rate=config.fake_llm_failure_rate,
+        )
+    else:
+        # You must set your GEMINI_API_KEY in a .env file in the backend directory.
+        provider = GeminiProvider(config.gemini_api_key, config.llm_model)
+    return LimitedLLM(
+        provider,
+        max_concurrency=config.llm_max_concurrency,
+        max_queue=config.llm_max_queue,
+        timeout=config.llm_timeout,
+        retries=config.llm_retries,
+        backoff=config.llm_retry_backoff,
+        on_usage=on_usage,
+    )
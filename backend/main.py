@@ -1,22 +1,91 @@
 import os
+import sys
+import json
 import shutil
 import uuid
-import google.generativeai as genai
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+import asyncio
+import time
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Depends, Query
+from fastapi.responses import StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import msgpack
 from pydantic import BaseModel
-from pydantic_settings import BaseSettings
 
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain_core.prompts import PromptTemplate
+from langchain_core.documents import Document
+
+# Make sibling backend modules importable whether this file is loaded as
+# backend.main (uvicorn from the repo root) or from inside backend/.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from answer_cache import SemanticAnswerCache  # noqa: E402
+from embedding_backends import EmbeddingSettings, build_cached_embeddings  # noqa: E402
+from ingest_jobs import IngestJob, IngestJobQueue, IngestQueueFull  # noqa: E402
+from icd10_index import ICD10CodeIndex, find_codes, is_pure_lookup  # noqa: E402
+from icd10_hierarchy import MAX_LIST_RESULTS, ICD10Hierarchy  # noqa: E402
+from lexical_index import reciprocal_rank_fusion  # noqa: E402
+from named_collections import UPLOADS_COLLECTION, LocalCollections, route_question, validate_name  # noqa: E402
+from llm_providers import LLMQueueFull, LLMTimeout, LLMUnavailable, build_llm  # noqa: E402
+from context_packing import PackedContext, pack_context  # noqa: E402
+from g2_display import current_page, paginate  # noqa: E402
+import metrics  # noqa: E402
+from metrics import StageTimer  # noqa: E402
 
 
 # --- Settings ---
 # Load settings from environment variables. Create a .env file for this.
-class Settings(BaseSettings):
-    gemini_api_key: str
+# Embedding model/backend fields are inherited from EmbeddingSettings.
+class Settings(EmbeddingSettings):
+    # Required for LLM_PROVIDER=gemini (the default).
+    gemini_api_key: str = ""
+    # LLM provider: "gemini", or "fake" for offline load tests (see llm_providers.py).
+    llm_provider: str = "gemini"
+    llm_model: str = "models/gemini-pro-latest"
+    # Upstream LLM calls in flight across all requests, and calls allowed to
+    # wait for a slot; beyond that queries fail fast with 429.
+    llm_max_concurrency: int = 8
+    llm_max_queue: int = 32
+    # Retries for rate-limit / transient upstream errors, with jittered backoff.
+    llm_retries: int = 2
+    llm_retry_backoff: float = 0.5
+    # Fake provider: time to first token, gap between streamed words, error share.
+    fake_llm_latency_ms: float = 200.0
+    fake_llm_token_delay_ms: float = 20.0
+    fake_llm_failure_rate: float = 0.0
+    # Threads dedicated to embedding + Chroma search (CPU-bound, GIL-releasing).
+    query_workers: int = 4
+    # Embedding/search calls allowed to wait for a query worker; beyond that
+    # (timed-out calls keep their worker until they finish) queries get 503.
+    retrieval_max_queue: int = 16
+    # Per-stage timeouts for the query pipeline, in seconds (LLM: per call).
+    retrieval_timeout: float = 10.0
+    llm_timeout: float = 30.0
+    # Semantic answer cache. Set ANSWER_CACHE_MAX_ENTRIES=0 to disable.
+    answer_cache_threshold: float = 0.95
+    answer_cache_max_entries: int = 1024
+    answer_cache_ttl: float = 3600.0
+    answer_cache_max_mb: int = 32
+    # Background ingestion: jobs running at once, and queued + running cap.
+    max_concurrent_ingests: int = 1
+    max_pending_ingests: int = 16
+    # Estimated tokens of retrieved context sent to the LLM (0 = no cap).
+    # Overlaps and repeated ICD-10 headers are removed before the budget applies.
+    context_token_budget: int = 600
+    # /query/batch: LLM calls in flight per batch request.
+    batch_llm_concurrency: int = 4
+    # Run one embedding + vector search at startup so the first query is warm.
+    warmup_on_startup: bool = True
+    # EMBEDDING_SERVICE_SOCKET (multi-worker deployments) is inherited too: when
+    # set, this worker uses the shared model, vector store and BM25 indexes of
+    # a running embedding_service.py instead of loading its own copies.
+    # Route each question to the collections likely to answer it (ICD-10 codes
+    # to "icd10", otherwise those whose centroid is within ROUTER_MARGIN cosine
+    # of the best). Off = every question searches every collection.
+    query_routing: bool = True
+    router_margin: float = 0.1
 
     class Config:
         env_file = os.path.join(os.path.dirname(__file__), ".env")
@@ -24,49 +93,189 @@ class Settings(BaseSettings):
 settings = Settings()
 
 # --- Constants ---
-EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_MODEL_NAME = settings.embedding_model_name
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 CHROMA_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "chroma_db")
 UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "uploads")
-G2_OUTPUT_MAX_LENGTH = 200
+ICD10_DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "icd10_database.txt")
+ICD10_TABLE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "icd10_codes.bin")
 MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50 MB
 MAX_QUESTION_LENGTH = 5000  # Chars
+MAX_BATCH_QUESTIONS = 64  # Questions per /query/batch request
+INGEST_BATCH_SIZE = 64  # Chunks embedded + written per step of an ingest job
+RETRIEVAL_K = 3  # Chunks sent to the LLM
+HYBRID_CANDIDATES = 10  # Candidates taken from each retriever before fusion
+# Fields a /query/ response can carry; ?fields= selects a subset.
+QUERY_FIELDS = (
+    "full_answer", "g2_output", "g2_pages", "context_used", "context_packing", "cached", "code_lookup",
+    "collections", "timings",
+)
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# --- Heavy Components ---
+# Populated in the background by _load_components() once the app has started,
+# so the process answers "/" and "/status/" immediately after boot. Endpoints
+# that need them depend on _require_ready and return 503 until then.
+llm = None
+embedding_function = None
+collections = None
+code_index = None
+code_hierarchy = None
+text_splitter = None
+
+startup_state = {
+    "ready": False,
+    "error": None,
+    "started_at": time.time(),
+    "ready_at": None,
+    "timings_ms": {},
+}
+
+
+def _timed(stage: str, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    startup_state["timings_ms"][stage] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def _load_llm():
+    if settings.llm_provider == "gemini" and not settings.gemini_api_key:
+        raise RuntimeError("GEMINI_API_KEY is not set. Add it to backend/.env or set LLM_PROVIDER=fake.")
+    return build_llm(settings, on_usage=metrics.record_llm_usage)
+
+
+def _open_collections():
+    # One Chroma collection + BM25 index per corpus; centroids feed the router.
+    local = LocalCollections(CHROMA_DB_PATH, DATA_DIR)
+    local.backfill_centroids()
+    return local
+
+
+def _load_lexical_indexes() -> None:
+    # Each index mirrors its collection by chunk ID; fused with dense results at query time.
+    for name in collections.names():
+        collections.lexical(name)
+
+
+def _connect_embedding_service():
+    from embedding_service import ServiceClient, RemoteEmbeddings, RemoteCollections, RemoteJobs
+
+    # Writes from any worker bump the service generation; drop our cached answers when we see one.
+    client = ServiceClient(
+        settings.embedding_service_socket,
+        timeout=max(settings.retrieval_timeout, settings.llm_timeout),
+        on_generation=answer_cache.invalidate,
+    )
+    client.call("ping")
+    return RemoteEmbeddings(client), RemoteCollections(client), RemoteJobs(client)
+
+
+def _build_text_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=500,
+        chunk_overlap=50,
+        length_function=len
+    )
+
+
+def _warm_up() -> None:
+    """Page in the model weights and the HNSW index before real traffic."""
+    vector = embedding_function.embed_query("warm-up")
+    for name in collections.names():
+        collections.collection(name).query(query_embeddings=[vector], n_results=1)
+
+
+def _load_components() -> None:
+    """Load every heavy component in dependency order, timing each stage."""
+    global llm, embedding_function, collections, code_index, code_hierarchy, text_splitter
+
+    llm = _timed("llm", _load_llm)
+    if settings.embedding_service_socket:
+        # Job state goes to the service as well, so any worker can answer a status poll.
+        embedding_function, collections, ingest_queue.shared = _timed("embedding_service", _connect_embedding_service)
+    else:
+        # Backend (torch / onnx / onnx-int8) comes from EMBEDDING_BACKEND. Document
+        # vectors are cached on disk, so re-uploading known text skips the model.
+        embedding_function = _timed("embedding_model", build_cached_embeddings, settings)
+        collections = _timed("vector_store", _open_collections)
+        _timed("lexical_index", _load_lexical_indexes)
+    # Exact code lookups ("what is E11.9") are answered from here, no vector search.
+    code_index = _timed("icd10_index", ICD10CodeIndex.from_file, ICD10_DATA_PATH, ICD10_TABLE_PATH)
+    code_hierarchy = ICD10Hierarchy(code_index.table)
+    text_splitter = _timed("text_splitter", _build_text_splitter)
+    if settings.warmup_on_startup:
+        _timed("warmup", _warm_up)
+
+
+async def _load_components_async() -> None:
+    try:
+        await asyncio.to_thread(_load_components)
+        startup_state["ready"] = True
+        startup_state["ready_at"] = time.time()
+    except Exception as e:
+        startup_state["error"] = f"{type(e).__name__}: {e}"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loader = asyncio.create_task(_load_components_async())
+    yield
+    loader.cancel()
+    query_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _require_ready() -> None:
+    """Dependency for endpoints that need the model, vector store and indexes."""
+    if not startup_state["ready"]:
+        detail = startup_state["error"] or "Backend is still loading. Retry shortly."
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "2"})
 
-# --- Generative AI Configuration ---
-# You must set your GEMINI_API_KEY in a .env file in the backend directory.
-genai.configure(api_key=settings.gemini_api_key)
-llm = genai.GenerativeModel('models/gemini-pro-latest')
 
 # --- FastAPI App Initialization ---
 app = FastAPI(
     title="Shadow OS Backend",
     description="API for ingesting data and streaming intelligence to G2 glasses.",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
-# --- Embedding Function ---
-embedding_function = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+# --- Query Executor ---
+# Retrieval runs on its own bounded pool so queries never compete with
+# Starlette's shared threadpool; the LLM call itself is awaited natively.
+query_executor = ThreadPoolExecutor(max_workers=settings.query_workers, thread_name_prefix="query")
+# One permit per call submitted to the pool, released only when its thread
+# finishes, so abandoned (timed-out) work still counts against the limit.
+query_slots = threading.BoundedSemaphore(settings.query_workers + settings.retrieval_max_queue)
 
-# --- ChromaDB Initialization ---
-vectorstore = Chroma(
-    persist_directory=CHROMA_DB_PATH,
-    embedding_function=embedding_function
-)
-
-# --- Text Processing Configuration ---
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,
-    chunk_overlap=50,
-    length_function=len
+# --- Semantic Answer Cache ---
+# Repeated questions are answered from here without retrieval or an LLM call.
+answer_cache = SemanticAnswerCache(
+    threshold=settings.answer_cache_threshold,
+    max_entries=settings.answer_cache_max_entries,
+    ttl_seconds=settings.answer_cache_ttl,
+    max_bytes=settings.answer_cache_max_mb * 1024 * 1024,
 )
 
 # --- API Models ---
 class QueryRequest(BaseModel):
     question: str
+    # Include a per-stage "timings" block (ms) in the /query/ response.
+    debug: bool = False
+    # Search only these collections; omitted = chosen per question by the router.
+    collections: Optional[List[str]] = None
 
     class Config:
         max_length = MAX_QUESTION_LENGTH
 
 
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    collections: Optional[List[str]] = None
+
+
 def _ensure_upload_dir() -> None:
     """Guarantee uploads directory exists."""
     os.makedirs(UPLOADS_DIR, exist_ok=True)
@@ -74,14 +283,40 @@ def _ensure_upload_dir() -> None:
 
 def _count_vectors() -> int:
     """
-    Return approximate vector count in the collection.
-    Uses the underlying Chroma collection count for speed.
+    Return approximate vector count across every collection.
+    Uses the Chroma collection counts directly for speed.
     """
     try:
-        return vectorstore._collection.count()  # type: ignore[attr-defined]
+        return sum(collections.counts().values())
     except Exception:
         return 0
 
+
+def _check_collections(names: Optional[List[str]]) -> Optional[List[str]]:
+    """Validate collections named in a query; None means "let the router choose"."""
+    if names is None:
+        return None
+    if not names:
+        raise HTTPException(status_code=400, detail="collections must name at least one collection.")
+    unknown = [name for name in names if not collections.exists(name)]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown collections: {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+
+def _embedding_cache_hit_ratio() -> float:
+    # Only the local CachedEmbeddings keeps counters; the shared service reports its own.
+    stats = getattr(embedding_function, "stats", None)
+    if stats is None:
+        return 0.0
+    counts = stats()
+    total = counts["hits"] + counts["encoded"]
+    return counts["hits"] / total if total else 0.0
+
+
+metrics.VECTORS.set_function(_count_vectors)
+metrics.EMBEDDING_CACHE_HIT_RATIO.set_function(_embedding_cache_hit_ratio)
+
 # --- RAG Prompt Template ---
 # This template is key. It instructs the LLM to synthesize an answer
 # from the retrieved context.
@@ -104,11 +339,87 @@ RESPONSE:
 rag_prompt = PromptTemplate.from_template(rag_template)
 
 
-@app.post("/ingest/")
-async def ingest_file(file: UploadFile = File(...)):
+def _save_upload(source, destination: str) -> None:
+    with open(destination, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+
+
+def _run_ingest_job(job: IngestJob, file_path: str, ext: str, name: str) -> None:
     """
-    Handles .txt and .pdf uploads, processes them, and stores chunks in ChromaDB.
+    Parse, split, embed and write one uploaded file into collection
+    ``name``, updating the job's progress counters as each stage advances.
+    Runs on the ingest pool.
     """
+    from langchain_community.document_loaders import TextLoader, PyPDFLoader
+
+    timer = StageTimer("ingest")
+    try:
+        with timer.stage("total"):
+            loader = TextLoader(file_path, encoding="utf-8") if ext == ".txt" else PyPDFLoader(file_path)
+            documents = []
+            with timer.stage("parse"):
+                for page in loader.lazy_load():
+                    documents.append(page)
+                    job.pages_parsed += 1
+
+            with timer.stage("split"):
+                docs = text_splitter.split_documents(documents)
+            job.chunks_total = len(docs)
+            ingest_queue.progress(job)
+
+            collection = collections.collection(name, create=True)
+            lexical_index = collections.lexical(name)
+            for i in range(0, len(docs), INGEST_BATCH_SIZE):
+                batch = docs[i:i + INGEST_BATCH_SIZE]
+                texts = [doc.page_content for doc in batch]
+                with timer.stage("embedding"):
+                    embeddings = embedding_function.embed_documents(texts)
+                job.chunks_embedded += len(batch)
+
+                ids = [str(uuid.uuid4()) for _ in batch]
+                with timer.stage("vector_write"):
+                    collection.upsert(
+                        ids=ids,
+                        embeddings=embeddings,
+                        documents=texts,
+                        metadatas=[doc.metadata or None for doc in batch],
+                    )
+                with timer.stage("lexical_write"):
+                    lexical_index.add(ids, texts)
+                collections.observe(name, embeddings)
+                job.vectors_written += len(batch)
+                ingest_queue.progress(job)
+                metrics.INGESTED_CHUNKS.inc(len(batch))
+                answer_cache.invalidate()
+            with timer.stage("lexical_save"):
+                collections.save(name)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+# --- Background Ingest Queue ---
+# Caps concurrent ingests so big uploads never crowd out queries.
+ingest_queue = IngestJobQueue(
+    _run_ingest_job,
+    max_concurrent=settings.max_concurrent_ingests,
+    max_pending=settings.max_pending_ingests,
+)
+metrics.INGEST_JOBS_ACTIVE.set_function(ingest_queue.active_count)
+
+
+@app.post("/ingest/", status_code=202, dependencies=[Depends(_require_ready)])
+async def ingest_file(file: UploadFile = File(...), collection: str = Form(UPLOADS_COLLECTION)):
+    """
+    Accepts .txt and .pdf uploads and queues them for background ingestion
+    into the named collection ("uploads" unless a collection form field is
+    sent; created on first use). Returns a job ID at once; poll
+    /ingest/jobs/{job_id} for progress.
+    """
+    try:
+        validate_name(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     _ensure_upload_dir()
 
     # Validate file extension
@@ -123,61 +434,588 @@ async def ingest_file(file: UploadFile = File(...)):
     safe_filename = f"{uuid.uuid4()}{ext}"
     temp_file_path = os.path.join(UPLOADS_DIR, safe_filename)
     try:
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        loader = TextLoader(temp_file_path, encoding="utf-8") if ext == ".txt" else PyPDFLoader(temp_file_path)
-        documents = loader.load()
-        docs = text_splitter.split_documents(documents)
-        vectorstore.add_documents(docs, persist_directory=CHROMA_DB_PATH)
-
-        return {
-            "status": "success",
-            "filename": file.filename,
-            "chunks_added": len(docs),
-            "vector_count": _count_vectors(),
-        }
-
+        await run_in_threadpool(_save_upload, file.file, temp_file_path)
+        job = ingest_queue.submit(
+            IngestJob(filename=file.filename, collection=collection), temp_file_path, ext, collection
+        )
+    except IngestQueueFull as e:
+        os.remove(temp_file_path)
+        raise HTTPException(status_code=429, detail=f"Ingest queue full: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
-    finally:
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
+        raise HTTPException(status_code=500, detail=f"Failed to queue file: {str(e)}")
+
+    return {
+        "status": job.status,
+        "job_id": job.id,
+        "filename": file.filename,
+        "collection": collection,
+    }
 
-@app.post("/query/")
-def query_engine(query: QueryRequest):
+
+@app.get("/ingest/jobs")
+def list_ingest_jobs():
+    """List recent ingest jobs, newest last."""
+    return {"jobs": [job.to_dict() for job in ingest_queue.list()]}
+
+
+@app.get("/ingest/jobs/{job_id}")
+def ingest_job_status(job_id: str):
+    """Report progress of one ingest job."""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest job.")
+    return {**job.to_dict(), "vector_count": _count_vectors()}
+
+
+def _route(question: str, vector, requested: Optional[List[str]]) -> List[str]:
+    """Collections to search: the requested ones, else the router's pick."""
+    if requested:
+        return requested
+    available = collections.names()
+    if not settings.query_routing or len(available) < 2:
+        return available
+    return route_question(
+        question, available, lambda: collections.centroid_scores(vector), settings.router_margin, code_index.lookup
+    )
+
+
+def _retrieve_contexts(vectors, questions, timer: StageTimer, requested: Optional[List[str]] = None):
     """
-    Retrieves relevant context from ChromaDB and generates an answer using an LLM.
-    Formats the output for G2 glasses.
+    Hybrid retrieval for one or more questions. Each question is routed to
+    its collections; each collection gets one batched Chroma query for the
+    questions routed to it plus BM25 searches of its lexical index, and
+    every dense and lexical ranking a question collected is fused by
+    reciprocal rank. Returns (top chunks, packed context, collections
+    searched) for each question, in order.
     """
+    vectors = list(vectors)
+    with timer.stage("route"):
+        routes = [_route(question, vector, requested) for question, vector in zip(questions, vectors)]
+
+    candidate_lists = [[] for _ in questions]
+    found = {}
+    lexical_owner = {}
+    for name in dict.fromkeys(name for route in routes for name in route):
+        members = [i for i, route in enumerate(routes) if name in route]
+        with timer.stage("vector_search"):
+            dense = collections.collection(name).query(
+                query_embeddings=[vectors[i] for i in members],
+                n_results=HYBRID_CANDIDATES,
+                include=["documents", "metadatas"],
+            )
+        lexical_index = collections.lexical(name)
+        for i, ids, texts, metadatas in zip(members, dense["ids"], dense["documents"], dense["metadatas"]):
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                found[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata or {})
+            with timer.stage("lexical_search"):
+                lexical_ids = [doc_id for doc_id, _ in lexical_index.search(questions[i], HYBRID_CANDIDATES)]
+            lexical_owner.update(dict.fromkeys(lexical_ids, name))
+            candidate_lists[i] += [ids, lexical_ids]
+    rankings = [[doc_id for doc_id, _ in reciprocal_rank_fusion(lists)[:RETRIEVAL_K]] for lists in candidate_lists]
+
+    # Chunks only the lexical side found still need their text fetched from their collection.
+    missing = {}
+    for doc_id in {doc_id for top_ids in rankings for doc_id in top_ids if doc_id not in found}:
+        missing.setdefault(lexical_owner[doc_id], []).append(doc_id)
+    for name, ids in missing.items():
+        with timer.stage("chunk_fetch"):
+            extra = collections.collection(name).get(ids=ids, include=["documents", "metadatas"])
+        for doc_id, text, metadata in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+            found[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata or {})
+
+    results = []
+    for top_ids, route in zip(rankings, routes):
+        relevant_docs = [found[doc_id] for doc_id in top_ids if doc_id in found]
+        with timer.stage("context_pack"):
+            packed = pack_context(relevant_docs, settings.context_token_budget)
+        metrics.record_context_tokens(packed.tokens, packed.saved_tokens)
+        results.append((relevant_docs, packed, route))
+    return results
+
+
+async def _offload(fn, *args, timeout: float, stage: str):
+    """
+    Run blocking retrieval work on the query executor under a stage timeout.
+    A timeout answers 504 but cannot stop a call that has already started:
+    its thread runs to completion and holds its query slot until then. When
+    every slot is taken, new work is refused with 503 at once instead of
+    queueing behind abandoned calls.
+    """
+    if not query_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503, detail=f"{stage} busy: query workers saturated.", headers={"Retry-After": "1"}
+        )
+    try:
+        future = query_executor.submit(fn, *args)
+    except BaseException:
+        query_slots.release()
+        raise
+    # Fires when the thread finishes, or when a call that never started is cancelled.
+    future.add_done_callback(lambda _: query_slots.release())
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"{stage} timed out.")
+
+
+async def _embed_question(question: str, timer: StageTimer):
+    with timer.stage("embedding"):
+        return await _offload(
+            embedding_function.embed_query, question, timeout=settings.retrieval_timeout, stage="Embedding"
+        )
+
+
+async def _embed_questions(questions: List[str], timer: StageTimer):
+    """Embed many questions in one model call."""
+    with timer.stage("embedding"):
+        return await _offload(
+            embedding_function.embed_queries, questions, timeout=settings.retrieval_timeout, stage="Embedding"
+        )
+
+
+async def _retrieve_context_async(vector, question: str, timer: StageTimer, requested=None):
+    results = await _retrieve_contexts_async([vector], [question], timer, requested)
+    return results[0]
+
+
+async def _retrieve_contexts_async(vectors, questions: List[str], timer: StageTimer, requested=None):
+    return await _offload(
+        _retrieve_contexts, vectors, questions, timer, requested, timeout=settings.retrieval_timeout, stage="Retrieval"
+    )
+
+
+def _llm_http_error(error: Exception) -> HTTPException:
+    if isinstance(error, LLMQueueFull):
+        return HTTPException(status_code=429, detail=f"LLM busy: {error}", headers={"Retry-After": "1"})
+    if isinstance(error, LLMUnavailable):
+        return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": "5"})
+    return HTTPException(status_code=504, detail=str(error))
+
+
+async def _generate(prompt: str) -> str:
+    """Await the LLM answer; concurrency, timeout and retries are handled by the provider wrapper."""
+    try:
+        return await llm.generate(prompt)
+    except (LLMQueueFull, LLMTimeout, LLMUnavailable) as e:
+        raise _llm_http_error(e)
+
+
+async def _generate_stream(prompt: str):
+    """Yield LLM text deltas; the whole generation shares the LLM timeout."""
     try:
-        # 1. Retrieve the 3 most relevant document chunks from the vector store.
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
-        relevant_docs = retriever.invoke(query.question)
-        
-        # Combine the content of the retrieved documents into a single context string.
-        context = "\n\n".join([doc.page_content for doc in relevant_docs])
+        async for text in llm.stream(prompt):
+            yield text
+    except (LLMQueueFull, LLMTimeout, LLMUnavailable) as e:
+        raise _llm_http_error(e)
+
 
-        # 2. Format the prompt with the retrieved context and the user's question.
-        formatted_prompt = rag_prompt.format(context=context, question=query.question)
+def _lookup_codes(question: str):
+    """
+    Resolve ICD-10 codes mentioned in the question against the code index.
+    Returns (entries, code_lookup block for the response) or ([], None)
+    when nothing in the question resolves to a real code: code-shaped
+    everyday words ("a1c", "b12") must not bypass the answer cache.
+    """
+    if not find_codes(question):
+        return [], None
+    start = time.perf_counter()
+    entries = code_index.resolve(question)
+    lookup_ms = (time.perf_counter() - start) * 1000
+    if not entries:
+        return [], None
+    return entries, {
+        "entries": [{"code": code, "description": desc} for code, desc in entries],
+        "lookup_ms": round(lookup_ms, 4),
+    }
 
-        # 3. Generate an answer using the LLM.
-        response = llm.generate_content(formatted_prompt)
-        full_answer = response.text
 
-        # 4. Format the output for the G2 glasses display.
-        # Truncate and convert to uppercase for readability on the waveguide.
-        g2_output = full_answer[:G2_OUTPUT_MAX_LENGTH].upper()
+def _format_code_entries(entries) -> str:
+    return "\n".join(f"{code}: {desc}" for code, desc in entries)
 
-        return {
+
+def _with_code_context(entries, context: str) -> str:
+    """Prepend exact code matches so the LLM sees them ahead of retrieved chunks."""
+    if not entries:
+        return context
+    matches = f"EXACT ICD-10 MATCHES:\n{_format_code_entries(entries)}"
+    return f"{matches}\n\n{context}" if context else matches
+
+
+def _format_g2(text: str) -> dict:
+    """
+    Paginate an answer for the waveguide (5 lines x 60 chars per page).
+    g2_output is the first page; g2_pages holds every page so clients can
+    page through without another request.
+    """
+    pages = paginate(text)
+    return {"g2_output": pages[0], "g2_pages": pages}
+
+
+def _stream_error(error: Exception) -> dict:
+    """
+    Detail, HTTP status and Retry-After for an error reported inside an
+    NDJSON stream, mirroring what the non-streaming endpoints answer.
+    """
+    if not isinstance(error, HTTPException):
+        return {"detail": f"Failed to process query: {str(error)}", "status": 500}
+    fields = {"detail": error.detail, "status": error.status_code}
+    retry_after = (error.headers or {}).get("Retry-After")
+    if retry_after:
+        fields["retry_after"] = int(retry_after)
+    return fields
+
+
+def _ndjson(event: str, **payload) -> str:
+    """Serialize one stream event as a newline-delimited JSON frame."""
+    return json.dumps({"event": event, **payload}) + "\n"
+
+
+def _code_stage(question: str):
+    """
+    Resolve ICD-10 codes in the question. Returns (entries, code_lookup block,
+    finished result); the result is set when the index alone answers it.
+    """
+    code_entries, code_lookup = _lookup_codes(question)
+    if code_entries and is_pure_lookup(question):
+        full_answer = _format_code_entries(code_entries)
+        return code_entries, code_lookup, {
             "full_answer": full_answer,
-            "g2_output": g2_output,
-            "context_used": context
+            **_format_g2(full_answer),
+            "context_used": full_answer,
+            "cached": False,
+            "code_lookup": code_lookup,
         }
+    return code_entries, code_lookup, None
+
+
+def _cache_stage(vector, code_lookup, requested=None):
+    """
+    Semantic cache lookup. Questions naming codes bypass the cache:
+    "E11.9" and "E11.8" embed alike but need different answers. So do
+    questions pinned to explicit collections, whose answers depend on them.
+    """
+    if code_lookup is not None or requested is not None:
+        return None
+    cached = answer_cache.lookup(vector)
+    metrics.record_cache_lookup(cached is not None)
+    return {**cached, "cached": True} if cached is not None else None
+
+
+def _answer_payload(full_answer: str, context: str, packed: PackedContext, searched: List[str]) -> dict:
+    """
+    A generated answer as /query/ returns it and the semantic cache stores
+    it. Every endpoint builds its cache entries here, so a hit has the same
+    shape whichever endpoint first produced the answer.
+    """
+    return {
+        "full_answer": full_answer,
+        **_format_g2(full_answer),
+        "context_used": context,
+        "context_packing": packed.stats(),
+        "collections": searched,
+    }
+
+
+async def _llm_stage(
+    question: str, vector, packed: PackedContext, searched: List[str], code_entries, code_lookup,
+    cache_version: Optional[int], timer: StageTimer,
+) -> dict:
+    """
+    Prompt the LLM with the retrieved context and format the answer for G2.
+    A cache_version of None keeps the answer out of the semantic cache.
+    """
+    with timer.stage("prompt_build"):
+        context = _with_code_context(code_entries, packed.text)
+        formatted_prompt = rag_prompt.format(context=context, question=question)
+    with timer.stage("llm"):
+        full_answer = await _generate(formatted_prompt)
+
+    result = _answer_payload(full_answer, context, packed, searched)
+    if code_lookup is not None:
+        result["code_lookup"] = code_lookup
+    elif cache_version is not None:
+        answer_cache.store(vector, result, cache_version)
+    return {**result, "cached": False}
+
+
+async def _answer_query(question: str, timer: StageTimer, requested: Optional[List[str]] = None) -> dict:
+    # 0. Exact ICD-10 code lookups are answered straight from the index.
+    with timer.stage("code_lookup"):
+        code_entries, code_lookup, result = _code_stage(question)
+    if result is not None:
+        return result
+
+    # Embed the question once; the vector serves both the cache and retrieval.
+    vector = await _embed_question(question, timer)
+    with timer.stage("cache_lookup"):
+        cached = _cache_stage(vector, code_lookup, requested)
+    if cached is not None:
+        return cached
+    cache_version = answer_cache.version if requested is None else None
+
+    # 1. Route to collections and retrieve the 3 most relevant document chunks.
+    _, packed, searched = await _retrieve_context_async(vector, question, timer, requested)
+
+    # 2-4. Prompt the LLM and format the output for the G2 glasses display.
+    return await _llm_stage(question, vector, packed, searched, code_entries, code_lookup, cache_version, timer)
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[set]:
+    """Comma-separated ?fields= value as a set (None = every field)."""
+    if not fields:
+        return None
+    selected = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = selected.difference(QUERY_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. Choose from: {', '.join(QUERY_FIELDS)}",
+        )
+    return selected
+
+
+def _wants_msgpack(request: Request) -> bool:
+    return MSGPACK_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def _compact_response(payload: dict, request: Request) -> Response:
+    """
+    Serialize straight to bytes, skipping FastAPI's encoder pass: msgpack
+    when the client sends Accept: application/msgpack, else compact JSON.
+    """
+    if _wants_msgpack(request):
+        return Response(msgpack.packb(payload), media_type=MSGPACK_MEDIA_TYPE)
+    return Response(json.dumps(payload, separators=(",", ":")), media_type="application/json")
+
+
+@app.post("/query/", dependencies=[Depends(_require_ready)])
+async def query_engine(query: QueryRequest, request: Request, fields: Optional[str] = Query(None)):
+    """
+    Retrieves relevant context from ChromaDB and generates an answer using an LLM.
+    Formats the output for G2 glasses. With "debug": true the response adds
+    a "timings" block: milliseconds spent in each pipeline stage.
+    "collections": [...] restricts the search to those collections; without
+    it the router picks them and the response lists the ones searched.
+    ?fields=g2_output,cached returns only the named fields (context_used is
+    the bulk of a full response), and Accept: application/msgpack switches
+    the encoding.
+    """
+    selected = _parse_fields(fields)
+    requested = _check_collections(query.collections)
+    timer = StageTimer("query")
+    try:
+        with metrics.IN_FLIGHT.labels("query").track_inprogress(), timer.stage("total"):
+            result = await _answer_query(query.question, timer, requested)
+        if query.debug or (selected and "timings" in selected):
+            result = {**result, "timings": timer.timings_ms}
+        if selected is not None:
+            result = {name: result[name] for name in QUERY_FIELDS if name in selected and name in result}
+        elif not _wants_msgpack(request):
+            return result
+        return _compact_response(result, request)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process query: {str(e)}")
 
 
+@app.post("/query/g2", dependencies=[Depends(_require_ready)])
+async def query_g2(query: QueryRequest, request: Request):
+    """
+    Slim variant of /query/ for the glasses bridge: only the precomputed
+    display pages, so a long answer is paged through locally. Compact JSON
+    by default, msgpack with Accept: application/msgpack.
+    """
+    requested = _check_collections(query.collections)
+    timer = StageTimer("g2")
+    try:
+        with metrics.IN_FLIGHT.labels("g2").track_inprogress(), timer.stage("total"):
+            result = await _answer_query(query.question, timer, requested)
+        return _compact_response({"pages": result["g2_pages"], "cached": result["cached"]}, request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to process query: {str(e)}")
+
+
+@app.post("/query/stream", dependencies=[Depends(_require_ready)])
+async def query_stream(query: QueryRequest):
+    """
+    Streaming variant of /query/ as newline-delimited JSON events:
+    one "context" frame with the retrieval results, "token" frames as the
+    LLM produces text (each carrying the G2 page being filled and its
+    index), then a final "g2" frame with every page. Failures after the
+    stream has started arrive as "error" frames carrying the HTTP status
+    (and retry_after) the request would otherwise have returned.
+    """
+    requested = _check_collections(query.collections)
+
+    async def event_stream():
+        timer = StageTimer("stream")
+        in_flight = metrics.IN_FLIGHT.labels("stream")
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            with timer.stage("code_lookup"):
+                code_entries, code_lookup, result = _code_stage(query.question)
+            if result is not None:
+                yield _ndjson("context", context_used=result["context_used"], sources=["ICD-10-CM"],
+                              code_lookup=code_lookup)
+                yield _ndjson("g2", full_answer=result["full_answer"], g2_output=result["g2_output"],
+                              g2_pages=result["g2_pages"], cached=False)
+                return
+
+            vector = await _embed_question(query.question, timer)
+            with timer.stage("cache_lookup"):
+                cached = _cache_stage(vector, code_lookup, requested)
+            if cached is not None:
+                yield _ndjson("context", context_used=cached["context_used"], sources=[], cached=True)
+                yield _ndjson("g2", full_answer=cached["full_answer"], g2_output=cached["g2_output"],
+                              g2_pages=cached["g2_pages"], cached=True)
+                return
+            cache_version = answer_cache.version
+
+            relevant_docs, packed, searched = await _retrieve_context_async(vector, query.question, timer, requested)
+            with timer.stage("prompt_build"):
+                context = _with_code_context(code_entries, packed.text)
+                formatted_prompt = rag_prompt.format(context=context, question=query.question)
+            yield _ndjson(
+                "context",
+                context_used=context,
+                context_packing=packed.stats(),
+                sources=[os.path.basename(doc.metadata.get("source", "")) for doc in relevant_docs],
+                collections=searched,
+                cached=False,
+                code_lookup=code_lookup,
+            )
+
+            full_answer = ""
+            llm_start = time.perf_counter()
+            async for text in _generate_stream(formatted_prompt):
+                if not full_answer:
+                    timer.record("llm_first_token", time.perf_counter() - llm_start)
+                full_answer += text
+                g2_page, g2_output = current_page(full_answer)
+                yield _ndjson("token", text=text, g2_output=g2_output, g2_page=g2_page)
+            timer.record("llm", time.perf_counter() - llm_start)
+
+            result = _answer_payload(full_answer, context, packed, searched)
+            if code_lookup is None and requested is None:
+                answer_cache.store(vector, result, cache_version)
+            yield _ndjson("g2", full_answer=full_answer, g2_output=result["g2_output"],
+                          g2_pages=result["g2_pages"], cached=False)
+        except Exception as e:
+            yield _ndjson("error", **_stream_error(e))
+        finally:
+            timer.record("total", time.perf_counter() - start)
+            in_flight.dec()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
+@app.post("/query/batch", dependencies=[Depends(_require_ready)])
+async def query_batch(batch: BatchQueryRequest):
+    """
+    Answers many questions in one request. All questions are embedded in a
+    single model call and searched with one Chroma query per collection;
+    LLM calls run with bounded concurrency. Results stream back as NDJSON,
+    one line per question in request order, each tagged with its index. A
+    failing question yields an {"index", "error", "status"} line without
+    failing the batch.
+    """
+    questions = batch.questions
+    requested = _check_collections(batch.collections)
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"Too many questions. Max per batch: {MAX_BATCH_QUESTIONS}")
+    if any(len(q) > MAX_QUESTION_LENGTH for q in questions):
+        raise HTTPException(status_code=413, detail=f"Question too long. Max length: {MAX_QUESTION_LENGTH}")
+
+    def _batch_error(error: Exception) -> dict:
+        fields = _stream_error(error)
+        return {"error": fields.pop("detail"), **fields}
+
+    llm_slots = asyncio.Semaphore(settings.batch_llm_concurrency)
+    timer = StageTimer("batch")
+    loop = asyncio.get_running_loop()
+    futures = [loop.create_future() for _ in questions]
+
+    async def answer_one(i: int, vector, relevant, code_entries, code_lookup, cache_version):
+        try:
+            async with llm_slots:
+                _, packed, searched = relevant
+                futures[i].set_result(await _llm_stage(
+                    questions[i], vector, packed, searched, code_entries, code_lookup, cache_version, timer
+                ))
+        except Exception as e:
+            futures[i].set_result(_batch_error(e))
+
+    async def run_pipeline():
+        """Resolve every future, whatever happens to the shared stages."""
+        tasks = []
+        try:
+            # Stage 1: ICD-10 lookups answer some questions outright.
+            with timer.stage("code_lookup"):
+                code_stages = [_code_stage(q) for q in questions]
+            pending = []
+            for i, (_, _, result) in enumerate(code_stages):
+                if result is not None:
+                    futures[i].set_result(result)
+                else:
+                    pending.append(i)
+            if not pending:
+                return
+
+            # Stage 2: one embedding call, then the semantic cache.
+            vectors = await _embed_questions([questions[i] for i in pending], timer)
+            cache_version = answer_cache.version if requested is None else None
+            to_retrieve = []
+            for i, vector in zip(pending, vectors):
+                cached = _cache_stage(vector, code_stages[i][1], requested)
+                if cached is not None:
+                    futures[i].set_result(cached)
+                else:
+                    to_retrieve.append((i, vector))
+            if not to_retrieve:
+                return
+
+            # Stage 3: one batched vector search per collection, then bounded-concurrency LLM calls.
+            retrieved = await _retrieve_contexts_async(
+                [vector for _, vector in to_retrieve], [questions[i] for i, _ in to_retrieve], timer, requested
+            )
+            for (i, vector), relevant in zip(to_retrieve, retrieved):
+                code_entries, code_lookup, _ = code_stages[i]
+                tasks.append(asyncio.create_task(
+                    answer_one(i, vector, relevant, code_entries, code_lookup, cache_version)
+                ))
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_result(_batch_error(e))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def result_stream():
+        pipeline = asyncio.create_task(run_pipeline())
+        in_flight = metrics.IN_FLIGHT.labels("batch")
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            # Emit in request order: each line goes out as soon as it and
+            # everything before it are done.
+            for i, future in enumerate(futures):
+                yield json.dumps({"index": i, **(await future)}) + "\n"
+        finally:
+            timer.record("total", time.perf_counter() - start)
+            in_flight.dec()
+            pipeline.cancel()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
 @app.get("/")
 def read_root():
     return {"message": "Shadow OS is online. Ready to receive intelligence."}
@@ -185,30 +1023,123 @@ def read_root():
 
 @app.get("/status/")
 def status():
-    """Lightweight health endpoint for front-end status indicator."""
-    return {
-        "status": "ok",
-        "vectors": _count_vectors(),
+    """
+    Health endpoint for the front-end indicator and orchestrators. Liveness
+    is true as soon as the process serves HTTP; readiness only once models
+    and indexes are loaded. Startup stage timings are always reported.
+    """
+    ready = startup_state["ready"]
+    body = {
+        "status": "ok" if ready else ("error" if startup_state["error"] else "loading"),
+        "live": True,
+        "ready": ready,
+        "startup": {
+            "error": startup_state["error"],
+            "uptime_s": round(time.time() - startup_state["started_at"], 1),
+            "load_time_s": (
+                round(startup_state["ready_at"] - startup_state["started_at"], 2) if ready else None
+            ),
+            "timings_ms": startup_state["timings_ms"],
+        },
         "embedding_model": EMBEDDING_MODEL_NAME,
+        "embedding_backend": settings.embedding_backend,
+        "embedding_service": settings.embedding_service_socket or None,
+        "ingest_jobs_active": ingest_queue.active_count(),
+    }
+    if ready:
+        body.update({
+            "vectors": _count_vectors(),
+            "answer_cache": answer_cache.stats(),
+            "icd10_codes_indexed": len(code_index),
+            "icd10_table_mapped": code_index.table.mapped,
+            "lexical_chunks_indexed": sum(len(collections.lexical(name)) for name in collections.names()),
+            "collections": collections.counts(),
+            "llm": llm.stats(),
+        })
+    return body
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage latencies, LLM tokens, cache hit rates, load."""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/status/live")
+def status_live():
+    """Liveness probe: the process is up and serving HTTP."""
+    return {"live": True}
+
+
+@app.get("/status/ready", dependencies=[Depends(_require_ready)])
+def status_ready():
+    """Readiness probe: 503 until models and indexes are loaded."""
+    return {"ready": True}
+
+
+@app.get("/icd10/", dependencies=[Depends(_require_ready)])
+def icd10_codes(
+    prefix: str = "",
+    start: str = "",
+    end: str = "",
+    limit: int = Query(100, ge=1, le=MAX_LIST_RESULTS),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Enumerate ICD-10 codes in code order: ?prefix=I21 for a code and
+    everything under it, or ?start=I20&end=I25 for a range (end inclusive,
+    with its subcodes). Paged with limit/offset; "total" counts every match.
+    """
+    if start or end:
+        if not (start and end):
+            raise HTTPException(status_code=400, detail="Pass both start and end for a range.")
+        return code_hierarchy.range(start, end, limit, offset)
+    if not prefix:
+        raise HTTPException(status_code=400, detail="Pass a prefix, or start and end.")
+    return code_hierarchy.prefix(prefix, limit, offset)
+
+
+@app.get("/icd10/{code}", dependencies=[Depends(_require_ready)])
+def icd10_code(code: str):
+    """One ICD-10 code with its parent, ancestor chain and direct children."""
+    node = code_hierarchy.get(code)
+    if node is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ICD-10 code: {code}")
+    return {
+        **node,
+        "parent": code_hierarchy.parent(code),
+        "ancestors": code_hierarchy.ancestors(code),
+        "children": code_hierarchy.children(code),
     }
 
 
-@app.get("/db/info")
+@app.get("/db/info", dependencies=[Depends(_require_ready)])
 def db_info():
     """Return basic database info for UI display."""
     return {
         "persist_directory": CHROMA_DB_PATH,
         "vectors": _count_vectors(),
+        "collections": collections.counts(),
         "embedding_model": EMBEDDING_MODEL_NAME,
+        "embedding_backend": settings.embedding_backend,
     }
 
 
-@app.post("/db/reset")
-def db_reset():
-    """Clear all vectors from the collection."""
+@app.post("/db/reset", dependencies=[Depends(_require_ready)])
+def db_reset(collection: Optional[str] = None):
+    """
+    Drop one collection (?collection=uploads) with its lexical index, leaving
+    the others untouched, or every collection when none is named.
+    """
+    if collection is not None and not collections.exists(collection):
+        raise HTTPException(status_code=404, detail=f"Unknown collection: {collection}")
     try:
-        vectorstore._collection.delete(where={})  # type: ignore[attr-defined]
-        return {"status": "reset", "vectors": _count_vectors()}
+        names = [collection] if collection is not None else collections.names()
+        for name in names:
+            collections.drop(name)
+        answer_cache.invalidate()
+        return {"status": "reset", "collections": names, "vectors": _count_vectors()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to reset DB: {str(e)}")
 
@@ -0,0 +1,81 @@
+"""
+Prometheus metrics for the Shadow OS backend.
+
+Every stage of the query and ingest pipelines is timed into one histogram,
+labelled by pipeline and stage, so a slow ``/query/`` can be pinned on
+embedding, vector search, prompt build or the LLM. ``StageTimer`` records
+those observations and also keeps the per-request breakdown that
+``/query/`` returns when called with ``"debug": true``.
+
+Gauges that mirror live state (vector count, cache hit rates, in-flight
+requests) are read at scrape time. With several uvicorn workers each worker
+exposes its own numbers; scrape them individually or use the shared
+embedding service so the vector count is the same everywhere.
+"""
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# 1 ms .. 60 s: covers cache hits through slow LLM calls.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    "shadow_stage_seconds",
+    "Time spent in each pipeline stage.",
+    ["pipeline", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter("shadow_llm_tokens", "LLM tokens consumed.", ["kind"])
+CONTEXT_TOKENS = Counter(
+    "shadow_context_tokens", "Estimated retrieved-context tokens sent to the LLM, and saved by packing.", ["kind"]
+)
+ANSWER_CACHE_LOOKUPS = Counter("shadow_answer_cache_lookups", "Semantic answer cache lookups.", ["result"])
+INGESTED_CHUNKS = Counter("shadow_ingested_chunks", "Chunks written to the vector store by /ingest/ jobs.")
+IN_FLIGHT = Gauge("shadow_requests_in_flight", "Requests currently being processed.", ["endpoint"])
+VECTORS = Gauge("shadow_vectors", "Vectors in the collection.")
+EMBEDDING_CACHE_HIT_RATIO = Gauge(
+    "shadow_embedding_cache_hit_ratio", "Share of document chunks served from the embedding cache."
+)
+INGEST_JOBS_ACTIVE = Gauge("shadow_ingest_jobs_active", "Ingest jobs queued or running.")
+
+
+class StageTimer:
+    """Times pipeline stages into STAGE_SECONDS and keeps a per-request breakdown."""
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.timings_ms = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        STAGE_SECONDS.labels(self.pipeline, name).observe(seconds)
+        # A stage can run more than once per request (e.g. streamed chunks).
+        self.timings_ms[name] = round(self.timings_ms.get(name, 0.0) + seconds * 1000, 2)
+
+
+def record_llm_usage(prompt_tokens: int, completion_tokens: int) -> None:
+    """Count tokens reported by the LLM provider for one call."""
+    LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels("completion").inc(completion_tokens)
+
+
+def record_context_tokens(sent: int, saved: int) -> None:
+    CONTEXT_TOKENS.labels("sent").inc(sent)
+    CONTEXT_TOKENS.labels("saved").inc(saved)
+
+
+def record_cache_lookup(hit: bool) -> None:
+    ANSWER_CACHE_LOOKUPS.labels("hit" if hit else "miss").inc()
+
+
+def render() -> tuple:
+    """(body, content type) for the /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
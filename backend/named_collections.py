@@ -0,0 +1,363 @@
+"""
+Named Chroma collections and question routing for Shadow OS.
+
+Each corpus lives in its own collection with its own BM25 index, so a
+search only scans the corpora that can answer it and one corpus can be
+rebuilt without touching the others:
+
+    icd10      ICD-10-CM category chunks (ingest_icd10_optimized.py)
+    uploads    files uploaded through /ingest/
+    documents  files in data/ (ingest_docs.py)
+    <project>  any other name passed to /ingest/ or the scripts
+
+``langchain`` is the single default collection used before collections
+were named; it stays searchable until it is reset.
+
+The router picks collections per question with two rules:
+1. A question naming a real ICD-10 code goes to ``icd10`` only
+2. Otherwise a nearest-centroid classifier: each collection keeps the mean
+   direction of its chunk embeddings, the question vector (already computed
+   for retrieval) is scored against each, and every collection within
+   ``margin`` of the best is searched. Collections without a centroid yet
+   are always searched.
+"""
+import os
+import re
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from answer_cache import _unit
+from icd10_index import find_codes
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+CHROMA_DB_PATH = DATA_DIR / "chroma_db"
+
+LEGACY_COLLECTION = "langchain"  # langchain_chroma's default collection name
+ICD10_COLLECTION = "icd10"
+UPLOADS_COLLECTION = "uploads"
+DOCUMENTS_COLLECTION = "documents"
+
+# Chroma allows 3-512 chars; names also become file names, so keep them plain.
+NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{1,61}[a-z0-9]$")
+NAMES_TTL = 2.0  # Seconds a collection listing is reused (scripts may add collections meanwhile)
+DEFAULT_ROUTER_MARGIN = 0.1
+
+
+def validate_name(name: str) -> str:
+    if not NAME_PATTERN.match(name or ""):
+        raise ValueError(
+            f"Invalid collection name '{name}': use 3-63 lowercase letters, digits, '-' or '_', "
+            "starting and ending with a letter or digit."
+        )
+    return name
+
+
+def lexical_index_path(name: str, data_dir: Path = DATA_DIR) -> Path:
+    # The legacy collection keeps the index file it had before collections were named.
+    if name == LEGACY_COLLECTION:
+        return Path(data_dir) / "lexical_index.json"
+    return Path(data_dir) / f"lexical_index.{name}.json"
+
+
+def centroid_path(name: str, data_dir: Path = DATA_DIR) -> Path:
+    return Path(data_dir) / f"centroid.{name}.json"
+
+
+def _merge(base: Optional[tuple], extra: Optional[tuple]) -> Optional[tuple]:
+    """Add two (sum of unit vectors, count) centroids; a new vector size replaces the old."""
+    if base is None or (extra is not None and base[0].shape != extra[0].shape):
+        return extra
+    if extra is None:
+        return base
+    return base[0] + extra[0], base[1] + extra[1]
+
+
+class CollectionRouter:
+    """
+    Per-collection embedding centroids (sum of unit vectors plus a count).
+    Like its BM25 index, each collection's centroid is its own JSON file, so
+    processes writing different collections never overwrite each other.
+    Vectors observed here stay pending until ``save``, which folds them into
+    the file's latest contents, and files rewritten or deleted by another
+    process are reloaded before routing. Deleted chunks are not subtracted;
+    the drift is small, and dropping and re-ingesting a collection resets
+    its centroid.
+    """
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = Path(data_dir)
+        self._lock = threading.Lock()
+        self._saved: Dict[str, tuple] = {}     # name -> (sum, count) as last read or written
+        self._pending: Dict[str, tuple] = {}   # name -> (sum, count) observed since
+        self._mtimes: Dict[str, float] = {}    # name -> mtime of the file behind _saved
+        self.refresh_if_stale()
+
+    def has(self, name: str) -> bool:
+        with self._lock:
+            centroid = _merge(self._saved.get(name), self._pending.get(name))
+        return centroid is not None and centroid[1] > 0
+
+    def observe(self, name: str, embeddings) -> None:
+        """Fold newly written chunk vectors into the collection's centroid."""
+        if not len(embeddings):
+            return
+        total = np.sum([_unit(vector) for vector in embeddings], axis=0)
+        with self._lock:
+            self._pending[name] = _merge(self._pending.get(name), (total, len(embeddings)))
+
+    def forget(self, name: str) -> None:
+        with self._lock:
+            self._saved.pop(name, None)
+            self._pending.pop(name, None)
+            self._mtimes.pop(name, None)
+        centroid_path(name, self.data_dir).unlink(missing_ok=True)
+
+    def scores(self, vector) -> Dict[str, float]:
+        """Cosine similarity between the question and each collection's centroid."""
+        self.refresh_if_stale()
+        query = _unit(vector)
+        with self._lock:
+            centroids = {
+                name: _merge(self._saved.get(name), self._pending.get(name))
+                for name in {*self._saved, *self._pending}
+            }
+        return {
+            name: float(query @ _unit(total))
+            for name, (total, count) in centroids.items()
+            if count and total.shape == query.shape
+        }
+
+    def save(self, name: str) -> None:
+        """Write the collection's centroid, merged into whatever another process saved meanwhile."""
+        self._load(name)
+        with self._lock:
+            centroid = _merge(self._saved.get(name), self._pending.pop(name, None))
+            if centroid is None:
+                return
+            self._saved[name] = centroid
+            data = {"count": int(centroid[1]), "sum": centroid[0].tolist()}
+        path = centroid_path(name, self.data_dir)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, path)
+        self._mtimes[name] = path.stat().st_mtime
+
+    def refresh_if_stale(self) -> None:
+        """Reload centroid files another process rewrote, and drop the ones it deleted."""
+        on_disk = {path.name[len("centroid."):-len(".json")] for path in self.data_dir.glob("centroid.*.json")}
+        for name in on_disk | set(self._mtimes):
+            self._load(name)
+
+    def _load(self, name: str) -> None:
+        path = centroid_path(name, self.data_dir)
+        try:
+            mtime = path.stat().st_mtime
+            if mtime == self._mtimes.get(name):
+                return
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            with self._lock:
+                self._saved.pop(name, None)
+                self._mtimes.pop(name, None)
+            return
+        except json.JSONDecodeError:
+            return
+        with self._lock:
+            self._saved[name] = (np.asarray(entry["sum"], dtype=np.float32), int(entry["count"]))
+            self._mtimes[name] = mtime
+
+
+def route_question(
+    question: str,
+    available: List[str],
+    scores: Callable[[], Dict[str, float]],
+    margin: float = DEFAULT_ROUTER_MARGIN,
+    is_known_code: Optional[Callable[[str], object]] = None,
+) -> List[str]:
+    """
+    Collections to search for ``question`` among ``available``. ``scores``
+    is only called when the code rule doesn't decide; ``is_known_code``
+    filters out code-shaped words that aren't ICD-10 codes ("A1C").
+    """
+    if ICD10_COLLECTION in available:
+        codes = [code for code, _ in find_codes(question)]
+        if codes and (is_known_code is None or any(is_known_code(code) for code in codes)):
+            return [ICD10_COLLECTION]
+
+    scored = {name: score for name, score in scores().items() if name in available}
+    if not scored:
+        return list(available)
+    best = max(scored.values())
+    return [name for name in available if name not in scored or scored[name] >= best - margin]
+
+
+class _CollectionHandle:
+    """
+    A cached Chroma collection. Another process may drop and recreate the
+    collection, leaving the cached one pointing at a deleted id; a call that
+    fails with Chroma's not-found error re-fetches the collection by name
+    and is retried once.
+    """
+
+    def __init__(self, owner: "LocalCollections", name: str, collection):
+        self._owner = owner
+        self._collection = collection
+        self.name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self._collection, attr)
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            stale = self._collection
+            try:
+                return getattr(stale, attr)(*args, **kwargs)
+            except self._owner.not_found_errors:
+                self._collection = self._owner._refetch(self.name, stale)
+            return getattr(self._collection, attr)(*args, **kwargs)
+
+        return call
+
+
+class LocalCollections:
+    """
+    Every named collection in one Chroma persist directory, each paired with
+    its BM25 index, plus the router's centroids. Collections and indexes are
+    opened on first use.
+    """
+
+    def __init__(self, chroma_path=CHROMA_DB_PATH, data_dir=DATA_DIR, router: Optional[CollectionRouter] = None):
+        import chromadb
+        import chromadb.errors
+
+        self.client = chromadb.PersistentClient(path=str(chroma_path))
+        # Raised on a handle whose collection was deleted (the name changed across Chroma releases).
+        self.not_found_errors = tuple(
+            getattr(chromadb.errors, error)
+            for error in ("NotFoundError", "InvalidCollectionException")
+            if hasattr(chromadb.errors, error)
+        )
+        self.data_dir = Path(data_dir)
+        self.router = router if router is not None else CollectionRouter(self.data_dir)
+        self._lock = threading.Lock()
+        self._collections = {}
+        self._lexical = {}
+        self._names = None
+        self._names_at = 0.0
+
+    def names(self) -> List[str]:
+        now = time.monotonic()
+        if self._names is None or now - self._names_at > NAMES_TTL:
+            self._names = sorted(getattr(c, "name", c) for c in self.client.list_collections())
+            self._names_at = now
+        return list(self._names)
+
+    def exists(self, name: str) -> bool:
+        if name in self.names():
+            return True
+        self._names = None  # Maybe created by another process since the last listing.
+        return name in self.names()
+
+    def collection(self, name: str, create: bool = False):
+        """The Chroma collection; KeyError if it doesn't exist and ``create`` is False."""
+        with self._lock:
+            if name not in self._collections:
+                if create:
+                    # Vectors are always supplied, so Chroma never needs its own embedder.
+                    collection = self.client.get_or_create_collection(validate_name(name), embedding_function=None)
+                    self._names = None
+                elif self.exists(name):
+                    collection = self.client.get_collection(name, embedding_function=None)
+                else:
+                    raise KeyError(name)
+                self._collections[name] = _CollectionHandle(self, name, collection)
+            return self._collections[name]
+
+    def _refetch(self, name: str, stale):
+        """
+        The current Chroma collection behind a handle whose collection was
+        deleted; KeyError if it was dropped and not recreated.
+        """
+        with self._lock:
+            handle = self._collections.get(name)
+            if handle is not None and handle._collection is not stale:
+                return handle._collection  # Another thread already re-fetched it.
+            self._names = None
+        if not self.exists(name):
+            with self._lock:
+                self._collections.pop(name, None)
+            raise KeyError(name)
+        return self.client.get_collection(name, embedding_function=None)
+
+    def lexical(self, name: str, build: bool = True):
+        """
+        The collection's BM25 index. An index that still needs its first
+        build (which also saves it) is built here, or with ``build=False``
+        returned as None so the caller can build it where writes belong.
+        """
+        from lexical_index import BM25Index
+
+        with self._lock:
+            index = self._lexical.get(name)
+            if index is None:
+                index = self._lexical[name] = BM25Index(lexical_index_path(name, self.data_dir))
+        index.refresh_if_stale()
+        if not len(index) and self.exists(name) and self.collection(name).count():
+            if not build:
+                return None
+            # Collection predates its lexical index: build it once from the stored chunks.
+            index.build_from_collection(self.collection(name))
+            index.save()
+        return index
+
+    def counts(self) -> Dict[str, int]:
+        return {name: self.collection(name).count() for name in self.names()}
+
+    def observe(self, name: str, embeddings) -> None:
+        self.router.observe(name, embeddings)
+
+    def centroid_scores(self, vector) -> Dict[str, float]:
+        return self.router.scores(vector)
+
+    def save(self, name: str) -> None:
+        """Persist the collection's BM25 index and the router centroids."""
+        self.lexical(name).save()
+        self.router.save(name)
+
+    def drop(self, name: str) -> None:
+        """Delete one collection, its BM25 index and its centroid; the others are untouched."""
+        with self._lock:
+            self._collections.pop(name, None)
+            index = self._lexical.pop(name, None)
+        if self.exists(name):
+            self.client.delete_collection(name)
+        self._names = None
+        if index is None:
+            from lexical_index import BM25Index
+            index = BM25Index(lexical_index_path(name, self.data_dir))
+        index.clear()
+        index.save()
+        self.router.forget(name)
+
+    def backfill_centroids(self, page_size: int = 1000) -> List[str]:
+        """Compute centroids for collections written before routing existed."""
+        filled = []
+        for name in self.names():
+            if self.router.has(name):
+                continue
+            collection = self.collection(name)
+            for offset in range(0, collection.count(), page_size):
+                page = collection.get(limit=page_size, offset=offset, include=["embeddings"])
+                if page.get("embeddings") is not None and len(page["embeddings"]):
+                    self.router.observe(name, page["embeddings"])
+            if self.router.has(name):
+                self.router.save(name)
+                filled.append(name)
+        return filled
@@ -1,4 +1,7 @@
 import os
+import html
+import json
+import time
 import requests
 import streamlit as st
 
@@ -64,8 +67,49 @@ def ingest_file(file_obj):
     return requests.post(f"{BACKEND_URL}/ingest/", files=files, timeout=120)
 
 
-def run_query(question: str):
-    return requests.post(f"{BACKEND_URL}/query/", json={"question": question}, timeout=60)
+def fetch_ingest_job(job_id: str):
+    return requests.get(f"{BACKEND_URL}/ingest/jobs/{job_id}", timeout=10)
+
+
+def stream_query(question: str):
+    """Yield decoded NDJSON events from the streaming query endpoint."""
+    with requests.post(
+        f"{BACKEND_URL}/query/stream", json={"question": question}, stream=True, timeout=60
+    ) as resp:
+        if resp.status_code != 200:
+            yield {"event": "error", "detail": resp.text}
+            return
+        for line in resp.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def render_g2_preview(placeholder, g2_output: str, page_label: str = ""):
+    """Draw one G2 display page (up to 5 lines x 60 chars) into a Streamlit placeholder."""
+    page_html = html.escape(g2_output).replace("\n", "<br>")
+    placeholder.markdown(f"""
+    <div style="
+        background: linear-gradient(135deg, #1a3a52 0%, #0d1f2d 100%);
+        border: 3px solid #00d4ff;
+        border-radius: 16px;
+        padding: 24px;
+        margin: 16px 0;
+        box-shadow: 0 0 30px rgba(0, 212, 255, 0.3);
+        font-family: 'Courier New', monospace;
+        color: #00ff00;
+        text-align: center;
+        min-height: 240px;
+        display: flex;
+        flex-direction: column;
+        justify-content: center;
+        align-items: center;
+    ">
+        <div style="white-space: pre; text-align: left;">{page_html}</div>
+        <div style="margin-top: 16px; font-size: 11px; opacity: 0.8; letter-spacing: 1px;">
+            G2 DISPLAY MODE{page_label}
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
 
 
 def fetch_db_info():
@@ -82,7 +126,14 @@ st.write("RAG Intelligence System for Smart Glasses")
 
 # --- Status Bar ---
 status_ok, status_data = ping_backend()
-if status_ok:
+if status_ok and not status_data.get("ready", True):
+    # Process is up but models/indexes are still loading in the background.
+    st.markdown("""
+    <div class="info-box">
+        … Backend: <strong>LOADING</strong> - Models and indexes are warming up
+    </div>
+    """, unsafe_allow_html=True)
+elif status_ok:
     st.markdown(f"""
     <div class="info-box">
         ✓ Backend: <strong>ONLINE</strong> | Vectors: <strong>{status_data.get('vectors', '?')}</strong>
@@ -111,56 +162,49 @@ if mode == "Ask Questions":
         if not status_ok:
             st.error("Backend is offline. Start it and retry.")
         else:
-            with st.spinner("Thinking..."):
-                resp = run_query(question)
-
-            if resp.status_code == 200:
-                data = resp.json()
-
-                # Split layout: Glasses preview on left, info on right
-                col_glasses, col_info = st.columns([1, 1])
-
-                with col_glasses:
-                    st.markdown("### G2 Display Preview")
-                    g2_output = data.get("g2_output", "")
-
-                    # G2 Glasses Display Simulator
-                    st.markdown(f"""
-                    <div style="
-                        background: linear-gradient(135deg, #1a3a52 0%, #0d1f2d 100%);
-                        border: 3px solid #00d4ff;
-                        border-radius: 16px;
-                        padding: 24px;
-                        margin: 16px 0;
-                        box-shadow: 0 0 30px rgba(0, 212, 255, 0.3);
-                        font-family: 'Courier New', monospace;
-                        color: #00ff00;
-                        text-align: center;
-                        min-height: 240px;
-                        display: flex;
-                        flex-direction: column;
-                        justify-content: center;
-                        align-items: center;
-                    ">
-                        {g2_output[:200]}
-                        <div style="margin-top: 16px; font-size: 11px; opacity: 0.8; letter-spacing: 1px;">
-                            G2 DISPLAY MODE
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-
-                    st.caption("Live preview of what appears on the G2 waveguide display")
-
-                with col_info:
-                    st.markdown("### Full Answer")
-                    st.info(data.get("full_answer", "No answer"))
-
-                st.markdown("---")
-
-                with st.expander("Source Context"):
-                    st.text(data.get("context_used", ""))
-            else:
-                st.error(f"Error: {resp.text}")
+            # Split layout: Glasses preview on left, info on right
+            col_glasses, col_info = st.columns([1, 1])
+
+            with col_glasses:
+                st.markdown("### G2 Display Preview")
+                g2_placeholder = st.empty()
+                render_g2_preview(g2_placeholder, "")
+                st.caption("Live preview of what appears on the G2 waveguide display")
+
+            with col_info:
+                st.markdown("### Full Answer")
+                answer_placeholder = st.empty()
+
+            st.markdown("---")
+            context_expander = st.expander("Source Context")
+
+            # Draw each frame as it arrives so the preview starts filling
+            # before the LLM has finished generating.
+            full_answer = ""
+            try:
+                with st.spinner("Thinking..."):
+                    for event in stream_query(question):
+                        kind = event.get("event")
+                        if kind == "context":
+                            context_expander.text(event.get("context_used", ""))
+                        elif kind == "token":
+                            full_answer += event.get("text", "")
+                            answer_placeholder.info(full_answer)
+                            page = event.get("g2_page", 0) + 1
+                            render_g2_preview(g2_placeholder, event.get("g2_output", ""), f" · PAGE {page}")
+                        elif kind == "g2":
+                            full_answer = event.get("full_answer", full_answer)
+                            answer_placeholder.info(full_answer or "No answer")
+                            pages = event.get("g2_pages") or [event.get("g2_output", "")]
+                            render_g2_preview(g2_placeholder, pages[0], f" · PAGE 1/{len(pages)}")
+                            if len(pages) > 1:
+                                with st.expander(f"All {len(pages)} G2 pages"):
+                                    for number, page_text in enumerate(pages, start=1):
+                                        st.text(f"[{number}/{len(pages)}]\n{page_text}")
+                        elif kind == "error":
+                            st.error(f"Error: {event.get('detail')}")
+            except requests.exceptions.RequestException as e:
+                st.error(f"Error: {e}")
 
 else:  # Upload Documents
     st.markdown("## Upload Documents")
@@ -177,21 +221,49 @@ else:  # Upload Documents
         else:
             progress_bar = st.progress(0)
             for i, file in enumerate(uploaded_files):
-                with st.spinner(f"Processing {file.name}..."):
+                with st.spinner(f"Uploading {file.name}..."):
                     resp = ingest_file(file)
 
-                if resp.status_code == 200:
-                    data = resp.json()
+                if resp.status_code != 202:
+                    st.markdown(f"""
+                    <div class="error-box">
+                        × <strong>{file.name}</strong> failed: {resp.text}
+                    </div>
+                    """, unsafe_allow_html=True)
+                    progress_bar.progress((i + 1) / len(uploaded_files))
+                    continue
+
+                # Ingestion runs in the background; poll the job until it settles.
+                job_id = resp.json().get("job_id")
+                job_status = st.empty()
+                data = {}
+                while True:
+                    job_resp = fetch_ingest_job(job_id)
+                    if job_resp.status_code != 200:
+                        data = {"status": "failed", "error": job_resp.text}
+                        break
+                    data = job_resp.json()
+                    job_status.caption(
+                        f"{file.name}: {data.get('status')} | pages {data.get('pages_parsed')} | "
+                        f"embedded {data.get('chunks_embedded')}/{data.get('chunks_total')} | "
+                        f"written {data.get('vectors_written')}"
+                    )
+                    if data.get("status") in ("done", "failed"):
+                        break
+                    time.sleep(1)
+
+                job_status.empty()
+                if data.get("status") == "done":
                     st.markdown(f"""
                     <div class="success-box">
                         ✓ <strong>{file.name}</strong><br>
-                        {data.get('chunks_added')} chunks | Total vectors: {data.get('vector_count')}
+                        {data.get('vectors_written')} chunks | Total vectors: {data.get('vector_count')}
                     </div>
                     """, unsafe_allow_html=True)
                 else:
                     st.markdown(f"""
                     <div class="error-box">
-                        × <strong>{file.name}</strong> failed: {resp.text}
+                        × <strong>{file.name}</strong> failed: {data.get('error')}
                     </div>
                     """, unsafe_allow_html=True)
 
@@ -1,41 +1,334 @@
+import sys
+import json
+import time
+import random
 import asyncio
-import requests
-from evenglasses.evenglasses import EvenGlasses
+import argparse
+import threading
+from collections import deque
+from dataclasses import dataclass
+import httpx
+
+try:
+    from evenglasses.evenglasses import EvenGlasses
+except ImportError:  # Only needed for real hardware; --simulate and --benchmark run without it.
+    EvenGlasses = None
 
 # --- Configuration ---
 # The address of the G2 glasses. You'll need to find this using a BLE scanner.
 # It can be the device name or its address (e.g., "XX:XX:XX:XX:XX:XX").
 G2_DEVICE_ADDRESS = "G2-1234" # <--- IMPORTANT: Change this to your device's address/name.
 BACKEND_URL = "http://127.0.0.1:8000"
+# Push a partial frame to the HUD once the streamed G2 text has grown by this many chars.
+G2_STREAM_MIN_DELTA = 40
+# Typed at the prompt to page through the last answer (pages arrive with the answer).
+NEXT_PAGE_COMMANDS = {"n", "next"}
+PREV_PAGE_COMMANDS = {"p", "prev"}
+# One keep-alive pool for the whole session; the read timeout covers the
+# gap between streamed frames (i.e. the LLM's time to first token).
+HTTP_TIMEOUT = httpx.Timeout(10.0, read=60.0)
+HTTP_LIMITS = httpx.Limits(max_connections=4, max_keepalive_connections=4, keepalive_expiry=120.0)
+# BLE send queue: payload budget for the link (0 = no throttle), how many frames
+# may wait for it, and the reconnect backoff (doubling from base up to max, jittered).
+G2_BLE_BYTES_PER_SECOND = 2000
+G2_MAX_PENDING_FRAMES = 4
+G2_SEND_RETRIES = 1
+G2_RECONNECT_BASE_DELAY = 0.5
+G2_RECONNECT_MAX_DELAY = 30.0
+# How long to let queued frames drain on exit.
+G2_FLUSH_TIMEOUT = 5.0
+
 
-async def send_to_glass(g2: EvenGlasses, text: str):
+class SimulatedGlasses:
     """
-    Connects to the glasses and pushes a string of text to the display.
+    Local stand-in for EvenGlasses with the same async interface. Each
+    send takes ``latency_ms`` plus the payload's airtime at
+    ``bytes_per_second``, and ``drop_rate`` is the share of sends that lose
+    the link, so the send queue can be exercised and benchmarked without
+    hardware. Displayed frames are kept in ``frames``.
     """
-    if not g2.is_connected():
-        print("Device not connected. Attempting to connect...")
-        await g2.connect()
-        if not g2.is_connected():
-            print("Failed to connect to the glasses.")
+
+    def __init__(self, address: str = "SIM-G2", connect_ms: float = 300.0, latency_ms: float = 30.0,
+                 bytes_per_second: float = G2_BLE_BYTES_PER_SECOND, drop_rate: float = 0.0, seed: int = 0):
+        self.name = "Simulated G2"
+        self.address = address
+        self.connect_delay = connect_ms / 1000
+        self.latency = latency_ms / 1000
+        self.bytes_per_second = bytes_per_second
+        self.drop_rate = drop_rate
+        self.frames = []
+        self._connected = False
+        self._random = random.Random(seed)
+
+    async def connect(self):
+        await asyncio.sleep(self.connect_delay)
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def send_text(self, text: str):
+        if not self._connected:
+            raise ConnectionError("Simulated G2 is not connected.")
+        airtime = len(text.encode("utf-8")) / self.bytes_per_second if self.bytes_per_second else 0.0
+        await asyncio.sleep(self.latency + airtime)
+        if self.drop_rate and self._random.random() < self.drop_rate:
+            self._connected = False
+            raise ConnectionError("Simulated BLE link loss.")
+        self.frames.append(text)
+
+
+@dataclass
+class _Frame:
+    text: str
+    coalesce: bool
+    attempts: int = 0
+
+
+class BLESendQueue:
+    """
+    Schedules display frames onto the BLE link.
+
+    The HUD only ever shows the latest frame, so a new frame supersedes any
+    coalescable frame still waiting (streamed partials, rapid paging): when
+    the link is slower than the answer stream, intermediate frames are
+    skipped instead of piling up. At most ``max_pending`` frames wait; beyond
+    that the oldest is dropped. Sends are spaced to ``bytes_per_second`` so
+    the glasses' buffer is never overrun. When the link drops, a background
+    task reconnects with jittered exponential backoff while ``submit`` keeps
+    accepting frames; the newest one is shown once the link is back.
+    """
+
+    def __init__(self, g2, bytes_per_second: float = G2_BLE_BYTES_PER_SECOND,
+                 max_pending: int = G2_MAX_PENDING_FRAMES, retries: int = G2_SEND_RETRIES,
+                 backoff_base: float = G2_RECONNECT_BASE_DELAY, backoff_max: float = G2_RECONNECT_MAX_DELAY,
+                 verbose: bool = True):
+        self.g2 = g2
+        self.bytes_per_second = bytes_per_second
+        self.max_pending = max_pending
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.verbose = verbose
+        self.displayed = None
+        self.stats = {"submitted": 0, "sent": 0, "superseded": 0, "dropped": 0, "failed": 0, "bytes": 0,
+                      "reconnects": 0}
+        self._pending = deque()
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._link_up = asyncio.Event()
+        self._next_send = 0.0
+        self._worker = None
+        self._reconnector = None
+
+    def start(self):
+        """Start the sender (call from inside the event loop)."""
+        if self.g2.is_connected():
+            self._link_up.set()
+        else:
+            self._link_lost()
+        self._worker = asyncio.create_task(self._run())
+
+    def submit(self, text: str, coalesce: bool = True):
+        """
+        Queue a frame without waiting for the link. ``coalesce=False`` frames
+        (e.g. notices that must be seen) are never superseded, only dropped
+        if the queue overflows.
+        """
+        self.stats["submitted"] += 1
+        if coalesce:
+            kept = deque(frame for frame in self._pending if not frame.coalesce)
+            self.stats["superseded"] += len(self._pending) - len(kept)
+            self._pending = kept
+        self._pending.append(_Frame(text, coalesce))
+        while len(self._pending) > self.max_pending:
+            self._pending.popleft()
+            self.stats["dropped"] += 1
+        self._idle.clear()
+        self._ready.set()
+
+    async def flush(self, timeout: float = None) -> bool:
+        """Wait until every queued frame is sent (or dropped); False on timeout."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self):
+        for task in (self._worker, self._reconnector):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                self._idle.set()
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            if not self._link_up.is_set():
+                await self._link_up.wait()
+                continue
+            wait = self._next_send - loop.time()
+            if wait > 0:
+                # A newer frame may supersede this one while we wait for the link budget.
+                await asyncio.sleep(wait)
+                continue
+
+            frame = self._pending.popleft()
+            if frame.text == self.displayed:
+                continue
+            if not self.g2.is_connected():
+                self._pending.appendleft(frame)
+                self._link_lost()
+                continue
+
+            if self.verbose:
+                print(f"Sending to G2: '{frame.text}'")
+            started = loop.time()
+            try:
+                # The even-glasses library handles the protocol complexities
+                # (packet fragmentation, headers, etc.).
+                await self.g2.send_text(frame.text)
+            except Exception as e:
+                print(f"An error occurred while sending text: {e}")
+                self._retry(frame)
+                if not self.g2.is_connected():
+                    self._link_lost()
+                continue
+
+            size = len(frame.text.encode("utf-8"))
+            if self.bytes_per_second:
+                # Budget from the start of the write: its own airtime counts toward it.
+                self._next_send = started + size / self.bytes_per_second
+            self.displayed = frame.text
+            self.stats["sent"] += 1
+            self.stats["bytes"] += size
+
+    def _retry(self, frame: _Frame):
+        """Put a failed frame back at the front unless it is stale or out of retries."""
+        frame.attempts += 1
+        superseded = frame.coalesce and any(pending.coalesce for pending in self._pending)
+        if superseded or frame.attempts > self.retries:
+            self.stats["failed"] += 1
             return
+        self._pending.appendleft(frame)
 
-    print(f"Sending to G2: '{text}'")
-    try:
-        # The even-glasses library handles the protocol complexities 
-        # (packet fragmentation, headers, etc.).
-        await g2.send_text(text)
-        print("Successfully sent text to G2 display.")
-    except Exception as e:
-        print(f"An error occurred while sending text: {e}")
+    def _link_lost(self):
+        self._link_up.clear()
+        if self._reconnector is None or self._reconnector.done():
+            self._reconnector = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        attempt = 0
+        while True:
+            try:
+                await self.g2.connect()
+                if self.g2.is_connected():
+                    break
+            except Exception as e:
+                print(f"G2 reconnect failed: {e}")
+            # Equal jitter: always wait at least half the backoff step.
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+            delay = random.uniform(delay / 2, delay)
+            attempt += 1
+            print(f"G2 link down. Retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+        self.stats["reconnects"] += 1
+        if self.verbose:
+            print(f"Reconnected to {self.g2.name} ({self.g2.address})")
+        self._link_up.set()
 
-async def main():
+
+async def stream_to_glass(sender: BLESendQueue, client: httpx.AsyncClient, question: str) -> list:
+    """
+    Consumes /query/stream and pushes partial G2 frames while the answer is
+    still being generated, then the first page of the final answer.
+    Frames go through the BLE send queue, so writes overlap with reading
+    the rest of the stream and partials the link can't keep up with are skipped.
+    Returns every display page so the caller can page locally.
+    """
+    last_sent = ""
+    last_page = 0
+    async with client.stream("POST", "/query/stream", json={"question": question}) as response:
+        if response.status_code != 200:
+            await response.aread()
+            print(f"Error from backend: {response.status_code} - {response.text}")
+            return []
+
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            kind = event.get("event")
+
+            if kind == "token":
+                g2_output = event.get("g2_output", "")
+                page = event.get("g2_page", 0)
+                # A new page starts from scratch: send it as soon as it fills a little.
+                grown = len(g2_output) - (len(last_sent) if page == last_page else 0)
+                if grown >= G2_STREAM_MIN_DELTA:
+                    sender.submit(g2_output)
+                    last_sent, last_page = g2_output, page
+            elif kind == "g2":
+                pages = event.get("g2_pages") or [event.get("g2_output", "")]
+                sender.submit(pages[0])
+                if len(pages) > 1:
+                    print(f"Page 1/{len(pages)}. Type 'n' / 'p' to page through the answer.")
+                return pages
+            elif kind == "error":
+                print(f"Error from backend: {event.get('detail')}")
+    return []
+
+
+def _start_stdin_reader(loop: asyncio.AbstractEventLoop) -> asyncio.Queue:
+    """
+    Read stdin on a daemon thread and hand lines to the event loop, so
+    waiting for input never blocks BLE traffic (and Ctrl+C still exits).
+    None is queued at end of input.
+    """
+    lines = asyncio.Queue()
+
+    def read():
+        while True:
+            line = sys.stdin.readline()
+            loop.call_soon_threadsafe(lines.put_nowait, line.rstrip("\n") if line else None)
+            if not line:
+                return
+
+    threading.Thread(target=read, name="stdin", daemon=True).start()
+    return lines
+
+
+async def prompt(lines: asyncio.Queue, text: str):
+    print(text, end="", flush=True)
+    return await lines.get()
+
+
+async def main(simulate: bool = False, bytes_per_second: float = G2_BLE_BYTES_PER_SECOND):
     """
     Main execution loop. Scans for the glasses, connects,
     and then enters a loop to query the user for intelligence requests.
     """
-    print("Scanning for G2 glasses...")
-    g2 = EvenGlasses(G2_DEVICE_ADDRESS)
-    
+    if simulate:
+        g2 = SimulatedGlasses(bytes_per_second=bytes_per_second)
+    elif EvenGlasses is None:
+        print("The evenglasses library is not installed. Install it, or run with --simulate.")
+        return
+    else:
+        print("Scanning for G2 glasses...")
+        g2 = EvenGlasses(G2_DEVICE_ADDRESS)
+
     # The library handles the scanning and connection logic.
     # We prime it here.
     try:
@@ -48,37 +341,98 @@ async def main():
         return
 
     # --- Main Interaction Loop ---
+    sender = BLESendQueue(g2, bytes_per_second=bytes_per_second)
+    sender.start()
+    lines = _start_stdin_reader(asyncio.get_running_loop())
+    client = httpx.AsyncClient(base_url=BACKEND_URL, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    pages, page = [], 0
     while True:
         try:
-            question = input("\n[Shadow OS] Enter your query (or 'quit' to exit): ")
-            if question.lower() == 'quit':
+            question = await prompt(lines, "\n[Shadow OS] Enter your query (or 'quit' to exit): ")
+            if question is None or question.lower() == 'quit':
                 break
-            
-            # Query the backend RAG engine.
+
+            # Page through the last answer locally: no backend round-trip.
+            command = question.strip().lower()
+            if pages and command in NEXT_PAGE_COMMANDS | PREV_PAGE_COMMANDS:
+                step = 1 if command in NEXT_PAGE_COMMANDS else -1
+                page = max(0, min(len(pages) - 1, page + step))
+                print(f"Page {page + 1}/{len(pages)}")
+                sender.submit(pages[page])
+                continue
+
+            # Query the backend RAG engine and draw the answer as it streams in.
             print("Querying the intelligence backend...")
-            response = requests.post(f"{BACKEND_URL}/query/", json={"question": question})
-
-            if response.status_code == 200:
-                data = response.json()
-                g2_output = data.get("g2_output")
-                
-                # Send the formatted text to the glasses.
-                await send_to_glass(g2, g2_output)
-            else:
-                print(f"Error from backend: {response.status_code} - {response.text}")
-
-        except requests.exceptions.ConnectionError:
+            pages, page = await stream_to_glass(sender, client, question), 0
+
+        except httpx.ConnectError:
             print("Connection Error: Could not connect to the backend. Is it running?")
-        except KeyboardInterrupt:
+        except httpx.TimeoutException:
+            print("Timeout: the backend did not respond in time.")
+        except (KeyboardInterrupt, asyncio.CancelledError):
             print("\nExiting...")
             break
         except Exception as e:
             print(f"An unexpected error occurred in the main loop: {e}")
 
+    await client.aclose()
+    await sender.flush(G2_FLUSH_TIMEOUT)
+    await sender.close()
     if g2.is_connected():
         await g2.disconnect()
         print("Disconnected from G2 glasses.")
 
-if __name__ == "__main__":
-    asyncio.run(main())
 
+async def benchmark(frames: int = 200, interval_ms: float = 20.0, frame_chars: int = 300,
+                    bytes_per_second: float = G2_BLE_BYTES_PER_SECOND, drop_rate: float = 0.0):
+    """
+    Replay a streamed answer (one growing frame every ``interval_ms``) into
+    simulated glasses, once sending every frame in order and once through
+    the coalescing queue, and report how stale the display ends up.
+    """
+    text = ("HYPERTENSION CONTROLLED. CONTINUE LISINOPRIL 10MG DAILY. " * (frame_chars // 50 + 1))[:frame_chars]
+    print(f"{frames} frames every {interval_ms:g} ms, up to {frame_chars} chars, "
+          f"link {bytes_per_second:g} B/s, drop rate {drop_rate:g}")
+    print(f"{'mode':<10} {'sent':>6} {'skipped':>8} {'reconnects':>11} {'KB':>8} {'lag ms':>9}")
+
+    for mode, coalesce, max_pending in (("in-order", False, frames), ("coalesced", True, G2_MAX_PENDING_FRAMES)):
+        g2 = SimulatedGlasses(connect_ms=50, bytes_per_second=bytes_per_second, drop_rate=drop_rate)
+        await g2.connect()
+        sender = BLESendQueue(g2, bytes_per_second=bytes_per_second, max_pending=max_pending,
+                              backoff_base=0.05, backoff_max=0.5, verbose=False)
+        sender.start()
+        for i in range(1, frames + 1):
+            sender.submit(text[:max(1, frame_chars * i // frames)], coalesce=coalesce)
+            await asyncio.sleep(interval_ms / 1000)
+        # Lag: how long after the final frame was produced it reached the display.
+        produced = time.perf_counter()
+        if not await sender.flush(60.0):
+            print(f"{mode:<10} did not drain within 60s")
+        lag = time.perf_counter() - produced
+        await sender.close()
+        stats = sender.stats
+        skipped = stats["superseded"] + stats["dropped"] + stats["failed"]
+        print(f"{mode:<10} {stats['sent']:>6} {skipped:>8} {stats['reconnects']:>11} "
+              f"{stats['bytes'] / 1024:>8.1f} {lag * 1000:>9.0f}")
+        if g2.frames[-1:] != [text]:
+            print(f"{mode:<10} final frame lost after {sender.retries} retries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shadow OS bridge to the Even Realities G2 glasses.")
+    parser.add_argument("--simulate", action="store_true", help="Use simulated glasses instead of BLE hardware.")
+    parser.add_argument("--ble-bps", type=float, default=G2_BLE_BYTES_PER_SECOND,
+                        help="BLE payload budget in bytes/second (0 = no throttle).")
+    parser.add_argument("--benchmark", action="store_true", help="Benchmark the send queue on simulated glasses.")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=20.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Simulated share of sends that lose the link.")
+    args = parser.parse_args()
+    try:
+        if args.benchmark:
+            asyncio.run(benchmark(args.frames, args.interval_ms, bytes_per_second=args.ble_bps,
+                                  drop_rate=args.drop_rate))
+        else:
+            asyncio.run(main(simulate=args.simulate, bytes_per_second=args.ble_bps))
+    except KeyboardInterrupt:
+        print("\nExiting...")
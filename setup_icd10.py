@@ -5,7 +5,7 @@ ICD-10 Medical Database Setup Script for Shadow OS
 This script orchestrates the complete ICD-10 integration:
 1. Downloads official CDC ICD-10-CM codes
 2. Formats them for optimal ChromaDB ingestion
-3. Loads them into the vector database
+3. Loads them into the vector database's "icd10" collection
 
 Run this script to populate your Shadow OS with medical knowledge.
 """
@@ -54,7 +54,9 @@ def step_1_download_icd10():
     print("=" * 80)
 
     try:
-        from backend.download_icd10_data import download_icd10_from_cdc, parse_icd10_order_file, create_comprehensive_database
+        from backend.download_icd10_data import (
+            download_icd10_from_cdc, parse_icd10_order_file, create_comprehensive_database, create_code_table
+        )
 
         content = download_icd10_from_cdc()
         if not content:
@@ -65,6 +67,7 @@ def step_1_download_icd10():
         print(f"[+] Parsed {len(codes)} valid ICD-10 codes")
 
         create_comprehensive_database(codes)
+        create_code_table(codes)
         print("[+] Step 1 Complete: ICD-10 database created")
         return True
 
@@ -81,9 +84,9 @@ def step_2_ingest_to_chromadb():
 
     try:
         print("[*] Running ingestion script...")
-        # Run the standard ingest_docs.py which will pick up the ICD-10 data
+        # Rebuilds only the "icd10" collection; uploads and documents are left alone.
         result = subprocess.run(
-            [sys.executable, str(Path(__file__).parent / "backend" / "ingest_docs.py")],
+            [sys.executable, str(Path(__file__).parent / "backend" / "ingest_icd10_optimized.py")],
             cwd=str(Path(__file__).parent),
             capture_output=False
         )
@@ -107,8 +110,7 @@ def step_3_verify_setup():
     print("=" * 80)
 
     try:
-        from langchain_chroma import Chroma
-        from langchain_community.embeddings import SentenceTransformerEmbeddings
+        from named_collections import ICD10_COLLECTION, LocalCollections
 
         chroma_path = Path(__file__).parent / "data" / "chroma_db"
 
@@ -116,14 +118,9 @@ def step_3_verify_setup():
             print("[!] ChromaDB not found. Ingestion may have failed.")
             return False
 
-        embedding_function = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
-        vectorstore = Chroma(
-            persist_directory=str(chroma_path),
-            embedding_function=embedding_function
-        )
-
-        count = vectorstore._collection.count()
-        print(f"[+] ChromaDB Status: {count} vectors stored")
+        collections = LocalCollections(chroma_path, chroma_path.parent)
+        count = collections.counts().get(ICD10_COLLECTION, 0)
+        print(f"[+] ChromaDB Status: {count} vectors stored in '{ICD10_COLLECTION}'")
 
         if count > 0:
             print("[+] Step 3 Complete: Setup verified successfully!")
@@ -0,0 +1,37 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+from answer_cache import SemanticAnswerCache
+from context_packing import pack_context
+from llm_providers import FakeLLMProvider, LimitedLLM
+
+
+def _fake_pipeline(monkeypatch):
+    async def embed(question, timer):
+        return [1.0, 0.0]
+
+    async def retrieve(vector, question, timer, requested=None):
+        return [], pack_context([]), ["uploads"]
+
+    monkeypatch.setattr(main, "_embed_question", embed)
+    monkeypatch.setattr(main, "_retrieve_context_async", retrieve)
+    monkeypatch.setattr(main, "_lookup_codes", lambda question: ([], None))
+    monkeypatch.setattr(main, "llm", LimitedLLM(FakeLLMProvider(latency_ms=0, token_delay_ms=0)))
+    monkeypatch.setattr(main, "answer_cache", SemanticAnswerCache())
+    monkeypatch.setitem(main.startup_state, "ready", True)
+
+
+def test_stream_caches_the_same_payload_as_query(monkeypatch):
+    _fake_pipeline(monkeypatch)
+    client = TestClient(main.app)
+
+    miss = client.post("/query/", json={"question": "status report"}).json()
+    main.answer_cache.invalidate()
+    frames = client.post("/query/stream", json={"question": "status report"}).text.splitlines()
+    assert json.loads(frames[-1])["event"] == "g2"
+    hit = client.post("/query/", json={"question": "status report"}).json()
+
+    assert hit["cached"] is True
+    assert {**hit, "cached": False} == miss
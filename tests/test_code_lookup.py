@@ -0,0 +1,32 @@
+import main
+from answer_cache import SemanticAnswerCache
+from icd10_index import ICD10CodeIndex
+
+
+def _use_index(monkeypatch):
+    index = ICD10CodeIndex([("E119", "Type 2 diabetes mellitus without complications")])
+    monkeypatch.setattr(main, "code_index", index)
+
+
+def test_code_shaped_words_are_not_code_lookups(monkeypatch):
+    _use_index(monkeypatch)
+    assert main._lookup_codes("what is my a1c target") == ([], None)
+
+
+def test_code_shaped_words_still_use_the_answer_cache(monkeypatch):
+    _use_index(monkeypatch)
+    cache = SemanticAnswerCache()
+    cache.store([1.0, 0.0], {"full_answer": "UNDER 7 PERCENT"}, cache.version)
+    monkeypatch.setattr(main, "answer_cache", cache)
+
+    _, code_lookup = main._lookup_codes("what is my a1c target")
+    cached = main._cache_stage([1.0, 0.0], code_lookup)
+    assert cached == {"full_answer": "UNDER 7 PERCENT", "cached": True}
+
+
+def test_real_codes_resolve_and_bypass_the_cache(monkeypatch):
+    _use_index(monkeypatch)
+    entries, code_lookup = main._lookup_codes("is E11.9 related to my a1c")
+    assert entries == [("E11.9", "Type 2 diabetes mellitus without complications")]
+    assert len(code_lookup["entries"]) == 1
+    assert main._cache_stage([1.0, 0.0], code_lookup) is None
@@ -0,0 +1,24 @@
+import json
+
+import ingest_docs
+from named_collections import LEGACY_COLLECTION, LocalCollections
+
+
+def test_legacy_manifest_chunks_leave_the_legacy_collection(tmp_path, monkeypatch):
+    collections = LocalCollections(tmp_path / "chroma_db", tmp_path)
+    collections.collection(LEGACY_COLLECTION, create=True).add(
+        ids=["notes.txt:0", "notes.txt:1", "upload-1"],
+        embeddings=[[1.0, 0.0]] * 3,
+        documents=["first", "second", "uploaded"],
+    )
+    legacy_manifest = tmp_path / "ingest_manifest.json"
+    legacy_manifest.write_text(json.dumps({
+        "notes.txt": {"size": 1, "mtime": 1.0, "hash": "ab", "chunk_ids": ["notes.txt:0", "notes.txt:1"]},
+    }))
+    monkeypatch.setattr(ingest_docs, "LEGACY_MANIFEST_PATH", str(legacy_manifest))
+
+    assert ingest_docs.migrate_legacy_manifest(collections) == 2
+    assert collections.collection(LEGACY_COLLECTION).get(include=[])["ids"] == ["upload-1"]
+    assert not legacy_manifest.exists()
+    # Nothing left to migrate on the next run.
+    assert ingest_docs.migrate_legacy_manifest(collections) == 0
@@ -0,0 +1,19 @@
+import threading
+
+from ingest_jobs import IngestJob, IngestJobQueue, SharedJobTable
+
+
+def test_any_worker_reports_a_job_through_the_shared_table():
+    shared = SharedJobTable()
+    release = threading.Event()
+    accepting = IngestJobQueue(lambda job: release.wait(5), shared=shared)
+    other = IngestJobQueue(lambda job: None, shared=shared)
+
+    job = accepting.submit(IngestJob(filename="notes.txt"))
+    assert other.get(job.id).status in ("queued", "running")
+
+    release.set()
+    accepting._executor.shutdown(wait=True)
+    assert other.get(job.id).status == "done"
+    assert [j.id for j in other.list()] == [job.id]
+    assert other.get("missing") is None
@@ -0,0 +1,39 @@
+import asyncio
+
+from llm_providers import LLMProvider, LLMResponse, LimitedLLM
+
+
+class _TrackingProvider(LLMProvider):
+    """Streams the prompt word by word and counts streams not yet closed."""
+
+    name = "tracking"
+
+    def __init__(self):
+        self.open_streams = 0
+
+    async def generate(self, prompt: str) -> LLMResponse:
+        return LLMResponse(prompt)
+
+    async def stream(self, prompt: str):
+        self.open_streams += 1
+        try:
+            for word in prompt.split():
+                yield LLMResponse(word)
+                await asyncio.sleep(0)
+        finally:
+            self.open_streams -= 1
+
+
+def test_stream_closes_upstream_when_consumer_stops_early():
+    provider = _TrackingProvider()
+    llm = LimitedLLM(provider, backoff=0)
+
+    async def consume_one():
+        stream = llm.stream("one two three")
+        first = await stream.__anext__()
+        await stream.aclose()
+        # Checked before yielding to the loop, which would finalize a leaked stream itself.
+        return first, provider.open_streams
+
+    assert asyncio.run(consume_one()) == ("one", 0)
+    assert llm.stats()["running"] == 0
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from named_collections import CollectionRouter, LocalCollections, centroid_path
+
+
+def _add(collections, name, ids, vector):
+    collections.collection(name, create=True).add(
+        ids=ids,
+        embeddings=[vector] * len(ids),
+        documents=[f"doc {id_}" for id_ in ids],
+    )
+
+
+def test_cached_collection_follows_a_drop_and_recreate(tmp_path):
+    server = LocalCollections(tmp_path / "chroma_db", tmp_path)
+    other = LocalCollections(tmp_path / "chroma_db", tmp_path)
+    _add(server, "icd10", ["old"], [1.0, 0.0])
+    assert server.collection("icd10").count() == 1
+
+    # Another process rebuilds the collection under the same name.
+    other.drop("icd10")
+    _add(other, "icd10", ["new-1", "new-2"], [0.0, 1.0])
+
+    assert server.collection("icd10").count() == 2
+    result = server.collection("icd10").query(query_embeddings=[[0.0, 1.0]], n_results=1)
+    assert result["ids"][0][0].startswith("new")
+
+
+def test_cached_collection_dropped_for_good_raises_key_error(tmp_path):
+    server = LocalCollections(tmp_path / "chroma_db", tmp_path)
+    other = LocalCollections(tmp_path / "chroma_db", tmp_path)
+    _add(server, "icd10", ["old"], [1.0, 0.0])
+    server.collection("icd10").count()
+
+    other.drop("icd10")
+
+    with pytest.raises(KeyError):
+        server.collection("icd10").count()
+
+
+def test_routers_in_different_processes_keep_each_others_centroids(tmp_path):
+    backend = CollectionRouter(tmp_path)
+    script = CollectionRouter(tmp_path)  # Loaded before the backend saves anything.
+
+    backend.observe("icd10", [[1.0, 0.0]])
+    backend.save("icd10")
+    script.observe("uploads", [[0.0, 1.0]])
+    script.save("uploads")
+    script.observe("icd10", [[1.0, 0.0]])
+    script.save("icd10")
+
+    fresh = CollectionRouter(tmp_path)
+    assert sorted(fresh.scores([1.0, 0.0])) == ["icd10", "uploads"]
+    assert sorted(backend.scores([1.0, 0.0])) == ["icd10", "uploads"]
+    assert json.loads(centroid_path("icd10", tmp_path).read_text())["count"] == 2